@@ -1,205 +1,348 @@
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
 
 from constants import DATA_PATH
+from downloads import get_file, load_validators, save_validators
+from tracing import stage
+
+REPORT_URL = "https://reports-public.ieso.ca/public/GenOutputCapabilityMonth/PUB_GenOutputCapabilityMonth_{month}.csv"
+# ETag / Last-Modified of the downloaded reports, per url
+VALIDATORS_FILE = "ieso_reports.json"
+# Minimum score to fill a missing location from a fuzzy name match
+AUTO_MATCH_SCORE = 0.9
+# Manual corrections of the generator locations, versioned with the code
+OVERRIDES_FILE = Path(__file__).with_name("location_overrides.csv")
+OVERRIDE_COLS = ["Latitude", "Longitude", "IESO Region"]
+
+def month_range(start: str, end: str):
+    """Months from start to end included, as YYYYMM strings"""
+    year, month = int(start[:4]), int(start[4:])
+    months = []
+    while f"{year:04d}{month:02d}" <= end:
+        months.append(f"{year:04d}{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+def report_path(dest_dir: Path, month: str):
+    """Local file of a monthly report: capacity_MMYYYY.txt"""
+    return dest_dir / f"capacity_{month[4:]}{month[:4]}.txt"
+
+@stage("fetch reports")
+def fetch_reports(start: str, end: str, dest_dir: Path = DATA_PATH, max_workers: int = 4, base_url: str = REPORT_URL):
+    """
+    Download the monthly capability reports from start to end (YYYYMM) concurrently
+    over a pool of max_workers connections. Unchanged reports are skipped using the
+    validators saved in dest_dir.
+    Returns {month: path} of the reports available on disk
+    """
+    validators_path = dest_dir / VALIDATORS_FILE
+    validators = load_validators(validators_path)
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    def fetch(month):
+        url = base_url.format(month=month)
+        try:
+            return month, url, get_file(url, report_path(dest_dir, month), session, validators.get(url))
+        except requests.RequestException as e:
+            # One failed month does not stop the others
+            print(f"Failed to download {url}: {e}")
+            return month, url, None
+
+    with session, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(fetch, month_range(start, end)))
+
+    for _, url, file_validators in results:
+        if file_validators:
+            validators[url] = file_validators
+    save_validators(validators, validators_path)
+
+    return {month: report_path(dest_dir, month) for month, _, file_validators in results if file_validators}
+
+# Measurements giving the capacity of a generator
+CAPA_MEASUREMENTS = ['Available Capacity', 'Capability']
+CAPA_KEYS = ['Generator', 'Fuel Type']
 
-def get_file(url: str, name:str):
+def capa_dtypes(file_name):
+    """Compact dtypes of a capability report: categoricals for labels, float32 for hours"""
+    columns = pd.read_csv(file_name, skiprows=3, index_col=False, nrows=0).columns
+    hour_cols = [col for col in columns if col.startswith('Hour')]
+    dtypes = {'Generator': 'category', 'Fuel Type': 'category', 'Measurement': 'category'}
+    dtypes.update({col: 'float32' for col in hour_cols})
+    return dtypes
+
+def parser_capa(file_name: str, chunksize: int = None):
     """
-    Retrieve data from url
+    Parse generation data, only the label and hour columns with compact dtypes.
+    With chunksize, returns an iterator of DataFrames
     """
-    response = requests.get(url)
-    if response.status_code == 200:
-        with open(name, "wb") as f:
-            f.write(response.content)
-        print(f"{url} file downloaded successfully")
-    else:
-        print(f'Failed to downlaod file. Status code: {response.status_code}')
+    dtypes = capa_dtypes(file_name)
+    return pd.read_csv(file_name, skiprows=3, index_col=False, usecols=list(dtypes),
+                       dtype=dtypes, chunksize=chunksize)
 
-def parser_capa(file_name: str):
+def reduce_capacity(df: pd.DataFrame):
     """
-    Parse generation data
+    Max capacity per (Generator, Fuel Type) of a capability report or chunk of it
     """
-    return pd.read_csv(file_name, skiprows =3, index_col=False)
+    output_df = df[df['Measurement'].isin(CAPA_MEASUREMENTS)]
+
+    hour_cols = [col for col in output_df.columns if col.startswith('Hour')]
+    # fmax ignores missing hours, like DataFrame.max
+    total_capa = np.fmax.reduce(output_df[hour_cols].to_numpy(dtype=np.float32), axis=1)
+
+    output_df = output_df[CAPA_KEYS].assign(**{'Total Capa': total_capa})
+    return output_df.groupby(CAPA_KEYS, observed=True)['Total Capa'].max()
 
 def format_capacity(df: pd.DataFrame):
     """
     Format the capacity data to return the max capacity per plant
     """
-    output_df = df[(df['Measurement'] == 'Available Capacity')| (df['Measurement'] == 'Capability')].copy()
+    return _to_frame(reduce_capacity(df))
 
+@stage("parse capacities")
+def capacity_from_files(file_names, chunksize: int = 100_000):
+    """
+    Max capacity per plant over one or many reports, read in chunks.
+    Each chunk is reduced to per generator maxima and the partial results are merged,
+    so memory depends on the chunk size and the number of generators only.
+    """
+    partials = []
+    for file_name in file_names:
+        for chunk in parser_capa(file_name, chunksize=chunksize):
+            partials.append(reduce_capacity(chunk))
+            # Merge as we go to keep a single partial per generator
+            if len(partials) > 16:
+                partials = [pd.concat(partials).groupby(level=CAPA_KEYS).max()]
 
-    hour_cols = [col for col in output_df.columns if col.startswith('Hour')]
-    output_df['Total Capa'] = output_df[hour_cols].max(axis=1).astype(float)
+    if not partials:
+        return pd.DataFrame(columns=CAPA_KEYS + ['Total Capa'])
+    return _to_frame(pd.concat(partials).groupby(level=CAPA_KEYS).max())
 
-    total_gen = output_df.groupby(['Generator', 'Fuel Type'])['Total Capa'].max().reset_index()
+def _to_frame(total_gen: pd.Series):
+    """
+    Generator, Fuel Type as strings and Total Capa as float64 columns.
+    Hours are parsed as float32, the shortest repr of a float32 maximum is the value
+    of the report, so Total Capa is the float64 of that decimal, as with a float64 parse
+    """
+    total_gen = total_gen.astype(np.float32).astype(str).astype(float).reset_index()
+    for key in CAPA_KEYS:
+        total_gen[key] = total_gen[key].astype(str)
     return total_gen
 
 
+def load_location_overrides(path: Path = OVERRIDES_FILE):
+    """
+    Load location corrections: one row per Generator, Match is 'exact' or 'contains'
+    (case insensitive substring), empty cells leave the value untouched
+    """
+    overrides = pd.read_csv(path, dtype={"Generator": str, "Match": str, "IESO Region": str})
+    overrides["Generator"] = overrides["Generator"].str.upper()
+
+    exact = overrides.loc[overrides["Match"] == "exact", "Generator"]
+    duplicated = sorted(exact[exact.duplicated()].unique())
+    if duplicated:
+        raise ValueError(f"{Path(path).name}: exact overrides listed more than once: {duplicated}")
+    return overrides
+
+def apply_location_overrides(df: pd.DataFrame, overrides: pd.DataFrame):
+    """
+    Patch Latitude, Longitude and IESO Region of df with the overrides, exact names
+    through a single indexed join, overrides take precedence over df values.
+    Returns (patched df, list of the overrides that matched)
+    """
+    exact = overrides[overrides["Match"] == "exact"].set_index("Generator")[OVERRIDE_COLS]
+    patch = df[["Generator"]].join(exact, on="Generator")[OVERRIDE_COLS]
+    matched = list(exact.index.intersection(df["Generator"]))
+
+    for _, rule in overrides[overrides["Match"] == "contains"].iterrows():
+        mask = df["Generator"].str.contains(rule["Generator"], case=False, regex=False, na=False)
+        if mask.any():
+            matched.append(rule["Generator"])
+        for col in OVERRIDE_COLS:
+            if pd.notna(rule[col]):
+                patch.loc[mask & patch[col].isna(), col] = rule[col]
+
+    df = df.copy()
+    df[OVERRIDE_COLS] = patch.combine_first(df[OVERRIDE_COLS])[OVERRIDE_COLS]
+    return df, matched
+
 def clean_generator_name(name):
     name = str(name).upper().strip()
     name = name.replace("-", "").replace("_", "").replace(".", "")
     return name
 
+def generator_key(name):
+    """Normalized lookup key: cleaned name without spaces"""
+    return clean_generator_name(name).replace(" ", "")
+
+def plant_key(name):
+    """Key of the plant of a unit, IESO unit names are PLANT-UNIT (PICKERINGB-G5)"""
+    return generator_key(str(name).split("-")[0])
+
+class GeneratorMatcher:
+    """
+    Resolve IESO generator names to the plants of the location workbook.
+    A hash index on normalized keys gives exact and prefix hits, a trigram inverted
+    index gives scored fuzzy candidates without comparing every name.
+    """
+
+    def __init__(self, names, prefix_len=4):
+        self.prefix_len = prefix_len
+        self.names = {}  # key -> first workbook name
+        for name in names:
+            if pd.notna(name):
+                self.names.setdefault(generator_key(name), name)
+
+        self.keys = list(self.names)
+        self.sorted_keys = sorted(self.keys)
+        self.exact = {key: i for i, key in enumerate(self.keys)}
+        self.key_ngrams = [self.ngrams(key) for key in self.keys]
+        self.ngram_index = defaultdict(list)
+        for i, ngrams in enumerate(self.key_ngrams):
+            for ngram in ngrams:
+                self.ngram_index[ngram].append(i)
+        # Trigrams shared by too many names (WIND, SOLAR...) do not select candidates
+        self.max_posting = max(100, len(self.keys) // 20)
+
+    @staticmethod
+    def ngrams(key, n=3):
+        padded = f" {key} "
+        return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+    def _prefix_candidates(self, query, max_candidates):
+        """Keys that are a prefix of query, or that query is a prefix of"""
+        for end in range(self.prefix_len, len(query)):
+            if query[:end] in self.exact:
+                yield self.exact[query[:end]]
+        start = bisect_left(self.sorted_keys, query)
+        for key in self.sorted_keys[start:start + max_candidates]:
+            if not key.startswith(query):
+                break
+            yield self.exact[key]
 
+    def match(self, name, limit=3, min_score=0.5, max_candidates=50):
+        """Best workbook names for name as [(workbook name, score)], score 1.0 for an exact key"""
+        key, base = generator_key(name), plant_key(name)
+        if key in self.exact:
+            return [(self.names[key], 1.0)]
+        if base in self.exact:
+            return [(self.names[base], 0.95)]
 
+        scores = {}
+        for query in {key, base}:
+            if not query:
+                continue
+            query_ngrams = self.ngrams(query)
+            shared = Counter(
+                i
+                for ngram in query_ngrams
+                if len(self.ngram_index.get(ngram, ())) <= self.max_posting
+                for i in self.ngram_index.get(ngram, ())
+            )
+            for i, _ in shared.most_common(max_candidates):
+                # Dice coefficient on trigrams, small bonus for a shared prefix
+                common = len(query_ngrams & self.key_ngrams[i])
+                dice = 2 * common / (len(query_ngrams) + len(self.key_ngrams[i]))
+                same_prefix = self.keys[i][:self.prefix_len] == query[:self.prefix_len]
+                score = min(0.9, 0.85 * dice + (0.05 if same_prefix else 0))
+                scores[i] = max(scores.get(i, 0), score)
+
+            # One name extends the other (PICKERINGB / PICKERING)
+            for i in self._prefix_candidates(query, max_candidates):
+                short, long = sorted((query, self.keys[i]), key=len)
+                scores[i] = max(scores.get(i, 0), 0.8 + 0.15 * len(short) / len(long))
+
+        best = sorted(scores.items(), key=lambda item: -item[1])[:limit]
+        return [(self.names[self.keys[i]], round(score, 3)) for i, score in best if score >= min_score]
+
+    def match_many(self, names, limit=1, min_score=0.5):
+        """DataFrame of Generator, Candidate, Score for every name with a candidate"""
+        rows = [
+            (name, candidate, score)
+            for name in names
+            for candidate, score in self.match(name, limit=limit, min_score=min_score)
+        ]
+        return pd.DataFrame(rows, columns=["Generator", "Candidate", "Score"])
+
+@stage("fuzzy locations")
+def fill_fuzzy_locations(df: pd.DataFrame, df_location: pd.DataFrame, min_score: float = AUTO_MATCH_SCORE):
+    """
+    Fill missing locations of df from the best fuzzy match in df_location with the same fuel
+    type. Only rows without any location are filled, each location comes from a single plant.
+    Returns (filled df, DataFrame of Generator, Fuel Type, Candidate, Score for the missing generators)
+    """
+    missing = df[df["Latitude"].isna() | df["IESO Region"].isna()]
+    matches = [
+        GeneratorMatcher(df_location.loc[df_location["Fuel Type"] == fuel, "Generator"])
+        .match_many(names.unique())
+        .assign(**{"Fuel Type": fuel})
+        for fuel, names in missing.groupby("Fuel Type")["Generator"]
+    ]
+    columns = ["Generator", "Fuel Type", "Candidate", "Score"]
+    matches = pd.concat(matches, ignore_index=True)[columns] if matches else pd.DataFrame(columns=columns)
+    accepted = matches[matches["Score"] >= min_score].set_index(CAPA_KEYS)["Candidate"]
+
+    locations = df_location.drop_duplicates(CAPA_KEYS).set_index(CAPA_KEYS)[OVERRIDE_COLS]
+    patch = (
+        df[CAPA_KEYS].join(accepted, on=CAPA_KEYS)
+        .join(locations, on=["Candidate", "Fuel Type"])[OVERRIDE_COLS]
+    )
+
+    # Only rows without any location, partial ones would mix two plants
+    patch = patch[df[OVERRIDE_COLS].isna().all(axis=1)]
+
+    df = df.copy()
+    df[OVERRIDE_COLS] = df[OVERRIDE_COLS].combine_first(patch)
+    return df, matches
 
 if __name__ == "__main__":
 
-    url = "https://reports-public.ieso.ca/public/GenOutputCapabilityMonth/PUB_GenOutputCapabilityMonth_202510.csv"
-    name = DATA_PATH / "capacity_102025.txt"
+    month = "202510"
+    reports = fetch_reports(month, month)
+    if month not in reports:
+        raise SystemExit(f"Capability report of {month} could not be downloaded")
 
-    get_file(url,name)
-    df = parser_capa(name)
-    df_capacities = format_capacity(df)
+    df_capacities = capacity_from_files([reports[month]])
 
     df_location = pd.read_excel(DATA_PATH / "source_ontario_thesis.xlsx")
     df_location["Generator"]=df_location["Generators"].str.upper()
     df_location.drop('Generators', axis=1, inplace=True)
 
     df_location["Fuel Type"] = df_location["Fuel Type"].str.upper()
-    # Darlington nuclear power plant is in Toronto region 
-    df_location.loc[df_location["Generator"].str.contains("DARLINGTON", case=False, na=False), "IESO Region"] = "Toronto"
 
     df_join = df_capacities.merge(df_location, on = ["Generator", "Fuel Type"], how="left")
 
     missing_locations = df_join[df_join["Latitude"].isna() | df_join["IESO Region"].isna()]["Generator"].unique()
 
-    print(f"Missing power plant locations {len(missing_locations)} before manual correction  (manual_coords) :")
+    print(f"Missing power plant locations {len(missing_locations)} before manual correction ({OVERRIDES_FILE.name}) :")
     print(missing_locations)
-    manual_coords = {
-    "CRYSLER": {
-        "Latitude": 45.219677,
-        "Longitude": -75.153938,
-        "IESO Region": "East"
-    },
-    "MCLEANSMTNWF-LT.AG_T1": {
-        "Latitude": 45.935435,
-        "Longitude": -81.986758,
-        "IESO Region": "North"
-    },
-    "RAILBEDWF-LT.AG_SR": {
-        "Latitude": 42.401718,
-        "Longitude": -82.154912,
-        "IESO Region": "West"
-    },
-    "ROMNEY": {
-        "Latitude": 42.411972,
-        "Longitude": -82.162000,
-        "IESO Region": "West"
-    },
-    "SANDUSK-LT.AG_T1": {
-        "Latitude": 42.799120,
-        "Longitude": -80.194123,
-        "IESO Region": "West"
-    },
-    "COCHRANECGS": {
-        "Latitude": 43.85,
-        "Longitude": -79.45,
-        "IESO Region": "Toronto"
-    },
-    "GOREWAY BESS": {
-        "Latitude": 43.75,
-        "Longitude": -79.60,
-        "IESO Region": "Toronto"
-    },
-    "HAGERSVILLE BESS": {
-        "Latitude": 43.15,
-        "Longitude": -79.90,
-        "IESO Region": "Niagara"
-    },
-    "HALTONHILLS-LT.G1": {
-        "Latitude": 43.65,
-        "Longitude": -79.95,
-        "IESO Region": "Toronto"
-    },
-    "HALTONHILLS-LT.G2": {
-        "Latitude": 43.65,
-        "Longitude": -79.95,
-        "IESO Region": "Toronto"
-    },
-    "HALTONHILLS-LT.G3": {
-        "Latitude": 43.65,
-        "Longitude": -79.95,
-        "IESO Region": "Toronto"
-    },
-    "HYDROGEN READY POWER PLANT (HRPP)": {
-        "Latitude": 43.85,
-        "Longitude": -79.35,
-        "IESO Region": "Toronto"
-    },
-    "NAPANEE-G3": {
-        "Latitude": 44.25,
-        "Longitude": -76.95,
-        "IESO Region": "East"
-    },
-    "ONEIDA ENERGY STORAGE": {
-        "Latitude": 42.85,
-        "Longitude": -80.25,
-        "IESO Region": "West"
-    },
-    "PICKERINGA-G1": {
-        "Latitude": 43.82,
-        "Longitude": -79.07,
-        "IESO Region": "Toronto"
-    },
-    "PICKERINGA-G4": {
-        "Latitude": 43.82,
-        "Longitude": -79.07,
-        "IESO Region": "Toronto"
-    },
-    "PICKERINGB-G5": {
-        "Latitude": 43.82,
-        "Longitude": -79.07,
-        "IESO Region": "Toronto"
-    },
-    "PICKERINGB-G6": {
-        "Latitude": 43.82,
-        "Longitude": -79.07,
-        "IESO Region": "Toronto"
-    },
-    "PICKERINGB-G7": {
-        "Latitude": 43.82,
-        "Longitude": -79.07,
-        "IESO Region": "Toronto"
-    },
-    "PICKERINGB-G8": {
-        "Latitude": 43.82,
-        "Longitude": -79.07,
-        "IESO Region": "Toronto"
-    },
-    "TBAYBOWATER CTS": {
-        "Latitude": 48.38,
-        "Longitude": -89.25,
-        "IESO Region": "Northwest"
-    },
-    "TILBURY BATTERY STORAGE": {
-        "Latitude": 42.25,
-        "Longitude": -82.43,
-        "IESO Region": "West"
-    },
-    "YORK BESS": {
-        "Latitude": 43.85,
-        "Longitude": -79.50,
-        "IESO Region": "Toronto"
-    }
-}
-    
-    df_join["Latitude"] = df_join.apply(
-    lambda row: manual_coords.get(row["Generator"], {}).get("Latitude", row["Latitude"]),
-    axis=1)
-
-    df_join["Longitude"] = df_join.apply(
-    lambda row: manual_coords.get(row["Generator"], {}).get("Longitude", row["Longitude"]),
-    axis=1)
-
-    df_join["IESO Region"] = df_join.apply(
-    lambda row: manual_coords.get(row["Generator"], {}).get("IESO Region", row["IESO Region"]),
-    axis=1)
-    
+
+    df_join, matches = fill_fuzzy_locations(df_join, df_location)
+    print(f"Fuzzy name matches (filled when score >= {AUTO_MATCH_SCORE}) :")
+    print(matches.to_string(index=False))
+
+    overrides = load_location_overrides()
+    df_join, matched = apply_location_overrides(df_join, overrides)
+    unused = sorted(set(overrides["Generator"]) - set(matched))
+    print(f"Location overrides applied {len(matched)}/{len(overrides)} :", matched)
+    if unused:
+        print(f"Location overrides without match {len(unused)} :", unused)
+
     missing = df_join[df_join["IESO Region"].isna()]["Generator"].unique()
     print(f"Générateurs toujours manquants {len(missing)} :", missing)
     print(df_join)
     df_agg = df_join.groupby(['IESO Region', 'Fuel Type'])['Total Capa'].sum().reset_index()
 
-    df_agg.to_csv(DATA_PATH / "cap_fuel_type.csv")
+    with stage("save capacities", output=DATA_PATH / "cap_fuel_type.csv"):
+        df_agg.to_csv(DATA_PATH / "cap_fuel_type.csv")
 
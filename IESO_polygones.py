@@ -3,64 +3,218 @@ Parse IESO KML and display on Folium map
 """
 
 import json
+from pathlib import Path
 from xml.etree import ElementTree as ET
 
+import numpy as np
+import shapely
+
 from constants import DATA_PATH
+from topology import write_topojson
+from tracing import stage
+
+# KML namespace
+KML_NS = 'http://www.opengis.net/kml/2.2'
+
+def parse_coordinates(coord_text):
+    """Parse a KML coordinates string (lng,lat[,alt] tuples) into a (n, 2) float array"""
+    tuples = coord_text.split()
+    if not tuples:
+        return np.empty((0, 2))
+
+    dims = tuples[0].count(',') + 1
+    values = np.fromstring(coord_text.replace(',', ' '), sep=' ')
+    if dims >= 2 and values.size == dims * len(tuples):
+        return values.reshape(-1, dims)[:, :2].copy()
+
+    # Mixed 2D / 3D tuples
+    return np.array([[float(v) for v in t.split(',')[:2]] for t in tuples if t.count(',') >= 1])
+
+def parse_placemark(pm):
+    """Extract name, description and polygons (list of rings, outer first) of a Placemark"""
+    ns = {'kml': KML_NS}
+
+    # Get zone name
+    name_elem = pm.find('.//kml:name', ns)
+    name = name_elem.text if name_elem is not None else "Unknown"
+
+    # Get description
+    desc_elem = pm.find('.//kml:description', ns)
+    desc = desc_elem.text if desc_elem is not None else ""
+
+    # Get every Polygon, including MultiGeometry parts, with their inner rings
+    polygons = []
+    for polygon in pm.iter(f'{{{KML_NS}}}Polygon'):
+        outer = polygon.find('kml:outerBoundaryIs/kml:LinearRing/kml:coordinates', ns)
+        if outer is None or not outer.text:
+            continue
+        inners = polygon.findall('kml:innerBoundaryIs/kml:LinearRing/kml:coordinates', ns)
+        rings = [parse_coordinates(outer.text)]
+        rings += [parse_coordinates(inner.text) for inner in inners if inner.text]
+        polygons.append(rings)
+
+    return {
+        'name': name,
+        'description': desc or "",
+        'polygons': polygons
+    }
+
+def iter_placemarks(kml_file):
+    """
+    Stream the Placemarks of a KML file, each element is freed once parsed
+    """
+    placemark_tag = f'{{{KML_NS}}}Placemark'
+    parents = []
+
+    for event, elem in ET.iterparse(kml_file, events=('start', 'end')):
+        if event == 'start':
+            parents.append(elem)
+            continue
+
+        parents.pop()
+        if elem.tag == placemark_tag:
+            yield parse_placemark(elem)
+            # Drop the parsed Placemark from the tree
+            if parents:
+                parents[-1].remove(elem)
+            elem.clear()
+
+def count_points(zone):
+    """Total number of vertices of a zone"""
+    return sum(len(ring) for polygon in zone['polygons'] for ring in polygon)
+
+def compute_label_points(zones):
+    """
+    Area-weighted centroids of all zones in one vectorized shoelace pass.
+    Centroids falling outside their zone (concave shapes) are replaced by an interior point.
+    Returns a (n_zones, 2) array of [lng, lat]
+    """
+    rings, ring_zone, ring_sign = [], [], []
+    for zone_idx, zone in enumerate(zones):
+        for polygon in zone['polygons']:
+            for ring_idx, ring in enumerate(polygon):
+                rings.append(ring)
+                ring_zone.append(zone_idx)
+                # Outer rings add area, holes remove it
+                ring_sign.append(1.0 if ring_idx == 0 else -1.0)
+
+    labels = np.full((len(zones), 2), np.nan)
+    if not rings:
+        return labels
+
+    counts = np.array([len(ring) for ring in rings])
+    ring_zone = np.array(ring_zone)
+    vertex_ring = np.repeat(np.arange(len(rings)), counts)
+    coords = np.concatenate(rings)
+
+    # Work relative to the first vertex of each zone to limit float cancellation
+    zone_start = np.unique(ring_zone[vertex_ring], return_index=True)
+    origin = np.zeros((len(zones), 2))
+    origin[zone_start[0]] = coords[zone_start[1]]
+    xy = coords - origin[ring_zone[vertex_ring]]
+
+    # Next vertex in the same ring, wrapping around
+    ring_first = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    next_idx = np.arange(len(xy)) + 1
+    ring_last = ring_first + counts - 1
+    next_idx[ring_last] = ring_first
+
+    x0, y0 = xy[:, 0], xy[:, 1]
+    x1, y1 = xy[next_idx, 0], xy[next_idx, 1]
+    cross = x0 * y1 - x1 * y0
+
+    area = np.bincount(vertex_ring, weights=cross, minlength=len(rings)) / 2
+    moment_x = np.bincount(vertex_ring, weights=(x0 + x1) * cross, minlength=len(rings)) / 6
+    moment_y = np.bincount(vertex_ring, weights=(y0 + y1) * cross, minlength=len(rings)) / 6
+
+    # Orientation independent: |area| for outer rings, -|area| for holes
+    factor = np.array(ring_sign) * np.sign(area)
+    zone_area = np.bincount(ring_zone, weights=factor * area, minlength=len(zones))
+    zone_mx = np.bincount(ring_zone, weights=factor * moment_x, minlength=len(zones))
+    zone_my = np.bincount(ring_zone, weights=factor * moment_y, minlength=len(zones))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        labels = np.column_stack([zone_mx / zone_area, zone_my / zone_area]) + origin
+
+    # Guaranteed interior point when the centroid is outside the zone
+    geoms = np.array([
+        shapely.MultiPolygon([(polygon[0], polygon[1:]) for polygon in zone['polygons']])
+        for zone in zones
+    ])
+    outside = ~shapely.contains_xy(geoms, labels[:, 0], labels[:, 1])
+    if outside.any():
+        labels[outside] = shapely.get_coordinates(shapely.point_on_surface(geoms[outside]))
 
+    return labels
+
+def cached_label_points(zones, source):
+    """
+    Label points of the zones parsed from source, kept in the artifact store with the
+    zone names and only computed again when source changes
+    """
+    import pandas as pd
+
+    from artifacts import cached_artifact
+
+    def build():
+        labels = compute_label_points(zones)
+        return pd.DataFrame({
+            'name': [zone['name'] for zone in zones],
+            'label_lng': labels[:, 0],
+            'label_lat': labels[:, 1],
+        })
+
+    table = cached_artifact(f"{Path(source).stem}_labels", [source], build)
+    if table['name'].tolist() != [zone['name'] for zone in zones]:
+        # Not the zones of source, do not trust the cache
+        return compute_label_points(zones)
+    return table[['label_lng', 'label_lat']].to_numpy()
+
+@stage("label points")
+def add_label_points(zones, source=None):
+    """
+    Store a label point [lng, lat] in every zone that does not have one yet.
+    source: file the zones were parsed from, the labels are then cached with it
+    """
+    missing = [i for i, zone in enumerate(zones) if 'label' not in zone]
+    if not missing:
+        return zones
+    if source is None:
+        labels = compute_label_points([zones[i] for i in missing])
+    else:
+        labels = cached_label_points(zones, source)[missing]
+    for i, label in zip(missing, labels):
+        zones[i]['label'] = label.tolist()
+    return zones
+
+@stage("parse kml")
 def parse_kml(kml_file):
     """Parse KML and extract polygons"""
     
     print(f"Parsing: {kml_file}")
     
-    tree = ET.parse(kml_file)
-    root = tree.getroot()
-    
-    # KML namespace
-    ns = {'kml': 'http://www.opengis.net/kml/2.2'}
-    
-    # Find all placemarks
-    placemarks = root.findall('.//kml:Placemark', ns)
-    
-    print(f"Found {len(placemarks)} zones")
-    
     zones = []
+    for zone in iter_placemarks(kml_file):
+        if not zone['polygons']:
+            continue
+        zones.append(zone)
+        print(f"  {zone['name']}: {len(zone['polygons'])} polygons, {count_points(zone)} points")
     
-    for pm in placemarks:
-        # Get zone name
-        name_elem = pm.find('.//kml:name', ns)
-        name = name_elem.text if name_elem is not None else "Unknown"
-        
-        # Get description
-        desc_elem = pm.find('.//kml:description', ns)
-        desc = desc_elem.text if desc_elem is not None else ""
-        
-        # Get coordinates
-        coords_elem = pm.find('.//kml:coordinates', ns)
-        
-        if coords_elem is not None:
-            coord_text = coords_elem.text.strip()
-            
-            # Parse coordinates (format: lng,lat,alt)
-            points = []
-            for coord in coord_text.split():
-                parts = coord.split(',')
-                if len(parts) >= 2:
-                    lng = float(parts[0])
-                    lat = float(parts[1])
-                    points.append([lng, lat])
-            
-            zones.append({
-                'name': name,
-                'description': desc,
-                'coordinates': points
-            })
-            
-            print(f"  {name}: {len(points)} points")
+    print(f"Found {len(zones)} zones")
     
     return zones
 
-def zones_to_geojson(zones):
-    """Convert zones to GeoJSON"""
+def close_ring(ring, precision=None):
+    """Return the ring as a [lng, lat] list, closed if needed, rounded to precision decimals"""
+    if precision is not None:
+        ring = np.round(ring, precision)
+    coords = ring.tolist()
+    if coords and coords[0] != coords[-1]:
+        coords.append(coords[0])
+    return coords
+
+def zones_to_geojson(zones, precision=None):
+    """Convert zones to GeoJSON, coordinates rounded to precision decimals if given"""
     
     geojson = {
         "type": "FeatureCollection",
@@ -68,39 +222,58 @@ def zones_to_geojson(zones):
     }
     
     for zone in zones:
-        # Close polygon if needed
-        coords = zone['coordinates']
-        if coords[0] != coords[-1]:
-            coords.append(coords[0])
+        # Close rings if needed
+        polygons = [[close_ring(ring, precision) for ring in polygon] for polygon in zone['polygons']]
+        
+        if len(polygons) == 1:
+            geometry = {"type": "Polygon", "coordinates": polygons[0]}
+        else:
+            geometry = {"type": "MultiPolygon", "coordinates": polygons}
         
         feature = {
             "type": "Feature",
             "properties": {
                 "name": zone['name'],
                 "description": zone['description'],
-                "num_points": len(coords)
+                "num_points": sum(len(ring) for polygon in polygons for ring in polygon)
             },
-            "geometry": {
-                "type": "Polygon",
-                "coordinates": [coords]
-            }
+            "geometry": geometry
         }
+        if 'label' in zone:
+            feature['properties']['label_lng'], feature['properties']['label_lat'] = zone['label']
         
         geojson['features'].append(feature)
     
     return geojson
 
+def write_zones(zones, path, export_format='geojson'):
+    """
+    Save zones as:
+    - 'geojson': indented GeoJSON, full precision
+    - 'compact': minified GeoJSON, 6 decimals (~0.1 m)
+    - 'topojson': quantized TopoJSON, shared borders stored once
+    """
+    if export_format == 'topojson':
+        topology = write_topojson(zones_to_geojson(zones), path, object_name='zones')
+        return len(topology['objects']['zones']['geometries'])
+
+    if export_format == 'compact':
+        geojson = zones_to_geojson(zones, precision=6)
+        with open(path, 'w') as f:
+            json.dump(geojson, f, separators=(',', ':'))
+    elif export_format == 'geojson':
+        geojson = zones_to_geojson(zones)
+        with open(path, 'w') as f:
+            json.dump(geojson, f, indent=2)
+    else:
+        raise ValueError(f"Unknown export format: {export_format}")
+    return len(geojson['features'])
+
+@stage("build map")
 def create_folium_map(zones):
     """Create Folium map with zones"""
     
-    try:
-        import folium
-    except ImportError:
-        print("Installing folium...")
-        import subprocess
-        import sys
-        subprocess.check_call([sys.executable, "-m", "pip", "install", "folium"])
-        import folium
+    import folium
     
     # Center on Ontario
     ontario_center = [45.5, -80.0]
@@ -117,38 +290,38 @@ def create_folium_map(zones):
         '#0BA9CC', '#7CCFA9', '#DB4436', '#F4EB37', '#1B97F8'
     ]
     
+    # Label positions, computed once and kept on the zones
+    add_label_points(zones)
+    
     for idx, zone in enumerate(zones):
         color = colors[idx % len(colors)]
         
-        # Convert coordinates for Folium (needs [lat, lng])
-        folium_coords = [[lat, lng] for lng, lat in zone['coordinates']]
-        
         # Create popup content
         popup_html = f"""
         <b>{zone['name']}</b><br>
         <i>{zone['description'][:100]}...</i><br>
-        Points: {len(zone['coordinates'])}
+        Points: {count_points(zone)}
         """
         
-        # Add polygon
-        folium.Polygon(
-            locations=folium_coords,
-            color=color,
-            weight=2,
-            fill=True,
-            fill_color=color,
-            fill_opacity=0.3,
-            popup=folium.Popup(popup_html, max_width=300),
-            tooltip=zone['name']
-        ).add_to(m)
+        # Add one polygon per part, with its holes
+        for polygon in zone['polygons']:
+            # Convert coordinates for Folium (needs [lat, lng])
+            folium_coords = [ring[:, ::-1].tolist() for ring in polygon]
+            
+            folium.Polygon(
+                locations=folium_coords,
+                color=color,
+                weight=2,
+                fill=True,
+                fill_color=color,
+                fill_opacity=0.3,
+                popup=folium.Popup(popup_html, max_width=300),
+                tooltip=zone['name']
+            ).add_to(m)
         
         # Add zone label at center
-        if len(zone['coordinates']) > 0:
-            # Calculate centroid
-            lats = [lat for lng, lat in zone['coordinates']]
-            lngs = [lng for lng, lat in zone['coordinates']]
-            center_lat = sum(lats) / len(lats)
-            center_lng = sum(lngs) / len(lngs)
+        if zone['polygons']:
+            center_lng, center_lat = zone['label']
             
             folium.Marker(
                 [center_lat, center_lng],
@@ -167,6 +340,7 @@ def main():
     print("="*60)
     
     kml_file = 'doc.kml'
+    export_format = 'geojson'  # 'geojson', 'compact' or 'topojson'
     
     # Parse KML
     zones = parse_kml(DATA_PATH / kml_file)
@@ -175,21 +349,24 @@ def main():
         print("No zones found!")
         return
     
-    # Save as GeoJSON
-    geojson = zones_to_geojson(zones)
+    # Label positions, cached with the parsed KML and saved with the zones
+    add_label_points(zones, source=DATA_PATH / kml_file)
     
-    with open('ieso_zones.geojson', 'w') as f:
-        json.dump(geojson, f, indent=2)
+    # Save as GeoJSON / TopoJSON
+    zones_file = DATA_PATH / ('ieso_zones.topojson' if export_format == 'topojson' else 'ieso_zones.geojson')
+    with stage("write zones", output=zones_file):
+        n_features = write_zones(zones, zones_file, export_format)
     
-    print(f"\n✓ GeoJSON saved: ieso_zones.geojson")
-    print(f"  {len(geojson['features'])} zones")
+    print(f"\n✓ {export_format} saved: {zones_file}")
+    print(f"  {n_features} zones")
     
     # Create Folium map
     print("\nCreating Folium map...")
     m = create_folium_map(zones)
     
     # Save map
-    m.save('ieso_zones_map.html')
+    with stage("save map", output='ieso_zones_map.html'):
+        m.save('ieso_zones_map.html')
     
     print("Map saved: ieso_zones_map.html")
     
@@ -199,7 +376,8 @@ def main():
     print("="*60)
     for zone in zones:
         print(f"\n{zone['name']}:")
-        print(f"  Points: {len(zone['coordinates'])}")
+        print(f"  Polygons: {len(zone['polygons'])}")
+        print(f"  Points: {count_points(zone)}")
         print(f"  Description: {zone['description'][:80]}...")
 
 if __name__ == "__main__":
@@ -0,0 +1,157 @@
+"""
+Parquet store for intermediate datasets, keyed by a content hash of their inputs
+
+Tables are Parquet, GeoDataFrames GeoParquet (WKB geometry, bbox covering column), both
+with column statistics. Reads are memory-mapped and only decode the requested columns,
+geo reads can skip row groups outside a bbox.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from constants import DATA_PATH
+from tracing import stage
+
+ARTIFACT_DIR = DATA_PATH / "artifacts"
+# Small row groups so that their statistics can skip most of a file
+ROW_GROUP_SIZE = 50_000
+
+def file_digest(path, cache):
+    """
+    sha256 of a file, 'missing' if it does not exist.
+    cache maps path to (size, mtime_ns, digest), files are only read again when they changed
+    """
+    path = Path(path)
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return 'missing'
+    key = str(path)
+    cached = cache.get(key)
+    if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+        return cached[2]
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    cache[key] = [stat.st_size, stat.st_mtime_ns, sha.hexdigest()]
+    return cache[key][2]
+
+def load_digests(path):
+    """File digests saved by save_digests, empty if missing or unreadable"""
+    try:
+        return json.loads(Path(path).read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def save_digests(cache, path):
+    """
+    Replace the digests file at once: build tasks run in parallel processes, a reader
+    sees the old or the new file, never a partial one
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    part = path.with_name(f"{path.name}.{os.getpid()}.part")
+    part.write_text(json.dumps(cache))
+    part.replace(path)
+
+def artifact_key(name, inputs=(), params=None, artifact_dir=None):
+    """Hash of the artifact name, the content of the input files and the params"""
+    digests_path = Path(artifact_dir or ARTIFACT_DIR) / "digests.json"
+    cache = load_digests(digests_path)
+    sha = hashlib.sha256(name.encode())
+    for path in inputs:
+        sha.update(f"{Path(path).name}\0{file_digest(path, cache)}\0".encode())
+    sha.update(json.dumps(params, sort_keys=True, default=str).encode())
+
+    save_digests(cache, digests_path)
+    return sha.hexdigest()[:16]
+
+def artifact_path(name, key, artifact_dir=None):
+    return Path(artifact_dir or ARTIFACT_DIR) / f"{name}-{key}.parquet"
+
+def write_artifact(df, name, key, artifact_dir=None):
+    """
+    Write df as the artifact name/key and remove the older versions of name.
+    GeoDataFrames are sorted along a Hilbert curve so that row groups are compact in space
+    """
+    import geopandas as gpd
+
+    path = artifact_path(name, key, artifact_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    part = path.with_suffix(".part")
+    if isinstance(df, gpd.GeoDataFrame):
+        # Missing and empty geometries have no Hilbert distance, they go last
+        valid = np.flatnonzero(~(df.geometry.isna() | df.geometry.is_empty).to_numpy())
+        if len(valid):
+            order = valid[np.argsort(df.geometry.iloc[valid].hilbert_distance().to_numpy(), kind='stable')]
+            df = df.iloc[np.r_[order, np.setdiff1d(np.arange(len(df)), valid)]]
+        df.to_parquet(part, index=False, write_covering_bbox=True, row_group_size=ROW_GROUP_SIZE)
+    else:
+        df.to_parquet(part, index=False, row_group_size=ROW_GROUP_SIZE)
+    part.replace(path)
+
+    for old in path.parent.glob(f"{name}-*.parquet"):
+        if old != path:
+            old.unlink()
+    return path
+
+@stage("read artifact")
+def read_artifact(path, columns=None, bbox=None):
+    """
+    Memory-mapped read of an artifact, only the columns given (plus the geometry).
+    bbox (minx, miny, maxx, maxy) keeps the features whose bounding box intersects it,
+    whole row groups are skipped from their statistics
+    """
+    import geopandas as gpd
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    import pyproj
+    import shapely
+
+    parquet = pq.ParquetFile(path, memory_map=True)
+    geo = json.loads(parquet.schema_arrow.metadata.get(b'geo', b'null'))
+    if geo is None:
+        return pq.read_table(path, columns=columns, memory_map=True).to_pandas()
+
+    geometry_col = geo['primary_column']
+    read_columns = None if columns is None else [*columns, geometry_col]
+    filters = None
+    if bbox is not None:
+        minx, miny, maxx, maxy = bbox
+        filters = (
+            (pc.field('bbox', 'xmin') <= maxx) & (pc.field('bbox', 'xmax') >= minx)
+            & (pc.field('bbox', 'ymin') <= maxy) & (pc.field('bbox', 'ymax') >= miny)
+        )
+    table = pq.read_table(path, columns=read_columns, filters=filters, memory_map=True)
+
+    # WKB decoded straight from the Arrow column, one row group at a time, the attributes
+    # converted while their Arrow buffers are released, so that only one copy is alive at a time
+    chunks = table.column(geometry_col).chunks
+    geometry = np.concatenate(
+        [shapely.from_wkb(chunk.to_numpy(zero_copy_only=False)) for chunk in chunks]
+        or [np.array([], dtype=object)]
+    )
+    table = table.drop_columns([c for c in [geometry_col, 'bbox'] if c in table.column_names])
+    df = table.to_pandas(self_destruct=True, split_blocks=True)
+    del table
+
+    crs = geo['columns'][geometry_col].get('crs', 'OGC:CRS84')
+    return gpd.GeoDataFrame(df, geometry=geometry, crs=pyproj.CRS.from_user_input(crs) if crs else None)
+
+def cached_artifact(name, inputs, build, params=None, columns=None, bbox=None, artifact_dir=None):
+    """
+    The artifact name for these inputs and params, built with build() and written first
+    if it is not in the store
+    """
+    key = artifact_key(name, inputs, params, artifact_dir)
+    path = artifact_path(name, key, artifact_dir)
+    if not path.exists():
+        print(f"Building artifact {name} ({key})")
+        with stage("build artifact", output=path):
+            write_artifact(build(), name, key, artifact_dir)
+    return read_artifact(path, columns=columns, bbox=bbox)
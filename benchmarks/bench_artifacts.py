@@ -0,0 +1,71 @@
+"""
+Benchmark loading rivers from GeoJSON against the Parquet artifact store
+
+Run from the repo root: python -m benchmarks.bench_artifacts
+Writes synthetic river GeoJSON files and loads them with gpd.read_file, then from
+the artifact store (all columns, name only, and name only in a bbox). Each load
+runs in a separate process so that peak RSS is measured per load.
+"""
+
+import tempfile
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+import artifacts
+from benchmarks.common import in_subprocess
+
+LINE_COUNTS = [10_000, 100_000, 500_000]
+VERTICES = 20
+# About a tenth of the synthetic extent
+BBOX = (-74.0, 45.0, -70.0, 48.0)
+
+def synthetic_rivers(n, seed=0):
+    """n random-walk lines over Québec with a few attribute columns"""
+    rng = np.random.default_rng(seed)
+    starts = np.column_stack([rng.uniform(-79, -58, n), rng.uniform(45, 60, n)])
+    walks = starts[:, None, :] + rng.normal(0, 0.005, (n, VERTICES, 2)).cumsum(axis=1)
+    return gpd.GeoDataFrame(
+        {
+            'name': [f"Rivière {i}" for i in range(n)],
+            'waterway': np.where(rng.random(n) < 0.2, 'river', 'stream'),
+            'length_km': rng.gamma(2, 5, n).round(2),
+            'source': 'synthetic',
+        },
+        geometry=shapely.linestrings(walks),
+        crs="EPSG:4326",
+    )
+
+def write_geojson(path, n):
+    synthetic_rivers(n).to_file(path, driver='GeoJSON')
+
+def load_geojson(path):
+    return len(gpd.read_file(path))
+
+def load_artifact(path, artifact_dir, columns=None, bbox=None):
+    return len(artifacts.cached_artifact(
+        path.stem, [path], lambda: gpd.read_file(path), columns=columns, bbox=bbox, artifact_dir=artifact_dir
+    ))
+
+if __name__ == '__main__':
+    print(f"{'lines':>8} {'load':>22} {'rows':>8} {'time (s)':>9} {'peak RSS (MB)':>14}")
+    for n in LINE_COUNTS:
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            path = tmp / 'rivers.geojson'
+            # Out of this process, a child inherits the peak RSS of its parent on Linux
+            in_subprocess(write_geojson, path, n)
+            # Build the artifact once, the loads below are warm
+            in_subprocess(load_artifact, path, tmp)
+
+            loads = {
+                'GeoJSON read_file': (load_geojson, path),
+                'artifact': (load_artifact, path, tmp),
+                'artifact, name': (load_artifact, path, tmp, ['name']),
+                'artifact, name, bbox': (load_artifact, path, tmp, ['name'], BBOX),
+            }
+            for label, (func, *args) in loads.items():
+                rows, elapsed, rss = in_subprocess(func, *args)
+                print(f"{n:>8,} {label:>22} {rows:>8,} {elapsed:>9.2f} {rss:>14.0f}")
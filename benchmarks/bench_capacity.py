@@ -0,0 +1,70 @@
+"""
+Benchmark the chunked capacity reduction against read_csv + format_capacity
+
+Run from the repo root: python -m benchmarks.bench_capacity
+Synthetic monthly reports are concatenated from 1 to 12 months. Each run is a
+separate process so that peak RSS is measured per run.
+"""
+
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from IESO_get_data import capacity_from_files
+from benchmarks.common import in_subprocess
+
+N_GENERATORS = 400
+MEASUREMENTS = ['Output', 'Capability', 'Available Capacity', 'Forecast']
+FUEL_TYPES = ['NUCLEAR', 'GAS', 'HYDRO', 'WIND', 'SOLAR', 'BIOFUEL', 'OTHER']
+MONTHS = [1, 3, 6, 12]
+
+def write_synthetic_report(path, n_days, seed=0):
+    """Capability report with 3 header lines, one row per day, generator and measurement"""
+    rng = np.random.default_rng(seed)
+    generators = [f"GEN{i:04d}-G{i % 9}" for i in range(N_GENERATORS)]
+    n_rows = n_days * N_GENERATORS * len(MEASUREMENTS)
+    df = pd.DataFrame({
+        'Delivery Date': np.repeat(pd.date_range('2025-01-01', periods=n_days).strftime('%Y-%m-%d'),
+                                   N_GENERATORS * len(MEASUREMENTS)),
+        'Generator': np.tile(np.repeat(generators, len(MEASUREMENTS)), n_days),
+        'Fuel Type': np.tile(np.repeat([FUEL_TYPES[i % len(FUEL_TYPES)] for i in range(N_GENERATORS)],
+                                       len(MEASUREMENTS)), n_days),
+        'Measurement': np.tile(MEASUREMENTS, n_days * N_GENERATORS),
+    })
+    hours = rng.uniform(0, 900, size=(n_rows, 24)).round(1)
+    for hour in range(24):
+        df[f'Hour {hour + 1}'] = hours[:, hour]
+
+    with open(path, 'w') as f:
+        f.write("\\Synthetic Generator Output and Capability Report\n\\Created\n\\Version\n")
+        df.to_csv(f, index=False)
+
+def run_reference(paths):
+    """Whole files with default dtypes, masks and row-wise max"""
+    df = pd.concat([pd.read_csv(path, skiprows=3, index_col=False) for path in paths])
+    output_df = df[(df['Measurement'] == 'Available Capacity') | (df['Measurement'] == 'Capability')].copy()
+    hour_cols = [col for col in output_df.columns if col.startswith('Hour')]
+    output_df['Total Capa'] = output_df[hour_cols].max(axis=1).astype(float)
+    return output_df.groupby(['Generator', 'Fuel Type'])['Total Capa'].max().reset_index()
+
+def run_chunked(paths):
+    return capacity_from_files(paths)
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for month in range(max(MONTHS)):
+            paths.append(Path(tmp) / f"capacity_{month + 1:02d}2025.txt")
+            write_synthetic_report(paths[-1], n_days=30, seed=month)
+
+        print(f"{'months':>7} {'MB':>6} {'ref (s)':>8} {'ref RSS':>8} {'chunk (s)':>10} {'chunk RSS':>10}")
+        for n_months in MONTHS:
+            size_mb = sum(path.stat().st_size for path in paths[:n_months]) / 1e6
+            ref, t_ref, rss_ref = in_subprocess(run_reference, paths[:n_months])
+            chunked, t_chunk, rss_chunk = in_subprocess(run_chunked, paths[:n_months])
+
+            merged = ref.merge(chunked, on=['Generator', 'Fuel Type'])
+            assert len(merged) == len(ref) and np.allclose(merged['Total Capa_x'], merged['Total Capa_y'], atol=0.1)
+            print(f"{n_months:>7} {size_mb:>6.0f} {t_ref:>8.2f} {rss_ref:>7.0f}M {t_chunk:>10.2f} {rss_chunk:>9.0f}M")
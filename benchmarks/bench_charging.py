@@ -0,0 +1,55 @@
+"""
+Benchmark the charging-point map renderers on synthetic stations
+
+Run from the repo root: python -m benchmarks.bench_charging
+Times create_map plus HTML rendering and reports the HTML size for the folium
+marker modes and the packed canvas / fast cluster layer.
+"""
+
+import time
+
+import numpy as np
+
+from electric_charging_points import create_map
+
+STATION_COUNTS = [1_000, 10_000, 100_000]
+# One folium element per station, stop the marker modes at this size
+MAX_PER_MARKER = 10_000
+MODES = {
+    'circles': dict(use_cluster=False, fast=False),
+    'cluster': dict(use_cluster=True, fast=False),
+    'canvas': dict(use_cluster=False, fast=True),
+    'fast cluster': dict(use_cluster=True, fast=True),
+}
+
+def synthetic_stations(n, seed=0):
+    """n charging-station features spread over southern Québec"""
+    rng = np.random.default_rng(seed)
+    lon = rng.uniform(-74.5, -71.0, n)
+    lat = rng.uniform(45.0, 47.0, n)
+    return [
+        {
+            'type': 'Feature',
+            'properties': {
+                'NOM_BORNE_RECHARGE': f"Borne {i}",
+                'ADRESSE': f"{i} rue Saint-Denis",
+                'NIVEAU_RECHARGE': 'N2' if i % 5 else 'BRCC',
+                'MODE_TARIFICATION': 'Horaire',
+                'TYPE_EMPLACEMENT': 'Sur rue',
+            },
+            'geometry': {'type': 'Point', 'coordinates': [x, y]},
+        }
+        for i, (x, y) in enumerate(zip(lon, lat))
+    ]
+
+if __name__ == '__main__':
+    print(f"{'stations':>9} {'mode':>13} {'time (s)':>9} {'HTML (MB)':>10}")
+    for n in STATION_COUNTS:
+        stations = synthetic_stations(n)
+        for mode, kwargs in MODES.items():
+            if not kwargs['fast'] and n > MAX_PER_MARKER:
+                continue
+            start = time.perf_counter()
+            html = create_map(iter(stations), **kwargs).get_root().render()
+            elapsed = time.perf_counter() - start
+            print(f"{n:>9,} {mode:>13} {elapsed:>9.2f} {len(html.encode()) / 1e6:>10.2f}")
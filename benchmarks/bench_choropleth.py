@@ -0,0 +1,72 @@
+"""
+Benchmark the choropleth styling and simplification on synthetic zones
+
+Run from the repo root: python -m benchmarks.bench_choropleth
+Compares a per-feature Python style_function with the precomputed fill colours,
+with and without topology-preserving simplification, on Voronoi zones with
+densified borders. Reports map build + render time and HTML size.
+"""
+
+import tempfile
+import time
+from pathlib import Path
+
+import branca.colormap as cm
+import folium
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from choroplethe_capacities_IESO import TOTAL_COL, TOTAL_COLORS, create_folium_map
+
+ZONE_COUNTS = [1_000, 10_000]
+# Border vertex spacing and simplification tolerance, in degrees
+DENSIFY = 0.002
+TOLERANCE = 0.01
+
+def synthetic_zones(n, seed=0):
+    """n Voronoi zones over southern Ontario with random capacities"""
+    rng = np.random.default_rng(seed)
+    bounds = (-83.0, 42.0, -74.0, 47.0)
+    seeds = shapely.multipoints(np.column_stack([rng.uniform(bounds[0], bounds[2], n), rng.uniform(bounds[1], bounds[3], n)]))
+    cells = shapely.get_parts(shapely.voronoi_polygons(seeds, extend_to=shapely.box(*bounds)))
+    cells = shapely.segmentize(shapely.clip_by_rect(cells, *bounds), DENSIFY)
+    capacity = np.where(rng.random(len(cells)) < 0.1, np.nan, rng.gamma(2, 200, len(cells)))
+    return gpd.GeoDataFrame(
+        {'IESO Region': [f"Zone {i}" for i in range(len(cells))], TOTAL_COL: capacity},
+        geometry=cells,
+        crs="EPSG:4326",
+    )
+
+def style_function_map(gdf, output_dir, filename):
+    """The previous single-metric map, styled per feature in Python"""
+    colormap = cm.LinearColormap(colors=TOTAL_COLORS, vmin=0, vmax=gdf[TOTAL_COL].max())
+    m = folium.Map(location=[44, -78], zoom_start=6)
+
+    def style_function(feature):
+        value = feature['properties'].get(TOTAL_COL)
+        if value is None or pd.isna(value) or value == 0:
+            return {'fillColor': 'grey', 'color': 'black', 'weight': 1, 'fillOpacity': 0.7}
+        return {'fillColor': colormap(value), 'color': 'white', 'weight': 1, 'fillOpacity': 0.7}
+
+    folium.GeoJson(gdf, style_function=style_function).add_to(m)
+    m.save(output_dir / f"{filename}.html")
+
+if __name__ == '__main__':
+    metrics = [(TOTAL_COL, 'Total Capacity', TOTAL_COLORS)]
+    modes = {
+        'style_function': lambda gdf, d: style_function_map(gdf, d, 'map'),
+        'precomputed': lambda gdf, d: create_folium_map(gdf, metrics, d, 'map'),
+        'simplified': lambda gdf, d: create_folium_map(gdf, metrics, d, 'map', tolerance=TOLERANCE),
+    }
+    print(f"{'zones':>7} {'mode':>15} {'time (s)':>9} {'HTML (MB)':>10}")
+    for n in ZONE_COUNTS:
+        zones = synthetic_zones(n)
+        for mode, build in modes.items():
+            with tempfile.TemporaryDirectory() as tmp:
+                start = time.perf_counter()
+                build(zones, Path(tmp))
+                elapsed = time.perf_counter() - start
+                size = (Path(tmp) / 'map.html').stat().st_size
+            print(f"{n:>7,} {mode:>15} {elapsed:>9.2f} {size / 1e6:>10.2f}")
@@ -0,0 +1,50 @@
+"""
+Benchmark the bulk café layer against one folium.Marker per café
+
+Run from the repo root: python -m benchmarks.bench_coffee
+Times map generation plus HTML rendering and reports the HTML size.
+"""
+
+import tempfile
+import time
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+from folium.utilities import write_png
+from shapely import points
+
+from coffee_places import create_cafe_map
+
+POINT_COUNTS = [1_000, 10_000, 100_000]
+# Per-marker maps embed the icon for every café, stop them at this size
+MAX_PER_MARKER = 10_000
+
+def synthetic_cafes(n, seed=0):
+    """n named cafés scattered over Montréal"""
+    rng = np.random.default_rng(seed)
+    lon = rng.uniform(-73.9, -73.4, n)
+    lat = rng.uniform(45.4, 45.7, n)
+    names = [f"Café {i} <l'Espresso & co>" for i in range(n)]
+    return gpd.GeoDataFrame({"name": names}, geometry=points(lon, lat), crs="EPSG:4326")
+
+def render(cafes, icon_path, bulk):
+    start = time.perf_counter()
+    html = create_cafe_map(cafes, icon_path=icon_path, bulk=bulk).get_root().render()
+    return time.perf_counter() - start, len(html.encode())
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmp:
+        icon_path = Path(tmp) / "coffee.png"
+        # 10x10 brown square
+        icon_path.write_bytes(write_png(np.tile([111, 78, 55, 255], (10, 10, 1)).astype(np.uint8)))
+
+        print(f"{'points':>8} {'mode':>10} {'time (s)':>9} {'HTML (MB)':>10}")
+        for n in POINT_COUNTS:
+            cafes = synthetic_cafes(n)
+            for bulk in [False, True]:
+                if not bulk and n > MAX_PER_MARKER:
+                    continue
+                elapsed, size = render(cafes, icon_path, bulk)
+                mode = "bulk" if bulk else "per-marker"
+                print(f"{n:>8,} {mode:>10} {elapsed:>9.2f} {size / 1e6:>10.2f}")
@@ -0,0 +1,67 @@
+"""
+Benchmark the IESO report fetcher against a local stand-in HTTP server
+
+Run from the repo root: python -m benchmarks.bench_fetch
+Backfills two years of synthetic reports, then runs again to check that
+unchanged reports are skipped with 304 responses.
+"""
+
+import hashlib
+import tempfile
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from IESO_get_data import fetch_reports
+
+REPORT_SIZE = 2_000_000
+LATENCY_S = 0.05
+LAST_MODIFIED = formatdate(0, usegmt=True)
+
+class ReportHandler(BaseHTTPRequestHandler):
+    """Serve a synthetic report per month with ETag / Last-Modified validators"""
+
+    def do_GET(self):
+        time.sleep(LATENCY_S)
+        body = (self.path * (REPORT_SIZE // len(self.path) + 1))[:REPORT_SIZE].encode()
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', LAST_MODIFIED)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def timed_fetch(base_url, dest_dir, max_workers):
+    start = time.perf_counter()
+    reports = fetch_reports("202401", "202512", dest_dir=dest_dir, max_workers=max_workers, base_url=base_url)
+    return len(reports), time.perf_counter() - start
+
+if __name__ == '__main__':
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ReportHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}/PUB_GenOutputCapabilityMonth_{{month}}.csv"
+
+    results = []
+    for max_workers in [1, 8]:
+        with tempfile.TemporaryDirectory() as tmp:
+            dest_dir = Path(tmp)
+            results.append((max_workers, 'backfill', *timed_fetch(base_url, dest_dir, max_workers)))
+            results.append((max_workers, 'repeat', *timed_fetch(base_url, dest_dir, max_workers)))
+
+    server.shutdown()
+    print(f"{'workers':>8} {'run':>9} {'reports':>8} {'time (s)':>9}")
+    for max_workers, run, n_reports, elapsed in results:
+        print(f"{max_workers:>8} {run:>9} {n_reports:>8} {elapsed:>9.2f}")
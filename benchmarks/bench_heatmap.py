@@ -0,0 +1,61 @@
+"""
+Benchmark the activity lines map against the passage heatmap
+
+Run from the repo root: python -m benchmarks.bench_heatmap
+Synthetic activities are written to a GPX cache (memory-mapped coordinates, as returned
+by load_activities) and drawn with one PolyLine each or as heatmap tiles. Each map is
+built in its own process so that peak RSS is measured per run. Reports build + save
+time and the size of the HTML and of the tiles.
+"""
+
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.common import in_subprocess
+from my_data import create_activity_heatmap, create_activity_map, read_cache, write_cache
+
+ACTIVITY_COUNTS = [100, 1_000, 5_000]
+POINTS_PER_ACTIVITY = 2_000
+# The lines map is only built up to this many activities
+MAX_LINES = 1_000
+
+def write_synthetic_cache(cache_dir, n, seed=0):
+    """n random-walk activities around Montréal, alternating cycling and running"""
+    rng = np.random.default_rng(seed)
+    activities = []
+    for i in range(n):
+        sport = 'cycling' if i % 2 else 'running'
+        start = rng.uniform([45.40, -73.75], [45.65, -73.50])
+        steps = rng.normal(0, 8e-5 if sport == 'cycling' else 3e-5, (POINTS_PER_ACTIVITY, 2))
+        activities.append({'path': f"activity_{i}.gpx", 'sport': sport, 'length': 10_000.0,
+                           'points': start + steps.cumsum(axis=0)})
+    write_cache(activities, cache_dir)
+
+def dir_size(path):
+    return sum(f.stat().st_size for f in Path(path).rglob('*') if f.is_file())
+
+def run(mode, cache_dir, output_dir):
+    activities = list(read_cache(cache_dir).values())
+    if mode == 'heatmap':
+        m, _ = create_activity_heatmap(activities, output_dir, 'map')
+    else:
+        m, _ = create_activity_map(activities)
+    m.save(output_dir / 'map.html')
+    return (output_dir / 'map.html').stat().st_size, dir_size(output_dir / 'map_heat') if mode == 'heatmap' else 0
+
+if __name__ == '__main__':
+    print(f"{'activities':>10} {'mode':>8} {'time (s)':>9} {'peak RSS (MB)':>14} {'HTML (MB)':>10} {'tiles (MB)':>11}")
+    for n in ACTIVITY_COUNTS:
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            # Out of this process, a child inherits the peak RSS of its parent on Linux
+            in_subprocess(write_synthetic_cache, tmp / 'cache', n)
+            for mode in ['lines', 'heatmap']:
+                if mode == 'lines' and n > MAX_LINES:
+                    continue
+                output_dir = tmp / mode
+                output_dir.mkdir()
+                (html, tiles), elapsed, rss = in_subprocess(run, mode, tmp / 'cache', output_dir)
+                print(f"{n:>10,} {mode:>8} {elapsed:>9.2f} {rss:>14.0f} {html / 1e6:>10.2f} {tiles / 1e6:>11.2f}")
@@ -0,0 +1,81 @@
+"""
+Benchmark the cold-start import time of the script entry points
+
+Run from the repo root: python -m benchmarks.bench_importtime [--baseline REV]
+Each module is imported in a fresh interpreter with python -X importtime, the
+cumulative import time of the module is the best of REPEAT runs. Also lists the
+heavy backends loaded by the import. With --baseline, the same modules are
+imported from a git revision (extracted with git archive) for comparison.
+"""
+
+import argparse
+import subprocess
+import sys
+import tarfile
+import tempfile
+from io import BytesIO
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+MODULES = [
+    'waters',
+    'choroplethe_capacities_IESO',
+    'IESO_polygones',
+    'IESO_get_data',
+    'my_data',
+    'lines',
+    'coffee_places',
+    'electric_charging_points',
+]
+BACKENDS = ['osmnx', 'matplotlib.pyplot', 'folium', 'geopandas', 'pandas', 'pyarrow', 'gpxpy', 'mapbox_vector_tile']
+REPEAT = 5
+
+def import_times(module, cwd):
+    """{imported module: cumulative µs} of one import of module in a fresh interpreter"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+        cwd=cwd, capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+def measure(module, cwd, repeat=REPEAT):
+    """(best cumulative import time in ms, heavy backends imported)"""
+    runs = [import_times(module, cwd) for _ in range(repeat)]
+    best = min(run[module] for run in runs) / 1e3
+    return best, [backend for backend in BACKENDS if backend in runs[0]]
+
+def extract_revision(rev, directory):
+    """Python files of the tree at rev, written to directory"""
+    archive = subprocess.run(['git', 'archive', rev], cwd=ROOT, capture_output=True, check=True).stdout
+    with tarfile.open(fileobj=BytesIO(archive)) as tar:
+        tar.extractall(directory, members=[m for m in tar.getmembers() if m.name.endswith('.py')])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Cold-start import time of the scripts")
+    parser.add_argument('--baseline', default=None, help="git revision to compare with")
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    args = parser.parse_args()
+
+    if args.baseline is None:
+        print(f"{'module':>28} {'import (ms)':>12}  backends")
+        for module in MODULES:
+            ms, backends = measure(module, ROOT, args.repeat)
+            print(f"{module:>28} {ms:>12.0f}  {', '.join(backends)}")
+        sys.exit()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        extract_revision(args.baseline, tmp)
+        print(f"{'module':>28} {args.baseline:>10} {'now (ms)':>9} {'speedup':>8}  backends now (before)")
+        for module in MODULES:
+            before, backends_before = measure(module, tmp, args.repeat)
+            after, backends_after = measure(module, ROOT, args.repeat)
+            dropped = [backend for backend in backends_before if backend not in backends_after]
+            print(f"{module:>28} {before:>10.0f} {after:>9.0f} {before / after:>7.1f}x  "
+                  f"{', '.join(backends_after)}" + (f" (+ {', '.join(dropped)})" if dropped else ""))
@@ -0,0 +1,91 @@
+"""
+Benchmark the streaming KML reader against the whole-document ET.parse reader
+
+Run from the repo root: python -m benchmarks.bench_kml [size in MB, default 500]
+Each reader runs in its own process so that peak RSS is measured separately.
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+from xml.etree import ElementTree as ET
+
+import numpy as np
+
+from IESO_polygones import KML_NS, count_points, iter_placemarks
+from benchmarks.common import in_subprocess
+
+VERTICES_PER_RING = 20_000
+
+def etree_parse_kml(kml_file):
+    """Reference implementation: ET.parse and first coordinates of each Placemark"""
+    ns = {'kml': KML_NS}
+    root = ET.parse(kml_file).getroot()
+    zones = []
+    for pm in root.findall('.//kml:Placemark', ns):
+        coords_elem = pm.find('.//kml:coordinates', ns)
+        if coords_elem is None:
+            continue
+        points = []
+        for coord in coords_elem.text.strip().split():
+            parts = coord.split(',')
+            if len(parts) >= 2:
+                points.append([float(parts[0]), float(parts[1])])
+        zones.append(points)
+    return zones
+
+def ring_text(rng, center, radius):
+    """Closed ring of lng,lat,alt tuples around center"""
+    angles = np.linspace(0, 2 * np.pi, VERTICES_PER_RING)
+    r = radius * (1 + 0.1 * rng.random(VERTICES_PER_RING))
+    lng = center[0] + r * np.cos(angles)
+    lat = center[1] + r * np.sin(angles)
+    lng[-1], lat[-1] = lng[0], lat[0]
+    return ' '.join(f'{x:.7f},{y:.7f},0' for x, y in zip(lng, lat))
+
+def polygon_kml(rng, center):
+    """Polygon with an outer and an inner ring"""
+    return (
+        '<Polygon><outerBoundaryIs><LinearRing><coordinates>'
+        f'{ring_text(rng, center, 1.0)}'
+        '</coordinates></LinearRing></outerBoundaryIs>'
+        '<innerBoundaryIs><LinearRing><coordinates>'
+        f'{ring_text(rng, center, 0.3)}'
+        '</coordinates></LinearRing></innerBoundaryIs></Polygon>'
+    )
+
+def write_synthetic_kml(path, size_mb, seed=0):
+    """Write a KML of about size_mb MB, zones made of two polygons with holes"""
+    rng = np.random.default_rng(seed)
+    target = size_mb * 1_000_000
+    n_zones = 0
+    with open(path, 'w') as f:
+        f.write(f'<?xml version="1.0" encoding="UTF-8"?><kml xmlns="{KML_NS}"><Document><Folder>')
+        while f.tell() < target:
+            center = rng.uniform([-95, 42], [-75, 55])
+            f.write(
+                f'<Placemark><name>Zone {n_zones}</name><description>Synthetic zone</description>'
+                f'<MultiGeometry>{polygon_kml(rng, center)}{polygon_kml(rng, center + 3)}</MultiGeometry>'
+                '</Placemark>\n'
+            )
+            n_zones += 1
+        f.write('</Folder></Document></kml>')
+    return n_zones
+
+def run_streaming(path):
+    return sum(count_points(zone) for zone in iter_placemarks(path))
+
+def run_etree(path):
+    return sum(len(points) for points in etree_parse_kml(path))
+
+if __name__ == '__main__':
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'synthetic.kml'
+        n_zones = write_synthetic_kml(path, size_mb)
+        print(f"Synthetic KML: {path.stat().st_size / 1e6:.0f} MB, {n_zones} zones")
+
+        for label, func in [('ET.parse', run_etree), ('iterparse', run_streaming)]:
+            n_points, elapsed, max_rss = in_subprocess(func, path)
+            print(f"{label:>10}: {elapsed:7.2f} s, peak RSS {max_rss:8.0f} MB, {n_points:,} points")
@@ -0,0 +1,54 @@
+"""
+Benchmark batch geodesic lengths against the per-pair geod.inv loop
+
+Run from the repo root: python -m benchmarks.bench_lines
+"""
+
+import time
+
+import numpy as np
+from shapely.geometry import LineString, MultiLineString
+
+from lines import geod, geodesic_lengths
+
+VERTEX_COUNTS = [10_000, 100_000, 1_000_000]
+VERTICES_PER_PART = 500
+PARTS_PER_FEATURE = 4
+
+def loop_length_meters(geom):
+    """Reference implementation: one geod.inv call per pair of points"""
+    lines = list(geom.geoms) if isinstance(geom, MultiLineString) else [geom]
+    total_m = 0.0
+    for line in lines:
+        coords = list(line.coords)
+        for (lon1, lat1), (lon2, lat2) in zip(coords[:-1], coords[1:]):
+            _, _, dist = geod.inv(lon1, lat1, lon2, lat2)
+            total_m += dist
+    return total_m
+
+def synthetic_lines(n_vertices, seed=0):
+    """Random walk MultiLineStrings over Quebec, n_vertices in total"""
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(scale=0.01, size=(n_vertices, 2))
+    coords = np.cumsum(steps, axis=0) + [-72.0, 48.0]
+    parts = [LineString(chunk) for chunk in np.split(coords, n_vertices // VERTICES_PER_PART)]
+    return [
+        MultiLineString(parts[i:i + PARTS_PER_FEATURE])
+        for i in range(0, len(parts), PARTS_PER_FEATURE)
+    ]
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+if __name__ == '__main__':
+    print(f"{'vertices':>10} {'loop (s)':>10} {'batch (s)':>10} {'speedup':>8}")
+    for n_vertices in VERTEX_COUNTS:
+        geoms = synthetic_lines(n_vertices)
+
+        loop, t_loop = timed(lambda: np.array([loop_length_meters(g) for g in geoms]))
+        batch, t_batch = timed(geodesic_lengths, geoms)
+
+        assert np.allclose(loop, batch), "batch lengths differ from the loop"
+        print(f"{n_vertices:>10,} {t_loop:>10.3f} {t_batch:>10.3f} {t_loop / t_batch:>7.1f}x")
@@ -0,0 +1,57 @@
+"""
+Benchmark the matplotlib river renderers at 300 dpi
+
+Run from the repo root: python -m benchmarks.bench_rivers_plot
+Times GeoDataFrame.plot, the single-collection renderer and the raster renderer
+on synthetic river lines of 10 segments each.
+"""
+
+import tempfile
+import time
+from pathlib import Path
+
+import geopandas as gpd
+import matplotlib
+import numpy as np
+import shapely
+
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+from waters import plot_rivers_matplotlib
+
+SEGMENT_COUNTS = [100_000, 1_000_000, 5_000_000]
+SEGMENTS_PER_LINE = 10
+# One artist per geometry, stop GeoDataFrame.plot at this size
+MAX_GEOPANDAS = 1_000_000
+
+def synthetic_rivers(n_segments, seed=0):
+    """Random-walk lines over Québec totalling n_segments segments"""
+    rng = np.random.default_rng(seed)
+    n = n_segments // SEGMENTS_PER_LINE
+    starts = np.column_stack([rng.uniform(-79, -58, n), rng.uniform(45, 60, n)])
+    walks = starts[:, None, :] + rng.normal(0, 0.01, (n, SEGMENTS_PER_LINE + 1, 2)).cumsum(axis=1)
+    return gpd.GeoDataFrame(geometry=shapely.linestrings(walks), crs="EPSG:4326")
+
+def plot_geopandas(gdf_rivers, output_dir, name):
+    """The previous renderer"""
+    fig, ax = plt.subplots(1, 1, figsize=(14, 10))
+    gdf_rivers.plot(ax=ax, color='steelblue', linewidth=0.8, alpha=0.7)
+    fig.savefig(output_dir / f'{name}.png', bbox_inches='tight', dpi=300)
+    plt.close(fig)
+
+if __name__ == '__main__':
+    print(f"{'segments':>10} {'mode':>11} {'time (s)':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        for n in SEGMENT_COUNTS:
+            rivers = synthetic_rivers(n)
+            for mode in ['geopandas', 'collection', 'raster']:
+                if mode == 'geopandas' and n > MAX_GEOPANDAS:
+                    continue
+                start = time.perf_counter()
+                if mode == 'geopandas':
+                    plot_geopandas(rivers, tmp, mode)
+                else:
+                    plot_rivers_matplotlib(rivers, tmp, mode, mode=mode)
+                print(f"{n:>10,} {mode:>11} {time.perf_counter() - start:>9.2f}")
@@ -0,0 +1,46 @@
+"""
+Benchmark the river map with inline GeoJSON against the vector tile pyramid
+
+Run from the repo root: python -m benchmarks.bench_vector_tiles
+Reports build time, HTML size and tile pyramid size for synthetic river lines.
+"""
+
+import tempfile
+import time
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from waters import create_rivers_folium_map
+
+LINE_COUNTS = [1_000, 10_000, 50_000]
+VERTICES = 50
+MAX_ZOOM = 10
+
+def synthetic_rivers(n, seed=0):
+    """n random-walk lines of VERTICES vertices over Québec"""
+    rng = np.random.default_rng(seed)
+    starts = np.column_stack([rng.uniform(-79, -58, n), rng.uniform(45, 60, n)])
+    walks = starts[:, None, :] + rng.normal(0, 0.005, (n, VERTICES, 2)).cumsum(axis=1)
+    names = [f"Rivière {i}" for i in range(n)]
+    return gpd.GeoDataFrame({'name': names}, geometry=shapely.linestrings(walks), crs="EPSG:4326")
+
+def dir_size(path):
+    return sum(f.stat().st_size for f in Path(path).rglob('*') if f.is_file())
+
+if __name__ == '__main__':
+    print(f"{'lines':>7} {'mode':>7} {'time (s)':>9} {'HTML (MB)':>10} {'tiles (MB)':>11}")
+    for n in LINE_COUNTS:
+        rivers = synthetic_rivers(n)
+        for tiled in [False, True]:
+            with tempfile.TemporaryDirectory() as tmp:
+                tmp = Path(tmp)
+                start = time.perf_counter()
+                create_rivers_folium_map(rivers, tmp, 'rivers', tiled=tiled, max_zoom=MAX_ZOOM)
+                elapsed = time.perf_counter() - start
+                html = (tmp / 'rivers.html').stat().st_size
+                tiles = dir_size(tmp / 'rivers_tiles') if tiled else 0
+            mode = "tiled" if tiled else "inline"
+            print(f"{n:>7,} {mode:>7} {elapsed:>9.2f} {html / 1e6:>10.2f} {tiles / 1e6:>11.2f}")
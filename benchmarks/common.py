@@ -0,0 +1,28 @@
+"""
+Helpers shared by the benchmarks
+"""
+
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+def max_rss_mb():
+    """Peak resident memory of the current process in MB"""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, in KB on Linux
+    return max_rss / 1e6 if sys.platform == 'darwin' else max_rss / 1e3
+
+def _timed(func, args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start, max_rss_mb()
+
+def in_subprocess(func, *args):
+    """
+    Run func(*args) in a fresh process, returns (result, seconds, peak RSS in MB)
+    so that peak memory is measured for this call only
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+        return executor.submit(_timed, func, args).result()
@@ -0,0 +1,303 @@
+"""
+Benchmark suite of the pipeline stages on deterministic synthetic data
+
+Run from the repo root: python -m benchmarks.suite [--tiers small medium] [--cases parse_kml ...]
+Each case generates its inputs (KML zones, capability reports, GPX archives, river
+networks, charging stations) at one scale tier, then loads them and times the stage
+in a fresh process, so that peak RSS is measured per stage. Results are written as
+JSON to benchmarks/results/, --compare prints the ratios against a previous run.
+Everything runs offline, the maps are saved to temporary directories.
+"""
+
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from importlib import metadata
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.common import in_subprocess, max_rss_mb
+
+ROOT = Path(__file__).parent.parent
+RESULTS_DIR = Path(__file__).parent / "results"
+TIERS = ['small', 'medium', 'large']
+PACKAGES = ['numpy', 'pandas', 'shapely', 'geopandas', 'pyarrow', 'folium', 'gpxpy']
+GPX_SPORTS = ['cycling', 'running']
+
+def write_synthetic_gpx(directory, n_files, points_per_file, seed=0):
+    """n_files activities around Montréal, one track of one segment each, 1 s between points"""
+    rng = np.random.default_rng(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+    for i in range(n_files):
+        sport = GPX_SPORTS[i % len(GPX_SPORTS)]
+        step = 3e-5 if sport == 'running' else 8e-5
+        start = rng.uniform([45.40, -73.75], [45.65, -73.50])
+        latlon = start + rng.normal(0, step, (points_per_file, 2)).cumsum(axis=0)
+        ele = 30 + rng.normal(0, 0.2, points_per_file).cumsum()
+        t0 = 1_717_200_000 + i * 86_400
+        times = [datetime.fromtimestamp(t0 + s, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ') for s in range(points_per_file)]
+        points = ''.join(
+            f'<trkpt lat="{lat:.7f}" lon="{lon:.7f}"><ele>{z:.1f}</ele><time>{t}</time></trkpt>'
+            for (lat, lon), z, t in zip(latlon, ele, times)
+        )
+        (directory / f"activity_{i:05d}.gpx").write_text(
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<gpx version="1.1" creator="synthetic" xmlns="http://www.topografix.com/GPX/1/1">'
+            f'<trk><name>Activity {i}</name><type>{sport}</type><trkseg>{points}</trkseg></trk></gpx>'
+        )
+    return n_files
+
+# Inputs are written to files by prepare(tmp, size) and read back by load(inputs),
+# only run(*loaded, tmp) is timed
+
+def prepare_kml(tmp, size_mb):
+    from benchmarks.bench_kml import write_synthetic_kml
+
+    path = tmp / 'zones.kml'
+    write_synthetic_kml(path, size_mb)
+    return path
+
+def load_zones(path):
+    from IESO_polygones import parse_kml
+
+    return (parse_kml(path),)
+
+def run_parse_kml(path, tmp):
+    from IESO_polygones import parse_kml
+
+    return len(parse_kml(path))
+
+def run_zones_to_geojson(zones, tmp):
+    from IESO_polygones import zones_to_geojson
+
+    return len(zones_to_geojson(zones)['features'])
+
+def prepare_capacity(tmp, n_days):
+    from benchmarks.bench_capacity import write_synthetic_report
+
+    path = tmp / 'capacity.csv'
+    write_synthetic_report(path, n_days)
+    return path
+
+def load_capacity(path):
+    from IESO_get_data import parser_capa
+
+    return (parser_capa(str(path)),)
+
+def run_format_capacity(df, tmp):
+    from IESO_get_data import format_capacity
+
+    return len(format_capacity(df))
+
+def prepare_lines(tmp, n_vertices):
+    return n_vertices
+
+def load_lines(n_vertices):
+    from benchmarks.bench_lines import synthetic_lines
+
+    return (synthetic_lines(n_vertices),)
+
+def run_geodesic_length(geoms, tmp):
+    from lines import geodesic_length_meters
+
+    return sum(geodesic_length_meters(geom) for geom in geoms)
+
+def prepare_stations(tmp, n):
+    from benchmarks.bench_charging import synthetic_stations
+
+    path = tmp / 'stations.geojson'
+    with open(path, 'w') as f:
+        json.dump({'type': 'FeatureCollection', 'features': synthetic_stations(n)}, f)
+    return path
+
+def load_stations(path):
+    with open(path) as f:
+        return (json.load(f),)
+
+def run_create_map(features, tmp):
+    from electric_charging_points import create_map
+
+    path = tmp / 'charging_points.html'
+    create_map(features, use_cluster=False, fast=True).save(path)
+    return path.stat().st_size
+
+def prepare_rivers(tmp, n):
+    from benchmarks.bench_vector_tiles import synthetic_rivers
+
+    path = tmp / 'rivers.parquet'
+    synthetic_rivers(n).to_parquet(path)
+    return path
+
+def load_rivers(path):
+    import geopandas as gpd
+
+    return (gpd.read_parquet(path),)
+
+def run_rivers_map(gdf, tmp):
+    from waters import create_rivers_folium_map
+
+    create_rivers_folium_map(gdf, tmp, 'rivers')
+    return (tmp / 'rivers.html').stat().st_size
+
+def prepare_gpx(tmp, size):
+    n_files, points_per_file = size
+    write_synthetic_gpx(tmp / 'gpx', n_files, points_per_file)
+    return tmp / 'gpx'
+
+def load_gpx(directory):
+    return (sorted(directory.glob('*.gpx')),)
+
+def run_gpx_activities(gpx_files, tmp):
+    """Cold cache: every file is parsed, then the activity map is built"""
+    from my_data import create_activity_map, load_activities
+
+    activities = load_activities(gpx_files, cache_dir=tmp / 'gpx_cache')
+    m, totals = create_activity_map(activities)
+    m.save(tmp / 'activities.html')
+    return len(activities)
+
+# name: (module of the stage, sizes per tier, prepare, load, run)
+CASES = {
+    'parse_kml': ('IESO_polygones', {'small': 5, 'medium': 50, 'large': 200}, prepare_kml, lambda path: (path,), run_parse_kml),
+    'zones_to_geojson': ('IESO_polygones', {'small': 5, 'medium': 50, 'large': 200}, prepare_kml, load_zones, run_zones_to_geojson),
+    'format_capacity': ('IESO_get_data', {'small': 7, 'medium': 31, 'large': 92}, prepare_capacity, load_capacity, run_format_capacity),
+    'geodesic_length_meters': (
+        'lines', {'small': 10_000, 'medium': 100_000, 'large': 1_000_000}, prepare_lines, load_lines, run_geodesic_length,
+    ),
+    'create_map': (
+        'electric_charging_points', {'small': 1_000, 'medium': 10_000, 'large': 100_000},
+        prepare_stations, load_stations, run_create_map,
+    ),
+    'create_rivers_folium_map': (
+        'waters', {'small': 1_000, 'medium': 10_000, 'large': 50_000}, prepare_rivers, load_rivers, run_rivers_map,
+    ),
+    'gpx_activities': (
+        'my_data', {'small': (20, 1_000), 'medium': (200, 2_000), 'large': (1_000, 5_000)},
+        prepare_gpx, load_gpx, run_gpx_activities,
+    ),
+}
+
+def children_rss_mb():
+    """Peak resident memory of the largest finished child process in MB"""
+    max_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max_rss / 1e6 if sys.platform == 'darwin' else max_rss / 1e3
+
+def measure(name, inputs, tmp):
+    """
+    Load the inputs of a case and time its stage, stage output is silenced.
+    The stage module is imported first so that its import time is not counted
+    """
+    module, _, _, load, run = CASES[name]
+    with contextlib.redirect_stdout(io.StringIO()):
+        importlib.import_module(module)
+        loaded = load(inputs)
+        baseline = max_rss_mb()
+        start = time.perf_counter()
+        result = run(*loaded, tmp)
+        elapsed = time.perf_counter() - start
+    return {
+        'seconds': round(elapsed, 4),
+        'peak_rss_mb': round(max_rss_mb(), 1),
+        'rss_delta_mb': round(max_rss_mb() - baseline, 1),
+        'children_peak_rss_mb': round(children_rss_mb(), 1),
+        'result': result if isinstance(result, (int, float)) else str(result),
+    }
+
+def run_case(name, tier, repeat=1):
+    """Generate the inputs of a case once, measure its stage repeat times, keep the fastest"""
+    size = CASES[name][1][tier]
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        # Out of this process, a child inherits the peak RSS of its parent on Linux
+        inputs, generate_s, _ = in_subprocess(CASES[name][2], tmp, size)
+        runs = []
+        for i in range(repeat):
+            out_dir = tmp / f"run_{i}"
+            out_dir.mkdir()
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                runs.append(executor.submit(measure, name, inputs, out_dir).result())
+    best = min(runs, key=lambda r: r['seconds'])
+    return {
+        'case': name,
+        'tier': tier,
+        'size': list(size) if isinstance(size, tuple) else size,
+        'generate_seconds': round(generate_s, 2),
+        'repeat': repeat,
+        **best,
+        'peak_rss_mb': max(r['peak_rss_mb'] for r in runs),
+    }
+
+def environment():
+    """Python, platform, package versions and git commit of the run"""
+    versions = {}
+    for package in PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'packages': versions,
+    }
+
+def compare(results, previous):
+    """Print time and memory ratios against a previous results file, > 1 is slower / larger"""
+    before = {(r['case'], r['tier']): r for r in previous['results']}
+    print(f"\nCompared with {previous['environment'].get('commit')} ({previous['environment']['timestamp']})")
+    print(f"{'case':>26} {'tier':>7} {'time':>7} {'peak RSS':>9}")
+    for r in results:
+        old = before.get((r['case'], r['tier']))
+        if old is None or old['size'] != r['size']:
+            continue
+        print(f"{r['case']:>26} {r['tier']:>7} {r['seconds'] / old['seconds']:>6.2f}x "
+              f"{r['peak_rss_mb'] / old['peak_rss_mb']:>8.2f}x")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time and memory-profile the pipeline stages")
+    parser.add_argument('--tiers', nargs='+', choices=TIERS, default=['small', 'medium'])
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--repeat', type=int, default=1, help="runs per case, the fastest is kept")
+    parser.add_argument('--output', type=Path, default=None, help="results file, default benchmarks/results/<time>-<commit>.json")
+    parser.add_argument('--compare', type=Path, default=None, help="previous results file")
+    args = parser.parse_args()
+
+    env = environment()
+    results = []
+    print(f"{'case':>26} {'tier':>7} {'size':>12} {'time (s)':>9} {'peak RSS (MB)':>14} {'delta (MB)':>11}")
+    for tier in args.tiers:
+        for name in args.cases:
+            r = run_case(name, tier, args.repeat)
+            results.append(r)
+            print(f"{name:>26} {tier:>7} {str(r['size']):>12} {r['seconds']:>9.3f} "
+                  f"{r['peak_rss_mb']:>14.0f} {r['rss_delta_mb']:>11.0f}")
+
+    output = args.output or RESULTS_DIR / f"{env['timestamp'][:19].replace(':', '')}-{env['commit'] or 'nogit'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'environment': env, 'results': results}, f, indent=1)
+    print(f"Results: {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
@@ -0,0 +1,263 @@
+"""
+Build runner for the day maps
+
+Each task runs the __main__ block of one script. Tasks declare their inputs, outputs
+and dependencies, a task runs only when the hash of its inputs (data and source files)
+changed or an output is missing, and independent tasks run in parallel processes.
+
+    python build.py                 # everything out of date
+    python build.py day_3 --force   # rebuild day 3 and what it depends on
+    python build.py --dry-run
+    python build.py day_4 --trace   # stage timings in the task logs
+"""
+
+import argparse
+import ast
+import contextlib
+import hashlib
+import json
+import os
+import runpy
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import tracing
+from artifacts import file_digest
+from constants import DATA_PATH, OUTPUT_DIR
+
+ROOT = Path(__file__).parent
+STATE_FILE = OUTPUT_DIR / ".build_state.json"
+LOG_DIR = OUTPUT_DIR / "logs"
+
+# inputs / outputs: paths or glob patterns, relative to ROOT unless absolute.
+# The source of the module and of the repo modules it imports are inputs too, found
+# by module_sources, so changing a script or a shared module rebuilds its maps.
+TASKS = {
+    'ieso_zones': {
+        'module': 'IESO_polygones',
+        'inputs': [DATA_PATH / 'doc.kml'],
+        'outputs': [DATA_PATH / 'ieso_zones.geojson'],
+        'deps': [],
+    },
+    'ieso_capacities': {
+        'module': 'IESO_get_data',
+        'inputs': [
+            DATA_PATH / 'capacity_102025.txt',
+            DATA_PATH / 'source_ontario_thesis.xlsx',
+            'location_overrides.csv',
+        ],
+        'outputs': [DATA_PATH / 'cap_fuel_type.csv'],
+        'deps': [],
+    },
+    'day_1_cafes': {
+        'module': 'coffee_places',
+        'inputs': [DATA_PATH / 'cafe_montreal.geojson', DATA_PATH / 'coffee.png'],
+        'outputs': [OUTPUT_DIR / 'day_1' / 'montreal_cafes.html'],
+        'deps': [],
+    },
+    'day_1_charging_points': {
+        'module': 'electric_charging_points',
+        'inputs': [DATA_PATH / 'bornes-recharge-publiques.geojson'],
+        'outputs': [OUTPUT_DIR / 'day_1' / 'charging_points_no_cluster.html'],
+        'deps': [],
+    },
+    'day_2_activities': {
+        'module': 'my_data',
+        'inputs': [DATA_PATH / '*.gpx'],
+        'outputs': [OUTPUT_DIR / 'day_2' / 'summer_strava_activity.html'],
+        'deps': [],
+    },
+    'day_3_capacities': {
+        'module': 'choroplethe_capacities_IESO',
+        'inputs': [
+            DATA_PATH / 'cap_fuel_type.csv',
+            DATA_PATH / 'ieso_zones.geojson',
+        ],
+        'outputs': [
+            OUTPUT_DIR / 'day_3' / 'total_capacity.png',
+            OUTPUT_DIR / 'day_3' / 'renewables_capacity.png',
+            OUTPUT_DIR / 'day_3' / 'capacity_folium.html',
+        ],
+        'deps': ['ieso_zones', 'ieso_capacities'],
+    },
+    'day_4_rivers': {
+        'module': 'waters',
+        'inputs': [DATA_PATH / 'river_tiles' / 'osm' / 'index.json'],
+        'outputs': [
+            OUTPUT_DIR / 'day_4' / 'pyrenees_rivers_plt.png',
+            OUTPUT_DIR / 'day_4' / 'pyrenees_rivers_folium.html',
+        ],
+        'deps': [],
+    },
+    'day_27_line': {
+        'module': 'lines',
+        'inputs': [DATA_PATH / 'radisson_line.geojson'],
+        'outputs': [OUTPUT_DIR / 'day_27' / 'radisson_line.html'],
+        'deps': [],
+    },
+}
+
+def expand(patterns):
+    """Sorted files matching the paths or glob patterns, missing plain paths are kept"""
+    files = []
+    for pattern in patterns:
+        path = Path(pattern) if Path(pattern).is_absolute() else ROOT / pattern
+        if any(char in path.name for char in '*?['):
+            files.extend(sorted(path.parent.glob(path.name)))
+        else:
+            files.append(path)
+    return files
+
+def module_sources(module):
+    """
+    Source files of module and of the repo modules it imports, directly or not,
+    including the imports inside functions
+    """
+    sources = set()
+    stack = [module]
+    while stack:
+        path = ROOT / f"{stack.pop().split('.')[0]}.py"
+        if path in sources or not path.exists():
+            continue
+        sources.add(path)
+        for node in ast.walk(ast.parse(path.read_text(), filename=str(path))):
+            if isinstance(node, ast.Import):
+                stack.extend(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                stack.append(node.module)
+    return sorted(sources)
+
+def task_hash(name, cache):
+    """Hash of the task name and of the path and content of every input and source file"""
+    sha = hashlib.sha256(name.encode())
+    for path in expand(TASKS[name]['inputs']) + module_sources(TASKS[name]['module']):
+        sha.update(f"{path}\0{file_digest(path, cache)}\0".encode())
+    return sha.hexdigest()
+
+def is_up_to_date(name, state):
+    outputs = expand(TASKS[name]['outputs'])
+    return (
+        state['tasks'].get(name) == task_hash(name, state['files'])
+        and all(path.exists() for path in outputs)
+    )
+
+def load_state(path=None):
+    path = path or STATE_FILE
+    if not path.exists():
+        return {'files': {}, 'tasks': {}}
+    with open(path) as f:
+        return json.load(f)
+
+def save_state(state, path=None):
+    path = path or STATE_FILE
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(state, f, indent=1)
+
+def with_deps(targets):
+    """targets and everything they depend on, in the TASKS order"""
+    selected = set()
+    stack = list(targets)
+    while stack:
+        name = stack.pop()
+        if name not in selected:
+            selected.add(name)
+            stack.extend(TASKS[name]['deps'])
+    return [name for name in TASKS if name in selected]
+
+def run_task(name, trace=False):
+    """
+    Run the __main__ block of the task module from ROOT, output in LOG_DIR/<name>.log.
+    trace: stage timings in LOG_DIR/<name>.trace.json and <name>.folded, summary in the log
+    """
+    os.chdir(ROOT)
+    for path in expand(TASKS[name]['outputs']):
+        path.parent.mkdir(parents=True, exist_ok=True)
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    with open(LOG_DIR / f"{name}.log", 'w') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        if trace:
+            tracing.enable(LOG_DIR / name)
+        try:
+            runpy.run_module(TASKS[name]['module'], run_name='__main__')
+        except BaseException:
+            traceback.print_exc()
+            raise
+        finally:
+            if trace:
+                tracing.summary()
+                tracing.write_trace()
+                tracing.disable()
+    return time.perf_counter() - start
+
+def build(targets=None, force=False, jobs=None, dry_run=False, trace=False):
+    """
+    Run the out of date tasks among targets (default all) and their dependencies.
+    A task starts as soon as its dependencies are done, its hash is computed then, so
+    outputs of the dependencies are hashed once written. Returns {task: status}
+    """
+    names = with_deps(targets or TASKS)
+    state = load_state()
+    status = {}
+    pending = list(names)
+    running = {}
+
+    with ProcessPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+        while pending or running:
+            for name in list(pending):
+                deps = [status.get(dep) for dep in TASKS[name]['deps'] if dep in names]
+                if any(dep in ('failed', 'skipped') for dep in deps):
+                    status[name] = 'skipped'
+                    pending.remove(name)
+                    print(f"[skip] {name}: a dependency failed")
+                elif all(dep in ('built', 'up to date', 'would build') for dep in deps):
+                    pending.remove(name)
+                    if not force and is_up_to_date(name, state):
+                        status[name] = 'up to date'
+                    elif dry_run:
+                        status[name] = 'would build'
+                        print(f"[dry run] {name}")
+                    else:
+                        print(f"[start] {name}")
+                        running[executor.submit(run_task, name, trace)] = name
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    elapsed = future.result()
+                except BaseException as e:
+                    status[name] = 'failed'
+                    state['tasks'].pop(name, None)
+                    print(f"[failed] {name}: {e!r}, see {LOG_DIR / f'{name}.log'}")
+                else:
+                    status[name] = 'built'
+                    state['tasks'][name] = task_hash(name, state['files'])
+                    print(f"[done] {name} in {elapsed:.1f} s")
+                save_state(state)
+
+    save_state(state)
+    return status
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the day maps")
+    parser.add_argument('targets', nargs='*', help="task names or day_N prefixes, default all")
+    parser.add_argument('--force', action='store_true', help="rebuild even if up to date")
+    parser.add_argument('--jobs', '-j', type=int, default=None, help="parallel processes, default all cores")
+    parser.add_argument('--dry-run', '-n', action='store_true', help="only list the tasks to run")
+    parser.add_argument('--trace', action='store_true', help="record stage timings of each task in the logs")
+    args = parser.parse_args()
+
+    targets = [name for name in TASKS if any(name == t or name.startswith(f"{t}_") for t in args.targets)]
+    if args.targets and not targets:
+        parser.error(f"no task matches {args.targets}, tasks: {', '.join(TASKS)}")
+
+    start = time.perf_counter()
+    status = build(targets, force=args.force, jobs=args.jobs, dry_run=args.dry_run, trace=args.trace)
+    for name, result in status.items():
+        print(f"{name:<24} {result}")
+    print(f"Build finished in {time.perf_counter() - start:.2f} s")
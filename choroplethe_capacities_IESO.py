@@ -1,100 +1,200 @@
 from constants import DATA_PATH, OUTPUT_DIR
 import pandas as pd
 import geopandas as gpd
-import matplotlib.pyplot as plt
-import folium
-import branca.colormap as cm
 from pathlib import Path
+from branca.element import MacroElement
+from jinja2 import Template
+import json
+import numpy as np
+from artifacts import cached_artifact
+from lazy_imports import lazy_import
+from topology import read_topojson, simplify_geojson
+from tracing import stage
 
-def load_and_prepare_data():
-    """Load and prepare capacity and geojson data."""
+plt = lazy_import('matplotlib.pyplot')
+folium = lazy_import('folium')
+
+TOTAL_COL = 'Total Capa'
+RENEWABLES_COL = 'Renewables Capa'
+RENEWABLE_FUELS = ["WIND", "SOLAR"]
+TOTAL_COLORS = ['#D3D3D3', '#FFA500', '#FF0000']
+RENEWABLES_COLORS = ['#D3D3D3', '#9ACD32', '#008000']
+MISSING_COLOR = 'grey'
+
+def load_zones(zones_file='ieso_zones.geojson'):
+    """Load IESO zones from GeoJSON or TopoJSON, through the artifact store."""
+    path = DATA_PATH / zones_file
+    reader = read_topojson if path.suffix == '.topojson' else gpd.read_file
+    return cached_artifact(path.stem, [path], lambda: reader(path))
+
+@stage("load data")
+def load_and_prepare_data(zones_file='ieso_zones.geojson'):
+    """
+    Load capacity and zones data.
+    Capacity per region is pivoted by fuel type in one pass, with the total and renewables
+    columns, and joined to the zones once.
+    """
     df_region = pd.read_csv(DATA_PATH / "cap_fuel_type.csv")
-    df_cap = df_region.groupby(['IESO Region'])['Total Capa'].sum().reset_index()
-    df_renewables = df_region[(df_region['Fuel Type'].isin(["WIND", "SOLAR"]))].groupby(['IESO Region'])['Total Capa'].sum().reset_index()
-    gdf = gpd.read_file(DATA_PATH / 'ieso_zones.geojson')
+    df_cap = df_region.pivot_table(index='IESO Region', columns='Fuel Type', values='Total Capa', aggfunc='sum')
+    df_cap.columns = df_cap.columns.astype(str)
+    fuel_types = list(df_cap.columns)
+    renewables = [fuel for fuel in RENEWABLE_FUELS if fuel in df_cap.columns]
+    df_cap[TOTAL_COL] = df_cap[fuel_types].sum(axis=1, min_count=1)
+    # No PV and Wind in a region stays missing
+    df_cap[RENEWABLES_COL] = df_cap[renewables].sum(axis=1, min_count=1)
+
+    gdf = load_zones(zones_file)
     gdf = gdf.rename(columns={'name': 'IESO Region'})
-    gdf_cap = gdf.merge(df_cap, on='IESO Region', how='left')
-    gdf_r = gdf.merge(df_renewables, on='IESO Region', how='left')
-    return gdf_cap, gdf_r
+    gdf = gdf.merge(df_cap.reset_index(), on='IESO Region', how='left')
+    return gdf, fuel_types
 
-def plot_total_capacity(gdf_cap, output_dir):
+@stage("plot total capacity")
+def plot_total_capacity(gdf, output_dir):
     """Plot and save total capacity map."""
     fig, ax = plt.subplots(1, 1, figsize=(12, 8))
-    gdf_cap.plot(column='Total Capa', ax=ax, legend=True,
-                 legend_kwds={'label': "Total Capacity (MW)"},
-                 cmap='OrRd', missing_kwds={'color': 'lightgrey'})
+    gdf.plot(column=TOTAL_COL, ax=ax, legend=True,
+             legend_kwds={'label': "Total Capacity (MW)"},
+             cmap='OrRd', missing_kwds={'color': 'lightgrey'})
     ax.set_title('Total Capacity by IESO Region')
     fig.savefig(output_dir / 'total_capacity.png', bbox_inches='tight', dpi=300)
     plt.close(fig)
 
-def plot_renewables_capacity(gdf_r, output_dir):
+@stage("plot renewables capacity")
+def plot_renewables_capacity(gdf, output_dir):
     """Plot and save renewables capacity map."""
     fig, ax = plt.subplots(1, 1, figsize=(12, 8))
-    gdf_r.plot(column='Total Capa', ax=ax, legend=True,
-               legend_kwds={'label': "Total Capacity (MW) for PV and Wind"},
-               cmap='YlGn', missing_kwds={'color': 'lightgrey'})
+    gdf.plot(column=RENEWABLES_COL, ax=ax, legend=True,
+             legend_kwds={'label': "Total Capacity (MW) for PV and Wind"},
+             cmap='YlGn', missing_kwds={'color': 'lightgrey'})
     ax.set_title('Total Capacity of PV and Wind by IESO Region')
     fig.savefig(output_dir / 'renewables_capacity.png', bbox_inches='tight', dpi=300)
     plt.close(fig)
 
-def create_folium_map(gdf, column, title, output_dir, filename, cmap_type='total'):
+def fill_colors(values, colors, vmax):
+    """
+    Hex fill colours of values on the linear scale colors from 0 to vmax, in one pass.
+    Missing and zero values are MISSING_COLOR
+    """
+    values = np.asarray(values, dtype=np.float64)
+    stops = np.array([[int(c[i:i + 2], 16) for i in (1, 3, 5)] for c in colors], dtype=np.float64)
+    t = np.clip(np.nan_to_num(values) / vmax, 0, 1) * (len(colors) - 1)
+    rgb = [np.round(np.interp(t, np.arange(len(colors)), stops[:, k])).astype(np.int64) for k in range(3)]
+    hex_colors = np.char.mod('#%06x', (rgb[0] << 16) | (rgb[1] << 8) | rgb[2])
+    return np.where(np.isnan(values) | (values == 0), MISSING_COLOR, hex_colors)
+
+@stage("fill colours")
+def precompute_styles(gdf, metrics):
+    """
+    Add a '<column> fill' colour column per (column, label, colors) metric.
+    Returns the metric descriptions used by MetricSwitcher
+    """
+    descriptions = []
+    for column, label, colors in metrics:
+        vmax = float(gdf[column].max()) if gdf[column].notna().any() else 1000
+        gdf[f"{column} fill"] = fill_colors(gdf[column], colors, vmax)
+        descriptions.append({'column': column, 'fill': f"{column} fill", 'label': label, 'colors': colors, 'vmax': vmax})
+    return descriptions
+
+@stage("simplify zones")
+def simplify_zones(gdf, tolerance):
+    """Zones simplified with tolerance (degrees), borders shared between zones stay shared"""
+    geojson = simplify_geojson(json.loads(gdf.to_json(drop_id=True)), tolerance)
+    return gpd.GeoDataFrame.from_features(geojson['features'], crs=gdf.crs)
+
+class MetricSwitcher(MacroElement):
     """
-    Create and save an interactive folium map with a dark basemap and robust colormap.
-    cmap_type: 'total' (orange/red) or 'renewables' (green)
+    Select control restyling a GeoJson layer with one of the metrics in its feature properties.
+    Fill colours are the precomputed '<column> fill' properties, see precompute_styles.
     """
-    gdf_clean = gdf.dropna(subset=[column])
-    vmin = 0
-    vmax = gdf_clean[column].max() if not gdf_clean.empty and not gdf_clean[column].empty else 1000 
-
-    
-    if cmap_type == 'total':
-        colormap = cm.LinearColormap(
-            colors=['#D3D3D3', '#FFA500', '#FF0000'],
-            vmin=vmin,
-            vmax=vmax,
-            caption=f'Total Capacity (MW)'
-        )
-        
-    else:  # renewables
-        colormap = cm.LinearColormap(
-            colors=['#D3D3D3', '#9ACD32', '#008000'],
-            vmin=vmin,
-            vmax=vmax,
-            caption=f'Renewables Capacity (MW)'
-        )
-        
 
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = (function() {
+            var layer = {{ this.layer.get_name() }};
+            var metrics = {{ this.metrics|tojson }};
+            var current = metrics[0];
+
+            function style(feature) {
+                var fill = feature.properties[current.fill];
+                var missing = fill === {{ this.missing_color|tojson }};
+                return {fillColor: fill, color: missing ? 'black' : 'white', weight: 1, fillOpacity: 0.7};
+            }
+            function legend() {
+                var stops = current.colors.join(',');
+                return '<b>' + current.label + ' (MW)</b>'
+                    + '<div style="height:10px;width:200px;background:linear-gradient(to right,' + stops + ')"></div>'
+                    + '<span>0</span><span style="float:right">' + Math.round(current.vmax) + '</span>';
+            }
+
+            var control = L.control({position: 'topright'});
+            control.onAdd = function() {
+                var div = L.DomUtil.create('div', 'metric-switcher');
+                var select = '<select>' + metrics.map(function(metric, i) {
+                    return '<option value="' + i + '">' + metric.label + '</option>';
+                }).join('') + '</select>';
+                div.innerHTML = select + '<div class="metric-legend"></div>';
+                L.DomEvent.disableClickPropagation(div);
+                div.querySelector('select').addEventListener('change', function(e) {
+                    current = metrics[e.target.value];
+                    update(div);
+                });
+                update(div);
+                return div;
+            };
+            function update(div) {
+                layer.setStyle(style);
+                div.querySelector('.metric-legend').innerHTML = legend();
+            }
+
+            layer.bindTooltip(function(l) {
+                var value = l.feature.properties[current.column];
+                return '<b>' + l.feature.properties['IESO Region'] + '</b><br>' + current.label + ': '
+                    + (value === null || value === undefined ? 'n/a' : Math.round(value) + ' MW');
+            }, {sticky: true});
+            control.addTo({{ this._parent.get_name() }});
+            return control;
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, layer, metrics):
+        super().__init__()
+        self._name = "MetricSwitcher"
+        self.layer = layer
+        self.metrics = metrics
+        self.missing_color = MISSING_COLOR
+
+@stage("folium map")
+def create_folium_map(gdf, metrics, output_dir, filename, tolerance=None):
+    """
+    Create and save an interactive folium map with a dark basemap, embedding the zones once.
+    metrics: (column, label, colors) shown one at a time, switched client-side.
+    Fill colours are computed beforehand, zones are simplified with tolerance (degrees) if given.
+    """
     m = folium.Map(
         location=[44, -78],
         zoom_start=6,
         tiles='CartoDB dark_matter'
     )
 
-    def style_function(feature):
-        value = feature['properties'].get(column)
-        if value is None or pd.isna(value) or value == 0:
-            return {'fillColor': 'grey', 'color': 'black', 'weight': 1, 'fillOpacity': 0.7}
-        else:
-            return {
-                'fillColor': colormap(value),
-                'color': 'white',
-                'weight': 1,
-                'fillOpacity': 0.7
-            }
-        
-    folium.GeoJson(
-        gdf,
-        style_function= style_function,
-        tooltip=folium.GeoJsonTooltip(fields=['IESO Region', column], aliases=['IESO Region', 'Total Capacity in MW'])
-    ).add_to(m)
-
-    colormap.add_to(m)
+    columns = [column for column, _, _ in metrics]
+    gdf = gdf[['IESO Region', *columns, 'geometry']].copy()
+    descriptions = precompute_styles(gdf, metrics)
+    if tolerance:
+        gdf = simplify_zones(gdf, tolerance)
+
+    layer = folium.GeoJson(gdf, name='IESO Regions')
+    layer.add_to(m)
+    MetricSwitcher(layer, descriptions).add_to(m)
+
     CSS = """
-    #legend text { fill: white !important; font-size: 14px; }
+    .metric-switcher { background: white; padding: 6px 8px; border-radius: 5px; font-size: 14px; }
+    .metric-switcher select { margin-bottom: 4px; }
     """
     m.get_root().header.add_child(folium.Element(f"<style>{CSS}</style>"))
 
-    m.save(output_dir / f"{filename}.html")
+    with stage("save map", output=output_dir / f"{filename}.html"):
+        m.save(output_dir / f"{filename}.html")
 
 if __name__ == '__main__':
     day = 3
@@ -102,11 +202,14 @@ if __name__ == '__main__':
     output_dir.mkdir(parents=True, exist_ok=True)
     use_folium = True
 
-    gdf_cap, gdf_r = load_and_prepare_data()
+    gdf, fuel_types = load_and_prepare_data()
 
-    plot_total_capacity(gdf_cap, output_dir)
-    plot_renewables_capacity(gdf_r, output_dir)
+    plot_total_capacity(gdf, output_dir)
+    plot_renewables_capacity(gdf, output_dir)
 
     if use_folium:
-        create_folium_map(gdf_cap, 'Total Capa', 'Total Capacity', output_dir, 'total_capacity_folium', cmap_type='total')
-        create_folium_map(gdf_r, 'Total Capa', 'Renewables Capacity', output_dir, 'renewables_capacity_folium', cmap_type='renewables')
+        metrics = [
+            (TOTAL_COL, 'Total Capacity', TOTAL_COLORS),
+            (RENEWABLES_COL, 'Renewables Capacity', RENEWABLES_COLORS),
+        ] + [(fuel, fuel.title(), TOTAL_COLORS) for fuel in fuel_types]
+        create_folium_map(gdf, metrics, output_dir, 'capacity_folium', tolerance=0.001)
@@ -1,72 +1,106 @@
-import folium
 import geopandas as gpd
+import numpy as np
 from constants import DATA_PATH, OUTPUT_DIR
+from lazy_imports import lazy_import
+from tracing import stage
+
+folium = lazy_import('folium')
 
 # Params
 day = "1"
+ICON_PATH = DATA_PATH / "coffee.png"
 
-# Load cafés
-cafes = gpd.read_file(DATA_PATH / "cafe_montreal.geojson")
-cafes = cafes[
-    (cafes.geometry.y.between(44, 46)) &
-    (cafes.geometry.x.between(-75, -72))
-].copy()
-cafes["name"] = cafes["name"].fillna("Café sans nom")
+@stage("load cafes")
+def load_cafes(path=DATA_PATH / "cafe_montreal.geojson"):
+    """Load cafés around Montréal"""
+    cafes = gpd.read_file(path)
+    cafes = cafes[
+        (cafes.geometry.y.between(44, 46)) &
+        (cafes.geometry.x.between(-75, -72))
+    ].copy()
+    cafes["name"] = cafes["name"].fillna("Café sans nom")
+    return cafes
 
-# Create the map
-m = folium.Map(
-    location=[45.5017, -73.5673],
-    zoom_start=13,
-    min_zoom=11,
-    max_zoom=18,
-    tiles="https://cartodb-basemaps-a.global.ssl.fastly.net/light_all//{z}/{x}/{y}.png",
-    attr="© OpenStreetMap, © CartoDB",
-)
+@stage("build map")
+def create_cafe_map(cafes, icon_path=ICON_PATH, bulk=True):
+    """
+    Create the cafés map.
+    bulk: all cafés in one payload with a single inlined icon, markers and popups built
+    in the browser. Otherwise one folium.Marker and CustomIcon per café.
+    """
+    from folium.utilities import image_to_url
+    from point_layers import IconPointLayer
 
-icon_path = DATA_PATH / "coffee.png"
+    # Create the map
+    m = folium.Map(
+        location=[45.5017, -73.5673],
+        zoom_start=13,
+        min_zoom=11,
+        max_zoom=18,
+        tiles="https://cartodb-basemaps-a.global.ssl.fastly.net/light_all//{z}/{x}/{y}.png",
+        attr="© OpenStreetMap, © CartoDB",
+    )
 
-# Add beans
-for _, row in cafes.iterrows():
-    lat, lon = row.geometry.y, row.geometry.x
-    name = row["name"]
+    # Add beans
+    if bulk:
+        IconPointLayer(
+            np.column_stack([cafes.geometry.y, cafes.geometry.x]),
+            icon_image=icon_path,
+            fields=cafes[["name"]].to_numpy().tolist(),
+            popup_template="<b>{0}</b>",
+            icon_size=(10, 10),
+            icon_anchor=(5, 5),
+            name="Coffee Places",
+        ).add_to(m)
+    else:
+        for _, row in cafes.iterrows():
+            lat, lon = row.geometry.y, row.geometry.x
+            name = row["name"]
 
-    icon = folium.CustomIcon(str(icon_path), icon_size=(10, 10), icon_anchor=(5, 5))
-    marker = folium.Marker(
-        location=[lat, lon],
-        popup=f"<b>{name}</b>",
-        icon=icon
-    )
-    marker.add_to(m)
+            icon = folium.CustomIcon(str(icon_path), icon_size=(10, 10), icon_anchor=(5, 5))
+            marker = folium.Marker(
+                location=[lat, lon],
+                popup=f"<b>{name}</b>",
+                icon=icon
+            )
+            marker.add_to(m)
+
+    # Add legend
+    legend_html = f"""
+    <div id='legend' style="
+        position: fixed;
+        bottom: 100px; left: 100px;
+        background-color: white;
+        border: 2px solid lightgray;
+        border-radius: 10px;
+        padding: 8px 12px;
+        box-shadow: 2px 2px 6px rgba(0,0,0,0.3);
+        font-size: 14px;
+        z-index: 9999;
+    ">
+        <img src='{image_to_url(str(icon_path))}' style="width:10px; height:10px; vertical-align:left; margin-right:6px;">
+        <b>Coffee Place</b>
+    </div>
+    """
+    m.get_root().html.add_child(folium.Element(legend_html))
+
+    bounds = cafes.total_bounds
+    m.fit_bounds([[bounds[1], bounds[0]], [bounds[3], bounds[2]]])
+    m.options['maxBounds'] = [[bounds[1], bounds[0]], [bounds[3], bounds[2]]]
 
-# Add legend
-legend_html = f"""
-<div id='legend' style="
-    position: fixed; 
-    bottom: 100px; left: 100px; 
-    background-color: white; 
-    border: 2px solid lightgray; 
-    border-radius: 10px; 
-    padding: 8px 12px; 
-    box-shadow: 2px 2px 6px rgba(0,0,0,0.3);
-    font-size: 14px;
-    z-index: 9999;
-">
-    <img src='{icon_path.as_posix()}' style="width:10px; height:10px; vertical-align:left; margin-right:6px;">
-    <b>Coffee Place</b>
-</div>
-"""
-m.get_root().html.add_child(folium.Element(legend_html))
+    # Control layers
+    folium.LayerControl().add_to(m)
 
-bounds = cafes.total_bounds
-m.fit_bounds([[bounds[1], bounds[0]], [bounds[3], bounds[2]]])
-m.options['maxBounds'] = [[bounds[1], bounds[0]], [bounds[3], bounds[2]]]
+    return m
 
-# Control layers
-folium.LayerControl().add_to(m)
+if __name__ == '__main__':
+    cafes = load_cafes()
+    m = create_cafe_map(cafes, bulk=True)
 
-# Save
-output_dir = OUTPUT_DIR / f"day_{day}"
-output_dir.mkdir(parents=True, exist_ok=True)
-m.save(output_dir / "montreal_cafes.html")
+    # Save
+    output_dir = OUTPUT_DIR / f"day_{day}"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    with stage("save map", output=output_dir / "montreal_cafes.html"):
+        m.save(output_dir / "montreal_cafes.html")
 
-print(f"Map saved : {output_dir / 'montreal_cafes.html'}")
+    print(f"Map saved : {output_dir / 'montreal_cafes.html'}")
@@ -0,0 +1,56 @@
+"""
+Streaming, conditional HTTP downloads
+"""
+
+import json
+from pathlib import Path
+
+import requests
+
+from tracing import stage
+
+@stage("download")
+def get_file(url: str, name: str, session=None, validators=None):
+    """
+    Stream data from url to name.
+    With validators (etag / last_modified of the local copy) the request is conditional
+    and an unchanged file is not downloaded again.
+    Returns the validators of the file on disk, None if the download failed
+    """
+    session = session or requests
+    headers = {}
+    if validators and Path(name).exists():
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+
+    with session.get(url, headers=headers, stream=True, timeout=60) as response:
+        if response.status_code == 304:
+            print(f"{url} not modified")
+            return validators
+        if response.status_code != 200:
+            print(f'Failed to downlaod file. Status code: {response.status_code}')
+            return None
+
+        # Write next to the target so that an interrupted download leaves no partial file
+        part = Path(f"{name}.part")
+        with open(part, "wb") as f:
+            for chunk in response.iter_content(chunk_size=1 << 16):
+                f.write(chunk)
+        part.replace(name)
+
+    print(f"{url} file downloaded successfully")
+    return {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+
+def load_validators(path: Path):
+    """Validators per url saved by save_validators, empty if none"""
+    if not Path(path).exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_validators(validators: dict, path: Path):
+    """Save the validators per url, as returned by get_file, for load_validators"""
+    with open(path, "w") as f:
+        json.dump(validators, f, indent=2)
@@ -1,29 +1,57 @@
+from pathlib import Path
+from typing import Iterable, Iterator, Union
+
 import requests
-import folium
-from folium.plugins import MarkerCluster
 
-from constants import OUTPUT_DIR
+from constants import DATA_PATH, OUTPUT_DIR
+from downloads import get_file, load_validators, save_validators
+from geojson_stream import iter_file_features
+from lazy_imports import lazy_import
+from tracing import stage
+
+folium = lazy_import('folium')
+
+# Local copy of the charging points, the signed url expires after a week
+SNAPSHOT_PATH = DATA_PATH / "bornes-recharge-publiques.geojson"
+# Popup fields, rendered client-side with POPUP_TEMPLATE in fast mode
+POPUP_FIELDS = ['NOM_BORNE_RECHARGE', 'ADRESSE', 'NIVEAU_RECHARGE', 'MODE_TARIFICATION', 'TYPE_EMPLACEMENT']
+POPUP_TEMPLATE = "<b>{0}</b><br>{1}<br>{2} - {3}<br><i>{4}</i>"
+
+
+@stage("fetch snapshot")
+def fetch_snapshot(url: str, snapshot_path: Path = SNAPSHOT_PATH) -> Path:
+    """
+    Refresh the local snapshot of url with a conditional request.
+    The existing snapshot is kept when the url has expired or the server is unreachable.
+    """
+    validators_path = snapshot_path.with_name(snapshot_path.name + ".json")
+    validators = load_validators(validators_path)
+
+    try:
+        new_validators = get_file(url, snapshot_path, validators=validators)
+    except requests.RequestException as e:
+        print(f"Download failed: {e}")
+        new_validators = None
+
+    if new_validators:
+        save_validators(new_validators, validators_path)
+    elif snapshot_path.exists():
+        print(f"Using local snapshot {snapshot_path}")
+    else:
+        raise FileNotFoundError(f"No snapshot of {url} at {snapshot_path}")
+    return snapshot_path
 
 
-def parse_geojson(url: str) -> dict:
-    """Retrieve GeoJSON data from URL"""
-    response = requests.get(url)
-    response.raise_for_status()
-    return response.json()
+def parse_geojson(url: str, snapshot_path: Path = SNAPSHOT_PATH) -> Iterator[dict]:
+    """Stream the GeoJSON features of url, through a local snapshot"""
+    return iter_file_features(fetch_snapshot(url, snapshot_path))
   
 
-def create_map(geojson_data: dict, use_cluster: bool = True) -> folium.Map:
-    """Create Folium map with charging stations"""
-    features = geojson_data.get('features', [])
-    
-    # Center of Montréal
-    m = folium.Map(location=[45.5017, -73.5673], 
-                   zoom_start=12,
-                   tiles="https://{s}.basemaps.cartocdn.com/light_all/{z}/{x}/{y}.png",
-                   attr="© OpenStreetMap, © CartoDB")
-    container = MarkerCluster().add_to(m) if use_cluster else m
-    
-    for feature in geojson_data['features']:
+def add_markers(container, features: Iterable[dict], use_cluster: bool) -> int:
+    """Add one folium marker with its popup per station. Returns the number of stations"""
+    n_features = 0
+    for feature in features:
+        n_features += 1
         props = feature['properties']
         lon, lat = feature['geometry']['coordinates']
         
@@ -51,6 +79,57 @@ def create_map(geojson_data: dict, use_cluster: bool = True) -> folium.Map:
                 fillOpacity=0.6,
                 opacity=.8,
             ).add_to(container)
+    return n_features
+
+
+def add_fast_layer(container: 'folium.Map', features: Iterable[dict], use_cluster: bool) -> int:
+    """
+    Add all stations as one packed array, drawn on a canvas or in a fast cluster.
+    Returns the number of stations
+    """
+    from point_layers import CanvasPointLayer
+
+    points, fields = [], []
+    for feature in features:
+        props = feature['properties']
+        lon, lat = feature['geometry']['coordinates']
+        points.append((lat, lon))
+        fields.append([props.get(field, 'N/A') for field in POPUP_FIELDS])
+
+    CanvasPointLayer(
+        points,
+        fields=fields,
+        popup_template=POPUP_TEMPLATE,
+        cluster=use_cluster,
+        style={'radius': 4, 'color': 'green', 'fill': True, 'fillColor': 'green', 'fillOpacity': 0.6, 'opacity': .8},
+        name="Charging Stations",
+    ).add_to(container)
+    return len(points)
+
+
+@stage("build map")
+def create_map(features: Union[dict, Iterable[dict]], use_cluster: bool = True, fast: bool = False) -> 'folium.Map':
+    """
+    Create Folium map with charging stations, from a FeatureCollection or an iterator of features.
+    fast: all stations in one canvas / fast cluster layer instead of a folium marker each
+    """
+    if isinstance(features, dict):
+        features = features.get('features', [])
+    
+    # Center of Montréal
+    m = folium.Map(location=[45.5017, -73.5673], 
+                   zoom_start=12,
+                   tiles="https://{s}.basemaps.cartocdn.com/light_all/{z}/{x}/{y}.png",
+                   attr="© OpenStreetMap, © CartoDB")
+    if fast:
+        container = m
+        n_features = add_fast_layer(m, features, use_cluster)
+    else:
+        from folium.plugins import MarkerCluster
+
+        container = MarkerCluster().add_to(m) if use_cluster else m
+        n_features = add_markers(container, features, use_cluster)
+    
     # Legend
     legend_html = f"""
     <div id='legend' style="
@@ -64,7 +143,7 @@ def create_map(geojson_data: dict, use_cluster: bool = True) -> folium.Map:
         font-size: 14px;
         z-index: 9999;
     ">
-        <b>Total of Charging Points : {len(geojson_data['features'])}</b>
+        <b>Total of Charging Points : {n_features}</b>
         <p style="margin: 0;"><span style="color: green; font-size: 25px">●</span> Charging Station</p>
     </div>
     """
@@ -76,7 +155,8 @@ def create_map(geojson_data: dict, use_cluster: bool = True) -> folium.Map:
 if __name__ == "__main__":
     url="https://montreal-prod.storage.googleapis.com/resources/b502cee9-ff87-44fa-9a8e-722285202b0d/bornes-recharge-publiques.geojson?X-Goog-Algorithm=GOOG4-RSA-SHA256&X-Goog-Credential=test-datapusher-delete%40amplus-data.iam.gserviceaccount.com%2F20251027%2Fauto%2Fstorage%2Fgoog4_request&X-Goog-Date=20251027T223944Z&X-Goog-Expires=604800&X-Goog-SignedHeaders=host&x-goog-signature=9213dfa0f62f36d4d5d45ab27b950b4c37ce8f9bdc275aad8e1fa8b9bc01443ea9dd8e3082dec888dc3a7e5ded0e6edcb30cdff492901e3852cf07b2fc50a79a6a65b390974d69d6d0364e211f6597839b10054fed919ad19f4fa5a0c3b7f994134f64d3e21789fd7c767c43b05d0330b3ad5a5f14d54e0e3d636cebed76c560b6fc10a5081a91d230fb8e9f7f196c8e3b4e85a2b3a6e0961fdc32fcea6a556346200fc88ca3031e7b42ac67824d3dcb2f4e5cf4f08bf642d830041babdfd9ffb72973fa91bef13567f5fd8ccc126ffcb6be0811bd80aadffe730d4b402c84aaca8b8d5dfb25b6b59c899f728a0e8cd926afd7aabf377f49a4d1ae1aea5e19bc"  
     day = 1
-    geojson_data = parse_geojson(url)
-    map = create_map(geojson_data, use_cluster=False)
-    map.save(OUTPUT_DIR / f"day_{day}" / "charging_points_no_cluster.html")
+    features = parse_geojson(url)
+    map = create_map(features, use_cluster=False, fast=True)
+    with stage("save map", output=OUTPUT_DIR / f"day_{day}" / "charging_points_no_cluster.html"):
+        map.save(OUTPUT_DIR / f"day_{day}" / "charging_points_no_cluster.html")
   
\ No newline at end of file
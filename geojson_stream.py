@@ -0,0 +1,106 @@
+"""
+Incremental GeoJSON reader: yields the features of a FeatureCollection one at a time
+from a file or an HTTP body, without holding the whole document in memory
+"""
+
+import codecs
+import json
+
+CHUNK_SIZE = 1 << 16
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+class _Buffer:
+    """Text buffer refilled from an iterator of byte chunks"""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.text = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size=0):
+        """
+        Read chunks until size characters are pending, one chunk at least, dropping the
+        consumed text. False at the end of the data
+        """
+        if self.eof:
+            return False
+        parts = [self.text[self.pos:]]
+        pending = len(parts[0])
+        while True:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                self.eof = True
+                parts.append(self.utf8.decode(b'', final=True))
+                break
+            parts.append(self.utf8.decode(chunk))
+            pending += len(parts[-1])
+            if pending >= size:
+                break
+        self.text = ''.join(parts)
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character, '' at the end of the data"""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Invalid GeoJSON: expected {char!r} at {self.text[self.pos:self.pos + 20]!r}")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next JSON value, reading more chunks until it is complete"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                # Double the pending text before decoding again, a value spanning many
+                # chunks is only decoded a logarithmic number of times
+                if not self.fill(2 * (len(self.text) - self.pos)):
+                    raise
+                continue
+            # A number at the end of the buffer may continue in the next chunk
+            if end == len(self.text) and not self.eof and not isinstance(value, (dict, list, str)):
+                self.fill()
+                continue
+            self.pos = end
+            return value
+
+def iter_features(chunks):
+    """
+    Yield the features of a GeoJSON FeatureCollection given as byte chunks.
+    Other top-level members are skipped.
+    """
+    buffer = _Buffer(chunks)
+    buffer.expect('{')
+    while buffer.peek() != '}':
+        key = buffer.value()
+        buffer.expect(':')
+        if key != 'features':
+            buffer.value()
+        else:
+            buffer.expect('[')
+            while buffer.peek() != ']':
+                yield buffer.value()
+                if buffer.peek() == ',':
+                    buffer.pos += 1
+            buffer.expect(']')
+        if buffer.peek() == ',':
+            buffer.pos += 1
+
+def iter_file_features(path, chunk_size=CHUNK_SIZE):
+    """Yield the features of a GeoJSON file"""
+    with open(path, 'rb') as f:
+        yield from iter_features(iter(lambda: f.read(chunk_size), b''))
@@ -0,0 +1,229 @@
+"""
+Passage-count heatmaps of GPS tracks as raster tile pyramids
+
+Tracks are binned on the Web Mercator pixel grid of the finest zoom: every cell counts
+the tracks crossing it, whatever their speed or sampling rate. The grid is sparse and
+built chunk by chunk, and tracks are densified in batches of bounded size, so memory
+depends on the occupied cells, not on the number of points. Coarser zooms keep the max
+count of their children, and every level is written as 256 px PNG tiles, z/x/y.png,
+opacity on a log scale of the count. Grids are reduced and written one band of tile
+rows at a time.
+"""
+
+import json
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+TILE_PIXELS = 256
+MIN_ZOOM = 8
+MAX_ZOOM = 15
+# Segments longer than this, in metres, are gaps in the recording and are not drawn.
+# Tracks have no timestamps, smart recording leaves a few hundred metres between points
+MAX_GAP_M = 1_000
+EARTH_RADIUS_M = 6_378_137
+# Track points binned at once, and densified points binned at once
+CHUNK_POINTS = 500_000
+MAX_SAMPLES = 2_000_000
+# Opacity of a cell crossed once, the busiest cells are opaque
+MIN_ALPHA = 0.25
+MAX_LAT = 85.05112878
+
+def mercator_pixels(latlon, zoom):
+    """Global Web Mercator pixel coordinates (x, y) of (lat, lon) points at zoom"""
+    size = TILE_PIXELS * 2 ** zoom
+    lat = np.radians(np.clip(latlon[:, 0], -MAX_LAT, MAX_LAT))
+    x = (latlon[:, 1] + 180) / 360 * size
+    y = (1 - np.arcsinh(np.tan(lat)) / np.pi) / 2 * size
+    return np.column_stack([x, y])
+
+def pixel_latlon(x, y, zoom):
+    """(lat, lon) of global pixel coordinates at zoom"""
+    size = TILE_PIXELS * 2 ** zoom
+    lon = np.asarray(x) / size * 360 - 180
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * np.asarray(y) / size))))
+    return lat, lon
+
+def segment_steps(pixels, track_idx, size):
+    """
+    Segments from every point to the next one of its track, the last point of a track is a
+    segment of length 0. Returns (start, end, number of samples) of the segments, a segment
+    is sampled at most one pixel apart, gaps longer than MAX_GAP_M only keep their start
+    """
+    same = np.r_[track_idx[1:] == track_idx[:-1], False]
+    a = pixels
+    b = np.where(same[:, None], np.roll(pixels, -1, axis=0), pixels)
+    span = np.abs(b - a).max(axis=1)
+    # Ground length of a pixel is the equator one times cos(lat) = 1 / cosh(mercator y)
+    span_m = span * 2 * np.pi * EARTH_RADIUS_M / size / np.cosh(np.pi * (1 - 2 * a[:, 1] / size))
+    steps = np.maximum(np.ceil(span).astype(np.int64), 1)
+    steps[span_m > MAX_GAP_M] = 1
+    return a, b, steps
+
+def sample_tracks(pixels, track_idx, size, max_samples=MAX_SAMPLES):
+    """
+    Points at most one pixel apart along the tracks, in batches of about max_samples points
+    whatever the densification. Yields (points, their track index, index of the track
+    continuing in the next batch or -1)
+    """
+    a, b, steps = segment_steps(pixels, track_idx, size)
+    ends = np.cumsum(steps)
+    start = 0
+    while start < len(steps):
+        end = max(int(np.searchsorted(ends, ends[start] - steps[start] + max_samples, side='right')), start + 1)
+        seg_steps = steps[start:end]
+        which = np.repeat(np.arange(start, end), seg_steps)
+        t = (np.arange(len(which)) - np.repeat(np.cumsum(seg_steps) - seg_steps, seg_steps)) / np.repeat(seg_steps, seg_steps)
+        points = a[which] + t[:, None] * (b[which] - a[which])
+        open_track = track_idx[end - 1] if end < len(steps) and track_idx[end] == track_idx[end - 1] else -1
+        yield points, track_idx[which], open_track
+        start = end
+
+def _chunks(tracks, chunk_points, chunk_tracks):
+    """Lists of non-empty tracks of about chunk_points points, at most chunk_tracks tracks"""
+    chunk, n_points = [], 0
+    for track in tracks:
+        if len(track) == 0:
+            continue
+        chunk.append(np.asarray(track, dtype=np.float64))
+        n_points += len(track)
+        if n_points >= chunk_points or len(chunk) == chunk_tracks:
+            yield chunk
+            chunk, n_points = [], 0
+    if chunk:
+        yield chunk
+
+def passage_counts(tracks, zoom=MAX_ZOOM, chunk_points=CHUNK_POINTS, max_samples=MAX_SAMPLES):
+    """
+    Sparse grid of (lat, lon) tracks at zoom: sorted cell ids and the number of tracks
+    crossing each cell. Cell id is y * 256 * 2**zoom + x, in global pixels
+    """
+    size = TILE_PIXELS * 2 ** zoom
+    n_cells = size * size
+    # (track, cell) pairs are packed in one int64 key, n_cells * chunk_tracks < 2**62
+    chunk_tracks = 2 ** 62 // n_cells
+    cells = np.empty(0, dtype=np.int64)
+    counts = np.empty(0, dtype=np.int32)
+    for chunk in _chunks(tracks, chunk_points, chunk_tracks):
+        track_idx = np.repeat(np.arange(len(chunk)), [len(track) for track in chunk])
+        pixels = mercator_pixels(np.concatenate(chunk), zoom)
+        # Cells of a track cut between two batches are carried to the next one
+        carry = np.empty(0, dtype=np.int64)
+        for points, point_track, open_track in sample_tracks(pixels, track_idx, size, max_samples):
+            ix = np.clip(points[:, 0].astype(np.int64), 0, size - 1)
+            iy = np.clip(points[:, 1].astype(np.int64), 0, size - 1)
+
+            # Each track counts once per cell
+            pairs = np.sort(np.r_[carry, point_track * n_cells + iy * size + ix])
+            pairs = pairs[np.r_[True, pairs[1:] != pairs[:-1]]]
+            split = np.searchsorted(pairs, open_track * n_cells) if open_track >= 0 else len(pairs)
+            carry = pairs[split:]
+            cells, counts = _merge_cells(cells, counts, np.sort(pairs[:split] % n_cells))
+    return cells, counts
+
+def _merge_cells(cells, counts, batch_cells):
+    """Add sorted cell ids, one passage each, to the sorted grid"""
+    if not len(batch_cells):
+        return cells, counts
+    starts = np.flatnonzero(np.r_[True, batch_cells[1:] != batch_cells[:-1]])
+    batch_counts = np.diff(np.r_[starts, len(batch_cells)]).astype(np.int32)
+    batch_cells = batch_cells[starts]
+
+    # Known cells are incremented, new ones inserted
+    pos = np.searchsorted(cells, batch_cells)
+    known = pos < len(cells)
+    known[known] = cells[pos[known]] == batch_cells[known]
+    counts[pos[known]] += batch_counts[known]
+    return np.insert(cells, pos[~known], batch_cells[~known]), np.insert(counts, pos[~known], batch_counts[~known])
+
+def _row_bands(cells, size, rows):
+    """Slices of sorted cell ids in bands of rows pixel rows, empty bands skipped"""
+    first, last = cells[0] // size // rows, cells[-1] // size // rows
+    bounds = np.searchsorted(cells, np.arange(first, last + 2) * rows * size)
+    return [slice(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+def zoom_out(cells, counts, zoom):
+    """
+    Grid of zoom - 1, each cell keeps the max count of its children.
+    Two tile rows make one tile row of the parent zoom, they are reduced band by band
+    """
+    size = TILE_PIXELS * 2 ** zoom
+    parent_cells, parent_counts = [], []
+    for band in _row_bands(cells, size, 2 * TILE_PIXELS):
+        parents = (cells[band] // size // 2) * (size // 2) + cells[band] % size // 2
+        order = np.argsort(parents, kind='stable')
+        parents = parents[order]
+        starts = np.flatnonzero(np.r_[True, parents[1:] != parents[:-1]])
+        parent_cells.append(parents[starts])
+        parent_counts.append(np.maximum.reduceat(counts[band][order], starts))
+    return np.concatenate(parent_cells), np.concatenate(parent_counts)
+
+def write_heat_tiles(cells, counts, zoom, out_dir, color, vmax):
+    """
+    Write the tiles of one zoom level as palette PNGs, one colour with 256 opacities,
+    one row of tiles at a time. Returns the number of tiles
+    """
+    from PIL import Image
+
+    size = TILE_PIXELS * 2 ** zoom
+    palette = [int(color[i:i + 2], 16) for i in (1, 3, 5)] * 256
+    n_tiles = 0
+    for band in _row_bands(cells, size, TILE_PIXELS):
+        x, y = cells[band] % size, cells[band] // size
+        order = np.argsort(x // TILE_PIXELS, kind='stable')
+        x, y = x[order], y[order]
+        alpha = MIN_ALPHA + (1 - MIN_ALPHA) * np.log1p(counts[band][order]) / np.log1p(max(vmax, 1))
+        alpha = np.round(np.clip(alpha, 0, 1) * 255).astype(np.uint8)
+
+        tx = x // TILE_PIXELS
+        bounds = np.flatnonzero(np.r_[True, tx[1:] != tx[:-1], True])
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            image = np.zeros((TILE_PIXELS, TILE_PIXELS), dtype=np.uint8)
+            image[y[start:end] % TILE_PIXELS, x[start:end] % TILE_PIXELS] = alpha[start:end]
+            tile = Image.fromarray(image, 'P')
+            tile.putpalette(palette)
+            path = Path(out_dir) / str(zoom) / str(tx[start]) / f"{y[start] // TILE_PIXELS}.png"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Palette index is the opacity, fast zlib level: encoding dominates the build
+            tile.save(path, transparency=bytes(range(256)), compress_level=1)
+        n_tiles += len(bounds) - 1
+    return n_tiles
+
+def build_heat_pyramid(tracks, out_dir, color, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM):
+    """
+    Write the z/x/y.png passage heatmap of (lat, lon) tracks in out_dir, coloured with
+    color (#rrggbb). Returns the metadata also saved as out_dir/metadata.json
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    # Tiles of a previous build, their zooms and extent may differ
+    for zoom_dir in out_dir.iterdir():
+        if zoom_dir.is_dir() and zoom_dir.name.isdigit():
+            shutil.rmtree(zoom_dir)
+    cells, counts = passage_counts(tracks, max_zoom)
+    metadata = {
+        'minzoom': min_zoom,
+        'maxzoom': max_zoom,
+        'bounds': None,
+        'cells': len(cells),
+        'max_passages': int(counts.max()) if len(counts) else 0,
+        'tiles': {},
+    }
+    if len(cells):
+        size = TILE_PIXELS * 2 ** max_zoom
+        x, y = cells % size, cells // size
+        miny, minx = pixel_latlon(x.min(), y.max() + 1, max_zoom)
+        maxy, maxx = pixel_latlon(x.max() + 1, y.min(), max_zoom)
+        metadata['bounds'] = [float(minx), float(miny), float(maxx), float(maxy)]
+
+    for z in range(max_zoom, min_zoom - 1, -1):
+        if not len(cells):
+            break
+        metadata['tiles'][z] = write_heat_tiles(cells, counts, z, out_dir, color, metadata['max_passages'])
+        if z > min_zoom:
+            cells, counts = zoom_out(cells, counts, z)
+
+    with open(out_dir / "metadata.json", 'w') as f:
+        json.dump(metadata, f, indent=2)
+    return metadata
@@ -0,0 +1,33 @@
+"""
+Heavy backends imported on first use
+
+    plt = lazy_import('matplotlib.pyplot')
+
+binds a module-level name that imports matplotlib.pyplot the first time one of its
+attributes is read, so that each entry point only pays for the backends its functions
+use: loading rivers does not import osmnx, matplotlib or folium. Names that are needed
+at import time (base classes, annotations) must come from a cheap module instead.
+"""
+
+import importlib
+import sys
+
+class LazyModule:
+    """Stand-in for a module, imported when an attribute is first read"""
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self._name), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(importlib.import_module(self._name), attr, value)
+
+    def __repr__(self):
+        loaded = 'loaded' if self._name in sys.modules else 'not loaded'
+        return f"<lazy module '{self._name}' ({loaded})>"
+
+def lazy_import(name):
+    """The module name if it is already imported, else a LazyModule"""
+    return sys.modules.get(name) or LazyModule(name)
@@ -1,33 +1,59 @@
 from constants import DATA_PATH, OUTPUT_DIR
-import folium
-import geopandas as gpd
 from shapely.geometry import MultiLineString, LineString, mapping
 from pyproj import Geod
+import numpy as np
+import shapely
+from lazy_imports import lazy_import
+from tracing import stage
 
-geod = Geod(ellps="WGS84")
+folium = lazy_import('folium')
+gpd = lazy_import('geopandas')
 
-def geodesic_length_meters(geom):
-    total_m = 0.0
+geod = Geod(ellps="WGS84")
 
-    if isinstance(geom, LineString):
-        lines = [geom]
-    elif isinstance(geom, MultiLineString):
-        lines = list(geom.geoms)
-    else:
-        raise TypeError(f"Expected LineString or MultiLineString, got {geom.geom_type}")
+# shapely type ids accepted by the length engine
+LINE_TYPE_IDS = (1, 5)  # LineString, MultiLineString
 
-    for line in lines:
-        coords = list(line.coords)
-        if len(coords) < 2:
-            continue
-        # sommation des distances entre points consécutifs
-        for (lon1, lat1), (lon2, lat2) in zip(coords[:-1], coords[1:]):
-            # geod.inv renvoie (az12, az21, distance)
-            _, _, dist = geod.inv(lon1, lat1, lon2, lat2)
-            total_m += dist
+def _segment_lengths(lines):
+    """
+    Geodesic length of every segment of an array of LineStrings, in one geod.inv call.
+    Returns (distances, line index of each segment)
+    """
+    coords, line_idx = shapely.get_coordinates(lines, return_index=True)
+    # consecutive points only form a segment inside the same line
+    same_line = line_idx[:-1] == line_idx[1:]
+    start, end = coords[:-1][same_line], coords[1:][same_line]
+    # geod.inv renvoie (az12, az21, distance)
+    _, _, dist = geod.inv(start[:, 0], start[:, 1], end[:, 0], end[:, 1])
+    return dist, line_idx[:-1][same_line]
+
+def geodesic_lengths(geoms, per_part=False):
+    """
+    Batch geodesic length in meters of a GeoSeries or array of (Multi)LineStrings.
+    Returns a numpy array aligned with geoms, or with per_part=True
+    (part lengths, feature index of each part) for the sublines of MultiLineStrings.
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    type_ids = shapely.get_type_id(geoms)
+    invalid = ~np.isin(type_ids, LINE_TYPE_IDS)
+    if invalid.any():
+        bad = geoms[invalid][0]
+        bad_type = bad.geom_type if bad is not None else None
+        raise TypeError(f"Expected LineString or MultiLineString, got {bad_type}")
+
+    parts, feature_idx = shapely.get_parts(geoms, return_index=True)
+    dist, part_idx = _segment_lengths(parts)
+    part_lengths = np.bincount(part_idx, weights=dist, minlength=len(parts))
+
+    if per_part:
+        return part_lengths, feature_idx
+    return np.bincount(feature_idx, weights=part_lengths, minlength=len(geoms))
 
-    return total_m
+def geodesic_length_meters(geom):
+    """Geodesic length in meters of a single LineString or MultiLineString"""
+    return float(geodesic_lengths([geom])[0])
 
+@stage("build map")
 def create_line_map(gdf, filename):
     """
     Create and save an interactive folium map with a basemap no label
@@ -46,7 +72,7 @@ def create_line_map(gdf, filename):
     sublines = list(geom.geoms) if isinstance(geom, MultiLineString) else [geom]
     
     # Compute proj
-    segment_lengths = [geodesic_length_meters(line) for line in sublines]
+    segment_lengths, _ = geodesic_lengths([geom], per_part=True)
     total_m = sum(segment_lengths)
     total_km = total_m/ 1000.0
     total_miles = total_km * 0.621371
@@ -110,7 +136,8 @@ def create_line_map(gdf, filename):
    
     m.get_root().html.add_child(folium.Element(legend_html))
 
-    m.save(filename)
+    with stage("save map", output=filename):
+        m.save(filename)
    
 
 
@@ -119,7 +146,8 @@ if __name__ == '__main__':
     output_dir = OUTPUT_DIR / f'day_{day}'
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    geojson_line = gpd.read_file(DATA_PATH / 'radisson_line.geojson')
+    with stage("load line"):
+        geojson_line = gpd.read_file(DATA_PATH / 'radisson_line.geojson')
     filename = output_dir / "radisson_line.html"
     
     create_line_map(geojson_line, filename)
@@ -1,11 +1,29 @@
-import folium
-import gpxpy
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import shapely
+from branca.element import MacroElement
+from jinja2 import Template
 
 from constants import DATA_PATH, OUTPUT_DIR
+from heatmap import MAX_ZOOM as HEAT_MAX_ZOOM, MIN_ZOOM as HEAT_MIN_ZOOM, build_heat_pyramid
+from lazy_imports import lazy_import
+from tracing import stage
+
+folium = lazy_import('folium')
+gpxpy = lazy_import('gpxpy')
 
 # Params
-OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 day = 2
+CACHE_DIR = DATA_PATH / "gpx_cache"
+
+# Simplification tolerance in metres, and per zoom level for the multi level of detail mode
+SIMPLIFY_TOLERANCE_M = 5.0
+LOD_LEVELS = {0: 100.0, 11: 20.0, 14: 5.0, 16: 1.0}  # {min zoom: tolerance in m}
+EARTH_RADIUS_M = 6_371_008.8
+# Above this many activities, the 'auto' mode draws a passage heatmap instead of one line each
+HEATMAP_ACTIVITIES = 300
 
 # Color per sport
 SPORT_COLORS = {
@@ -13,25 +31,10 @@ SPORT_COLORS = {
     "running": "#07B021"
 }
 
-# Totals
-totals = {"cycling": 0, "running": 0}
-
-# Create map
-m = folium.Map(
-    location=[45.5017, -73.5673],
-    zoom_start=12,
-    tiles="https://{s}.basemaps.cartocdn.com/light_all/{z}/{x}/{y}.png",
-    attr="© OpenStreetMap, © CartoDB",
-)
-
-
-fg_running = folium.FeatureGroup(name="Running", show=True)
-fg_cycling = folium.FeatureGroup(name="Cycling", show=True)
-m.add_child(fg_running)
-m.add_child(fg_cycling)
-
-# Load traces
-for gpx_file in DATA_PATH.glob("*.gpx"):
+def parse_gpx(gpx_file):
+    """
+    Parse one GPX file: sport type, (lat, lon) points of all segments and length in m
+    """
     with open(gpx_file, 'r') as f:
         gpx = gpxpy.parse(f)
 
@@ -42,50 +45,332 @@ for gpx_file in DATA_PATH.glob("*.gpx"):
         elif hasattr(track, 'extensions') and 'type' in track.extensions:
             sport_type = track.extensions['type'].lower()
 
-    if sport_type not in SPORT_COLORS:
-        continue
-
     points = []
+    length = 0.0
     for track in gpx.tracks:
         for segment in track.segments:
             for point in segment.points:
                 points.append((point.latitude, point.longitude))
             # Compute length
-            segment_length = segment.length_3d()
-            totals[sport_type] += segment_length
-
-    # Add lines
-    folium.PolyLine(
-        points,
-        color=SPORT_COLORS[sport_type],
-        weight=3,
-        opacity=0.8,
-        popup=folium.Popup(f"{sport_type.capitalize()}: {segment_length/1000:.2f} km", max_width=200)
-    ).add_to(fg_cycling if sport_type == "cycling" else fg_running)
-
-# Legend
-legend_html = f"""
-<div id='legend' style="
-    position: fixed;
-    bottom: 50px; left: 50px;
-    background-color: white;
-    border: 2px solid lightgray;
-    border-radius: 10px;
-    padding: 8px 12px;
-    box-shadow: 2px 2px 6px rgba(0,0,0,0.3);
-    font-size: 14px;
-    z-index: 9999;
-">
-    <b>Totals per Activity</b><br>
-    <i style='background:{SPORT_COLORS["cycling"]}; width:30px; height:3px; display:inline-block; margin:2px 5px;'></i> Biking: {totals["cycling"]/1000:.2f} km<br>
-    <i style='background:{SPORT_COLORS["running"]}; width:30px; height:3px; display:inline-block; margin:2px 5px;'></i> Running : {totals["running"]/1000:.2f} km<br>
-</div>
-"""
-m.get_root().html.add_child(folium.Element(legend_html))
-folium.LayerControl().add_to(m)
-
-# Save map
-m.save(OUTPUT_DIR / f"day_{day}" / "summer_strava_activity.html")
-
-print(f"Map save : {OUTPUT_DIR / "day_{day}" / "summer_strava_activity.html"}")
-print(f"Totals : Cycling = {totals['cycling']/1000:.2f} km, Running = {totals['running']/1000:.2f} km")
+            length += segment.length_3d()
+
+    return {
+        'sport': sport_type,
+        'length': length,
+        'points': np.array(points, dtype=np.float64).reshape(-1, 2)
+    }
+
+def _try_parse_gpx(gpx_file):
+    """(activity, None) or (None, error message) if gpx_file cannot be parsed"""
+    try:
+        return parse_gpx(gpx_file), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+def _file_key(gpx_file):
+    """Cache key of a GPX file: path, size and mtime"""
+    stat = gpx_file.stat()
+    return {'path': str(gpx_file.resolve()), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def read_cache(cache_dir=CACHE_DIR):
+    """
+    Load parsed activities from the cache, keyed by path.
+    Points are views on one memory-mapped coordinate array.
+    """
+    index_path = cache_dir / "index.json"
+    coords_path = cache_dir / "coords.npy"
+    if not index_path.exists() or not coords_path.exists():
+        return {}
+
+    with open(index_path) as f:
+        index = json.load(f)
+    coords = np.load(coords_path, mmap_mode='r')
+
+    activities = {}
+    for entry in index:
+        start = entry.pop('offset')
+        count = entry.pop('count')
+        activities[entry['path']] = {**entry, 'points': coords[start:start + count]}
+    return activities
+
+def write_cache(activities, cache_dir=CACHE_DIR):
+    """
+    Write activities as a json index plus a single float64 (lat, lon) array
+    """
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    index = []
+    offset = 0
+    for activity in activities:
+        entry = {k: v for k, v in activity.items() if k != 'points'}
+        entry['offset'] = offset
+        entry['count'] = len(activity['points'])
+        offset += entry['count']
+        index.append(entry)
+
+    coords = np.concatenate([a['points'] for a in activities]) if activities else np.empty((0, 2))
+
+    # Write next to the cache and swap, the old coords may still be memory-mapped
+    tmp_coords = cache_dir / "coords.tmp.npy"
+    np.save(tmp_coords, coords)
+    tmp_coords.replace(cache_dir / "coords.npy")
+    tmp_index = cache_dir / "index.tmp.json"
+    with open(tmp_index, 'w') as f:
+        json.dump(index, f)
+    tmp_index.replace(cache_dir / "index.json")
+
+@stage("load activities")
+def load_activities(gpx_files, cache_dir=CACHE_DIR, workers=None):
+    """
+    Return parsed activities for gpx_files.
+    Only new or changed files are parsed, in parallel, and the cache is updated.
+    Files that fail to parse are reported and skipped, they are kept in the cache with
+    their error and only parsed again once they change.
+    """
+    cached = read_cache(cache_dir)
+    keys = [_file_key(gpx_file) for gpx_file in gpx_files]
+
+    stale = [
+        key for key in keys
+        if key['path'] not in cached
+        or (cached[key['path']]['size'], cached[key['path']]['mtime_ns']) != (key['size'], key['mtime_ns'])
+    ]
+    print(f"GPX files: {len(keys)} ({len(keys) - len(stale)} cached, {len(stale)} to parse)")
+
+    if stale or len(keys) != len(cached):
+        new_activities = {}
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parsed = executor.map(_try_parse_gpx, [key['path'] for key in stale], chunksize=8)
+            for key, (activity, error) in zip(stale, parsed):
+                if error is not None:
+                    print(f"  failed to parse {key['path']}: {error}")
+                    activity = {'sport': None, 'length': 0.0, 'points': np.empty((0, 2)), 'error': error}
+                new_activities[key['path']] = {**key, **activity}
+
+        write_cache([new_activities.get(key['path']) or cached[key['path']] for key in keys], cache_dir)
+        cached = read_cache(cache_dir)
+
+    activities = [cached[key['path']] for key in keys]
+    failed = sum('error' in activity for activity in activities)
+    if failed:
+        print(f"GPX files skipped, failed to parse: {failed}")
+    return [activity for activity in activities if 'error' not in activity]
+
+@stage("simplify tracks")
+def simplify_tracks(tracks, tolerance_m):
+    """
+    Douglas-Peucker simplification of (lat, lon) tracks with a tolerance in metres.
+    All tracks go through one shapely call, on a local equirectangular projection per track.
+    """
+    tracks = [np.asarray(track) for track in tracks]
+    counts = np.array([len(track) for track in tracks], dtype=int)
+    lines_mask = counts >= 2
+    if not tolerance_m or not lines_mask.any():
+        return tracks
+
+    lines_idx = np.flatnonzero(lines_mask)
+    points = np.concatenate([tracks[i] for i in lines_idx])
+    track_idx = np.repeat(np.arange(len(lines_idx)), counts[lines_idx])
+
+    # Project to metres around the mean latitude of each track
+    mean_lat = np.bincount(track_idx, weights=points[:, 0]) / counts[lines_idx]
+    cos_lat = np.cos(np.radians(mean_lat))
+    scale = np.radians(1.0) * EARTH_RADIUS_M
+    xy = np.column_stack([points[:, 1] * cos_lat[track_idx], points[:, 0]]) * scale
+
+    lines = shapely.linestrings(xy, indices=track_idx)
+    simplified = shapely.simplify(lines, tolerance_m, preserve_topology=False)
+    xy, simple_idx = shapely.get_coordinates(simplified, return_index=True)
+
+    # Back to (lat, lon)
+    latlon = np.column_stack([xy[:, 1], xy[:, 0] / cos_lat[simple_idx]]) / scale
+    splits = np.cumsum(np.bincount(simple_idx, minlength=len(lines_idx)))[:-1]
+
+    simplified_tracks = list(tracks)
+    for i, track in zip(lines_idx, np.split(latlon, splits)):
+        simplified_tracks[i] = track
+    return simplified_tracks
+
+class ZoomLevels(MacroElement):
+    """Show each level of detail layer only inside its zoom range"""
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = [
+            {%- for layer, parent, min_zoom, max_zoom in this.levels %}
+            [{{ layer.get_name() }}, {{ parent.get_name() }}, {{ min_zoom }}, {{ max_zoom }}],
+            {%- endfor %}
+        ];
+        function {{ this.get_name() }}_update() {
+            var zoom = {{ this._parent.get_name() }}.getZoom();
+            {{ this.get_name() }}.forEach(function(level) {
+                if (zoom >= level[2] && zoom < level[3]) {
+                    level[1].addLayer(level[0]);
+                } else {
+                    level[1].removeLayer(level[0]);
+                }
+            });
+        }
+        {{ this._parent.get_name() }}.on('zoomend', {{ this.get_name() }}_update);
+        {{ this.get_name() }}_update();
+        {% endmacro %}
+    """)
+
+    def __init__(self, levels):
+        super().__init__()
+        self._name = "ZoomLevels"
+        self.levels = levels
+
+def activity_totals(activities):
+    """Length in m per sport"""
+    totals = {"cycling": 0, "running": 0}
+    for activity in activities:
+        totals[activity['sport']] += activity['length']
+    return totals
+
+def base_map():
+    return folium.Map(
+        location=[45.5017, -73.5673],
+        zoom_start=12,
+        tiles="https://{s}.basemaps.cartocdn.com/light_all/{z}/{x}/{y}.png",
+        attr="© OpenStreetMap, © CartoDB",
+    )
+
+def add_legend(m, totals):
+    """Totals per sport legend and layer control"""
+    legend_html = f"""
+    <div id='legend' style="
+        position: fixed;
+        bottom: 50px; left: 50px;
+        background-color: white;
+        border: 2px solid lightgray;
+        border-radius: 10px;
+        padding: 8px 12px;
+        box-shadow: 2px 2px 6px rgba(0,0,0,0.3);
+        font-size: 14px;
+        z-index: 9999;
+    ">
+        <b>Totals per Activity</b><br>
+        <i style='background:{SPORT_COLORS["cycling"]}; width:30px; height:3px; display:inline-block; margin:2px 5px;'></i> Biking: {totals["cycling"]/1000:.2f} km<br>
+        <i style='background:{SPORT_COLORS["running"]}; width:30px; height:3px; display:inline-block; margin:2px 5px;'></i> Running : {totals["running"]/1000:.2f} km<br>
+    </div>
+    """
+    m.get_root().html.add_child(folium.Element(legend_html))
+    folium.LayerControl().add_to(m)
+
+@stage("build map")
+def create_activity_map(activities, tolerance_m=SIMPLIFY_TOLERANCE_M, lod_levels=None):
+    """
+    Create Folium map with one PolyLine per activity and totals per sport.
+    Tracks are simplified with tolerance_m, or with lod_levels ({min zoom: tolerance in m})
+    one simplified copy per zoom range is drawn and switched when zooming.
+    Lengths always come from the full resolution tracks.
+    """
+    activities = [a for a in activities if a['sport'] in SPORT_COLORS and len(a['points']) > 0]
+    totals = activity_totals(activities)
+    m = base_map()
+
+    fg_running = folium.FeatureGroup(name="Running", show=True)
+    fg_cycling = folium.FeatureGroup(name="Cycling", show=True)
+    m.add_child(fg_running)
+    m.add_child(fg_cycling)
+
+    groups = {"running": fg_running, "cycling": fg_cycling}
+
+    # Add traces, one layer per level of detail
+    levels = lod_levels or {0: tolerance_m}
+    zooms = sorted(levels)
+    zoom_layers = []
+    n_points = sum(len(a['points']) for a in activities)
+    print(f"Track points : {n_points:,} at full resolution")
+    for i, min_zoom in enumerate(zooms):
+        max_zoom = zooms[i + 1] if i + 1 < len(zooms) else 99
+        tracks = simplify_tracks([a['points'] for a in activities], levels[min_zoom])
+
+        n_drawn = sum(len(track) for track in tracks)
+        reduction = 100 * (1 - n_drawn / n_points) if n_points else 0
+        print(f"  tolerance {levels[min_zoom]} m, zoom {min_zoom}-{max_zoom} : {n_drawn:,} drawn ({reduction:.1f} % less)")
+
+        targets = groups
+        if lod_levels:
+            targets = {
+                sport: folium.FeatureGroup(name=f"{sport} z{min_zoom}", control=False).add_to(group)
+                for sport, group in groups.items()
+            }
+            zoom_layers += [(targets[sport], groups[sport], min_zoom, max_zoom) for sport in groups]
+
+        for activity, track in zip(activities, tracks):
+            sport_type = activity['sport']
+
+            # Add lines, 6 decimals (~0.1 m) keep the html compact
+            folium.PolyLine(
+                np.round(track, 6).tolist(),
+                color=SPORT_COLORS[sport_type],
+                weight=3,
+                opacity=0.8,
+                popup=folium.Popup(f"{sport_type.capitalize()}: {activity['length']/1000:.2f} km", max_width=200)
+            ).add_to(targets[sport_type])
+
+    if zoom_layers:
+        ZoomLevels(zoom_layers).add_to(m)
+
+    add_legend(m, totals)
+    return m, totals
+
+@stage("build heatmap")
+def create_activity_heatmap(activities, output_dir, filename, min_zoom=HEAT_MIN_ZOOM, max_zoom=HEAT_MAX_ZOOM):
+    """
+    Create Folium map with one passage heatmap layer per sport, each cell weighted by the
+    number of activities crossing it. The heatmaps are written as raster tile pyramids next
+    to the map, in output_dir/{filename}_heat/{sport}, which only references them.
+    """
+    activities = [a for a in activities if a['sport'] in SPORT_COLORS and len(a['points']) > 0]
+    totals = activity_totals(activities)
+    m = base_map()
+
+    heat_dir = f"{filename}_heat"
+    for sport, color in SPORT_COLORS.items():
+        tracks = (a['points'] for a in activities if a['sport'] == sport)
+        metadata = build_heat_pyramid(tracks, output_dir / heat_dir / sport, color, min_zoom=min_zoom, max_zoom=max_zoom)
+        if metadata['bounds'] is None:
+            continue
+        print(f"{sport.capitalize()} : {metadata['cells']:,} cells, up to {metadata['max_passages']} passages")
+        print("  tiles per zoom : " + ", ".join(f"{z}: {n}" for z, n in metadata['tiles'].items()))
+
+        minx, miny, maxx, maxy = metadata['bounds']
+        # Relative url, the tiles are saved with the map
+        folium.TileLayer(
+            tiles=f"{heat_dir}/{sport}/{{z}}/{{x}}/{{y}}.png",
+            attr="Strava activities",
+            name=sport.capitalize(),
+            overlay=True,
+            min_zoom=min_zoom,
+            max_zoom=19,
+            max_native_zoom=max_zoom,
+            bounds=[[miny, minx], [maxy, maxx]],
+        ).add_to(m)
+
+    add_legend(m, totals)
+    return m, totals
+
+if __name__ == '__main__':
+    output_dir = OUTPUT_DIR / f"day_{day}"
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # 'lines', 'heatmap' or 'auto': heatmap above HEATMAP_ACTIVITIES activities
+    mode = 'auto'
+
+    # Load traces
+    activities = load_activities(sorted(DATA_PATH.glob("*.gpx")))
+    if mode == 'heatmap' or (mode == 'auto' and len(activities) > HEATMAP_ACTIVITIES):
+        m, totals = create_activity_heatmap(activities, output_dir, "summer_strava_activity")
+    else:
+        m, totals = create_activity_map(activities, tolerance_m=SIMPLIFY_TOLERANCE_M, lod_levels=None)
+
+    # Save map
+    filename = output_dir / "summer_strava_activity.html"
+    with stage("save map", output=filename):
+        m.save(filename)
+
+    print(f"Map save : {filename} ({filename.stat().st_size / 1e6:.1f} MB)")
+    print(f"Totals : Cycling = {totals['cycling']/1000:.2f} km, Running = {totals['running']/1000:.2f} km")
@@ -0,0 +1,127 @@
+"""
+Folium layers drawing many points from a single packed payload, rendered client-side
+"""
+
+import json
+
+import numpy as np
+from folium.elements import JSCSSMixin
+from folium.map import Layer
+from folium.plugins import MarkerCluster
+from folium.utilities import image_to_url
+from jinja2 import Template
+
+# Client-side popup templating: {0}, {1}... are replaced by the escaped fields of the point
+POPUP_TEMPLATE_JS = """
+    function {{ this.get_name() }}_popup(row) {
+        return {{ this.popup_template|tojson }}.replace(/\\{(\\d+)\\}/g, function(_, k) {
+            var value = row[2 + Number(k)];
+            return value === null ? '' : String(value).replace(/[&<>"']/g, function(c) {
+                return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c];
+            });
+        });
+    }
+"""
+
+def pack_points(points, fields=None, precision=6):
+    """
+    Compact JSON payload [[lat, lon, field0, field1...], ...]
+    points is a (n, 2) array of lat, lon
+    """
+    coords = np.round(np.asarray(points, dtype=np.float64), precision).tolist()
+    if fields is not None:
+        coords = [row + list(values) for row, values in zip(coords, fields)]
+    # '</' would close the script tag the payload is embedded in
+    return json.dumps(coords, separators=(',', ':'), ensure_ascii=False).replace('</', '<\\/')
+
+class IconPointLayer(Layer):
+    """
+    All points in one payload drawn with a single shared icon, embedded once.
+    Popups are built from popup_template only when opened.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        """ + POPUP_TEMPLATE_JS + """
+        var {{ this.get_name() }} = (function() {
+            var rows = {{ this.payload }};
+            var icon = L.icon({{ this.icon_options|tojson }});
+            var layer = L.featureGroup();
+            for (var i = 0; i < rows.length; i++) {
+                var marker = L.marker([rows[i][0], rows[i][1]], {icon: icon, row: i});
+                {%- if this.popup_template %}
+                marker.bindPopup(function(m) { return {{ this.get_name() }}_popup(rows[m.options.row]); });
+                {%- endif %}
+                layer.addLayer(marker);
+            }
+            return layer;
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, points, icon_image, fields=None, popup_template=None,
+                 icon_size=(10, 10), icon_anchor=None, name=None,
+                 overlay=True, control=True, show=True, precision=6):
+        super().__init__(name=name, overlay=overlay, control=control, show=show)
+        self._name = "IconPointLayer"
+        self.payload = pack_points(points, fields, precision)
+        self.popup_template = popup_template
+        self.icon_url = image_to_url(str(icon_image))
+        self.icon_options = {
+            'iconUrl': self.icon_url,
+            'iconSize': list(icon_size),
+            'iconAnchor': list(icon_anchor) if icon_anchor else [icon_size[0] // 2, icon_size[1] // 2],
+        }
+
+class CanvasPointLayer(JSCSSMixin, Layer):
+    """
+    High volume points from one payload: circle markers drawn on a shared canvas,
+    or with cluster=True plain markers bulk-loaded into a chunked marker cluster.
+    Popups are built from popup_template only when opened.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        """ + POPUP_TEMPLATE_JS + """
+        var {{ this.get_name() }} = (function() {
+            var rows = {{ this.payload }};
+            {%- if this.cluster %}
+            var layer = L.markerClusterGroup({chunkedLoading: true});
+            {%- else %}
+            var layer = L.featureGroup();
+            var options = {{ this.style|tojson }};
+            options.renderer = L.canvas({padding: 0.5});
+            {%- endif %}
+            var markers = new Array(rows.length);
+            for (var i = 0; i < rows.length; i++) {
+                {%- if this.cluster %}
+                markers[i] = L.marker([rows[i][0], rows[i][1]]);
+                {%- else %}
+                markers[i] = L.circleMarker([rows[i][0], rows[i][1]], options);
+                {%- endif %}
+                markers[i].row = i;
+                {%- if this.popup_template %}
+                markers[i].bindPopup(function(m) { return {{ this.get_name() }}_popup(rows[m.row]); });
+                {%- endif %}
+            }
+            {%- if this.cluster %}
+            layer.addLayers(markers);
+            {%- else %}
+            markers.forEach(function(marker) { layer.addLayer(marker); });
+            {%- endif %}
+            return layer;
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, points, fields=None, popup_template=None, cluster=False, style=None,
+                 name=None, overlay=True, control=True, show=True, precision=6):
+        super().__init__(name=name, overlay=overlay, control=control, show=show)
+        self._name = "CanvasPointLayer"
+        self.payload = pack_points(points, fields, precision)
+        self.popup_template = popup_template
+        self.cluster = cluster
+        self.style = style or {}
+        # Marker cluster assets only when clustering
+        self.default_js = MarkerCluster.default_js if cluster else []
+        self.default_css = MarkerCluster.default_css if cluster else []
@@ -0,0 +1,112 @@
+"""
+Tiled on-disk store of river lines, with a persisted tile index
+"""
+
+import json
+import math
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+from shapely.geometry import box
+
+from tracing import stage
+
+# Tile size of the lon/lat grid, in degrees
+TILE_SIZE = 1.0
+
+class RiverTileStore:
+    """
+    Rivers partitioned on a fixed lon/lat grid, one GeoParquet file per tile.
+    index.json records every fetched tile, empty ones included, with its feature count
+    and bounds. A query only reads the tiles covering its bbox and fetches the missing ones
+    with fetch(bbox) -> GeoDataFrame.
+    """
+
+    def __init__(self, root, fetch, tile_size=TILE_SIZE):
+        self.root = Path(root)
+        self.fetch = fetch
+        self.tile_size = tile_size
+        self.index_path = self.root / "index.json"
+        self.index = {'tile_size': tile_size, 'tiles': {}}
+        if self.index_path.exists():
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+            if self.index['tile_size'] != tile_size:
+                raise ValueError(f"{self.root} uses {self.index['tile_size']}° tiles, not {tile_size}°")
+
+    def tiles_for(self, bbox):
+        """Keys 'ix_iy' of the tiles covering bbox (minx, miny, maxx, maxy)"""
+        minx, miny, maxx, maxy = bbox
+        ix0, iy0 = math.floor(minx / self.tile_size), math.floor(miny / self.tile_size)
+        ix1 = max(ix0 + 1, math.ceil(maxx / self.tile_size))
+        iy1 = max(iy0 + 1, math.ceil(maxy / self.tile_size))
+        return [f"{ix}_{iy}" for ix in range(ix0, ix1) for iy in range(iy0, iy1)]
+
+    def tile_bounds(self, key):
+        ix, iy = map(int, key.split("_"))
+        return (ix * self.tile_size, iy * self.tile_size, (ix + 1) * self.tile_size, (iy + 1) * self.tile_size)
+
+    def tile_path(self, key):
+        return self.root / f"{key}.parquet"
+
+    @stage("tile query")
+    def query(self, bbox):
+        """Rivers intersecting bbox, from the cached tiles, missing tiles are fetched first"""
+        keys = self.tiles_for(bbox)
+        missing = [key for key in keys if key not in self.index['tiles']]
+        if missing:
+            self._fetch_tiles(missing)
+
+        paths = [self.tile_path(key) for key in keys if self.index['tiles'][key]['count'] > 0]
+        if not paths:
+            return gpd.GeoDataFrame(geometry=[], crs="EPSG:4326")
+
+        # Plain Arrow reads and one WKB decode, the GeoParquet CRS metadata of every
+        # tile is the same and parsing it per file costs more than the read
+        df = pa.concat_tables([pq.read_table(path) for path in paths], promote_options="default").to_pandas()
+        # Rivers crossing tile edges are stored in every tile they cover
+        df = df.drop_duplicates('river_id')
+        gdf = gpd.GeoDataFrame(df, geometry=shapely.from_wkb(df['geometry'].to_numpy()), crs="EPSG:4326")
+        gdf = gdf.iloc[gdf.sindex.query(box(*bbox), predicate='intersects')]
+        return gdf.drop(columns='river_id').reset_index(drop=True)
+
+    @stage("fetch tiles")
+    def _fetch_tiles(self, keys):
+        """Fetch the rivers of the missing tiles in one call and write one file per tile"""
+        bounds = np.array([self.tile_bounds(key) for key in keys])
+        bbox = tuple(float(v) for v in (*bounds[:, :2].min(axis=0), *bounds[:, 2:].max(axis=0)))
+        print(f"Fetching {len(keys)} river tiles in {bbox}")
+
+        gdf = self.fetch(bbox).to_crs("EPSG:4326").reset_index(drop=True)
+        # Stable id from the geometry and the attributes, to drop duplicates across tiles
+        # and fetches but keep distinct features sharing a geometry
+        key = gdf.drop(columns='geometry').astype(str)
+        key['wkb'] = shapely.to_wkb(gdf.geometry.values)
+        gdf['river_id'] = pd.util.hash_pandas_object(key, index=False).to_numpy()
+
+        # Every tile covered by the envelope of each feature
+        feature_bounds = gdf.bounds.to_numpy()
+        ix0 = np.floor(feature_bounds[:, 0] / self.tile_size).astype(int)
+        iy0 = np.floor(feature_bounds[:, 1] / self.tile_size).astype(int)
+        ix1 = np.floor(feature_bounds[:, 2] / self.tile_size).astype(int)
+        iy1 = np.floor(feature_bounds[:, 3] / self.tile_size).astype(int)
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        for key, (tminx, tminy, _, _) in zip(keys, bounds):
+            ix, iy = round(tminx / self.tile_size), round(tminy / self.tile_size)
+            in_tile = (ix0 <= ix) & (ix <= ix1) & (iy0 <= iy) & (iy <= iy1)
+            tile = gdf[in_tile]
+            if len(tile):
+                tile.to_parquet(self.tile_path(key))
+            self.index['tiles'][key] = {
+                'count': int(len(tile)),
+                'bounds': [float(v) for v in tile.total_bounds] if len(tile) else None,
+            }
+
+        with open(self.index_path, 'w') as f:
+            json.dump(self.index, f)
@@ -0,0 +1,249 @@
+"""
+Quantized TopoJSON export and loading of polygon GeoJSON
+"""
+
+import json
+
+import numpy as np
+
+def quantize(geojson, quantization):
+    """Return (transform, features with rings as integer (n, 2) arrays)"""
+    rings = [
+        np.asarray(ring, dtype=np.float64)[:, :2]
+        for feature in geojson['features']
+        for polygon in _polygons(feature['geometry'])
+        for ring in polygon
+    ]
+    coords = np.concatenate(rings) if rings else np.zeros((1, 2))
+    x0, y0 = coords.min(axis=0)
+    x1, y1 = coords.max(axis=0)
+    scale = [
+        (x1 - x0) / (quantization - 1) if x1 > x0 else 1.0,
+        (y1 - y0) / (quantization - 1) if y1 > y0 else 1.0,
+    ]
+    transform = {'scale': scale, 'translate': [float(x0), float(y0)]}
+
+    def to_int(ring):
+        q = np.round((np.asarray(ring, dtype=np.float64)[:, :2] - [x0, y0]) / scale).astype(np.int64)
+        # Drop consecutive duplicates created by the quantization
+        keep = np.ones(len(q), dtype=bool)
+        keep[1:] = (q[1:] != q[:-1]).any(axis=1)
+        return q[keep]
+
+    features = [
+        [[to_int(ring) for ring in polygon] for polygon in _polygons(feature['geometry'])]
+        for feature in geojson['features']
+    ]
+    return transform, features
+
+def _polygons(geometry):
+    """Polygons (lists of rings) of a Polygon or MultiPolygon geometry"""
+    if geometry['type'] == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry['type'] == 'MultiPolygon':
+        return geometry['coordinates']
+    raise TypeError(f"Expected Polygon or MultiPolygon, got {geometry['type']}")
+
+def _open_ring(ring):
+    """Ring as a list of point tuples without the closing point"""
+    points = list(map(tuple, ring.tolist()))
+    if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    return points
+
+def find_junctions(rings):
+    """
+    Points where rings meet: shared points whose neighbours differ between rings
+    """
+    neighbours = {}
+    junctions = set()
+    for points in rings:
+        n = len(points)
+        for i, point in enumerate(points):
+            pair = frozenset((points[i - 1], points[(i + 1) % n]))
+            seen = neighbours.setdefault(point, pair)
+            if seen != pair:
+                junctions.add(point)
+    return junctions
+
+def cut_ring(points, junctions):
+    """Split a ring into arcs at its junctions, each arc keeps both endpoints"""
+    cuts = [i for i, point in enumerate(points) if point in junctions]
+    if not cuts:
+        # Closed arc, start at the smallest point so that identical rings match
+        start = points.index(min(points))
+        rotated = points[start:] + points[:start]
+        return [rotated + [rotated[0]]]
+
+    rotated = points[cuts[0]:] + points[:cuts[0]] + [points[cuts[0]]]
+    cuts = [i - cuts[0] for i in cuts] + [len(points)]
+    return [rotated[start:end + 1] for start, end in zip(cuts[:-1], cuts[1:])]
+
+def _canonical_closed(arc):
+    """Closed arc reversed and rotated to its smallest point"""
+    points = arc[-2::-1]
+    start = points.index(min(points))
+    rotated = points[start:] + points[:start]
+    return rotated + [rotated[0]]
+
+def geojson_to_topology(geojson, object_name='zones', quantization=100_000):
+    """
+    Convert a polygon FeatureCollection to quantized TopoJSON.
+    Shared borders are stored once as arcs, arcs are delta-encoded integers.
+    """
+    transform, features = quantize(geojson, quantization)
+
+    rings = [_open_ring(ring) for polygons in features for polygon in polygons for ring in polygon]
+    junctions = find_junctions([points for points in rings if len(points) >= 3])
+
+    arcs = []
+    arc_index = {}
+
+    def add_arc(arc):
+        key = tuple(arc)
+        if key in arc_index:
+            return arc_index[key]
+        reversed_key = tuple(arc[::-1])
+        if arc[0] == arc[-1] and arc[0] not in junctions:
+            reversed_key = tuple(_canonical_closed(arc))
+        if reversed_key in arc_index:
+            return ~arc_index[reversed_key]
+        arc_index[key] = len(arcs)
+        arcs.append(arc)
+        return arc_index[key]
+
+    geometries = []
+    for feature, polygons in zip(geojson['features'], features):
+        topo_polygons = []
+        for polygon in polygons:
+            rings = [_open_ring(ring) for ring in polygon]
+            if len(rings[0]) < 3:
+                # Outer ring collapsed by the quantization
+                continue
+            topo_polygons.append([
+                [add_arc(arc) for arc in cut_ring(points, junctions)]
+                for points in rings if len(points) >= 3
+            ])
+
+        if len(topo_polygons) == 1:
+            geometry = {'type': 'Polygon', 'arcs': topo_polygons[0]}
+        else:
+            geometry = {'type': 'MultiPolygon', 'arcs': topo_polygons}
+        geometry['properties'] = feature.get('properties', {})
+        geometries.append(geometry)
+
+    # Delta encoding
+    encoded_arcs = []
+    for arc in arcs:
+        points = np.array(arc, dtype=np.int64)
+        points[1:] = np.diff(points, axis=0)
+        encoded_arcs.append(points.tolist())
+
+    return {
+        'type': 'Topology',
+        'transform': transform,
+        'objects': {object_name: {'type': 'GeometryCollection', 'geometries': geometries}},
+        'arcs': encoded_arcs,
+    }
+
+def decode_arcs(topology):
+    """Absolute coordinates of every arc of a quantized topology"""
+    transform = topology.get('transform')
+    arcs = []
+    for arc in topology['arcs']:
+        points = np.asarray(arc, dtype=np.float64).reshape(-1, 2)
+        if transform:
+            points = np.cumsum(points, axis=0) * transform['scale'] + transform['translate']
+        arcs.append(points)
+    return arcs
+
+def topology_to_geojson(topology, object_name=None):
+    """Convert one object of a TopoJSON topology back to a GeoJSON FeatureCollection"""
+    arcs = decode_arcs(topology)
+    object_name = object_name or next(iter(topology['objects']))
+
+    def ring(arc_ids):
+        parts = [arcs[i] if i >= 0 else arcs[~i][::-1] for i in arc_ids]
+        # Consecutive arcs share their endpoint
+        return np.concatenate([parts[0]] + [part[1:] for part in parts[1:]]).tolist()
+
+    features = []
+    for geometry in topology['objects'][object_name]['geometries']:
+        if geometry['type'] == 'Polygon':
+            coordinates = [ring(r) for r in geometry['arcs']]
+        else:
+            coordinates = [[ring(r) for r in polygon] for polygon in geometry['arcs']]
+        features.append({
+            'type': 'Feature',
+            'properties': geometry.get('properties', {}),
+            'geometry': {'type': geometry['type'], 'coordinates': coordinates},
+        })
+
+    return {'type': 'FeatureCollection', 'features': features}
+
+def _topology_rings(topology):
+    """Arc ids of every ring of every object of a topology"""
+    for obj in topology['objects'].values():
+        for geometry in obj['geometries']:
+            polygons = [geometry['arcs']] if geometry['type'] == 'Polygon' else geometry['arcs']
+            for polygon in polygons:
+                yield from polygon
+
+def _degenerate_ring(parts):
+    """True if the ring made of these arcs has fewer than 3 distinct points or no area"""
+    points = np.concatenate(parts)
+    if len(np.unique(points, axis=0)) < 3:
+        return True
+    x, y = points[:, 0], points[:, 1]
+    return np.isclose(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)), 0)
+
+def simplify_topology(topology, tolerance):
+    """
+    Douglas-Peucker simplification of the arcs of a quantized topology, tolerance in input units.
+    Each shared border is one arc, simplified once, and arc endpoints are kept, so neighbouring
+    polygons stay without gaps or overlaps. Arcs are simplified independently: at large
+    tolerances an arc can cross another one.
+    """
+    import shapely
+
+    arcs = decode_arcs(topology)
+    lines = np.array([shapely.linestrings(arc) for arc in arcs])
+    simplified = [shapely.get_coordinates(line) for line in shapely.simplify(lines, tolerance, preserve_topology=True)]
+
+    # Two arcs between the same junctions can both collapse to a segment, the ring keeps
+    # its arcs unsimplified rather than losing its area
+    for arc_ids in _topology_rings(topology):
+        if _degenerate_ring([simplified[i] if i >= 0 else simplified[~i][::-1] for i in arc_ids]):
+            for i in arc_ids:
+                simplified[i if i >= 0 else ~i] = arcs[i if i >= 0 else ~i]
+
+    transform = topology['transform']
+    encoded_arcs = []
+    for coords in simplified:
+        points = np.round((coords - transform['translate']) / transform['scale']).astype(np.int64)
+        points[1:] = np.diff(points, axis=0)
+        encoded_arcs.append(points.tolist())
+    return {**topology, 'arcs': encoded_arcs}
+
+def simplify_geojson(geojson, tolerance, quantization=100_000):
+    """Topology-preserving simplification of a polygon FeatureCollection"""
+    topology = geojson_to_topology(geojson, quantization=quantization)
+    return topology_to_geojson(simplify_topology(topology, tolerance))
+
+def write_topojson(geojson, path, object_name='zones', quantization=100_000, tolerance=None):
+    """Write a polygon FeatureCollection as minified quantized TopoJSON, simplified with tolerance"""
+    topology = geojson_to_topology(geojson, object_name=object_name, quantization=quantization)
+    if tolerance:
+        topology = simplify_topology(topology, tolerance)
+    with open(path, 'w') as f:
+        json.dump(topology, f, separators=(',', ':'))
+    return topology
+
+def read_topojson(path, object_name=None):
+    """Load a TopoJSON file as a GeoDataFrame (EPSG:4326)"""
+    import geopandas as gpd
+
+    with open(path) as f:
+        topology = json.load(f)
+    geojson = topology_to_geojson(topology, object_name=object_name)
+    return gpd.GeoDataFrame.from_features(geojson['features'], crs='EPSG:4326')
@@ -0,0 +1,208 @@
+"""
+Stage timing and memory traces of the map scripts
+
+Stages are marked with `stage`, as a context manager or a decorator:
+
+    with stage("save map", output=path):
+        m.save(path)
+
+Tracing is off unless enabled, a disabled stage only checks a flag. Enable it with
+MAPS_TRACE=<directory> (MAPS_TRACE_MEMORY=1 adds tracemalloc peaks, MAPS_TRACE_PROFILE=1
+a cProfile of the run) or with enable(). Each stage records wall and CPU time, peak RSS,
+the tracemalloc peak and the size of its output. write_trace() writes:
+- <name>.trace.json: Chrome trace events, for chrome://tracing, Perfetto or speedscope
+- <name>.folded: collapsed stacks of stage self-time (µs), for flamegraph.pl or speedscope
+- <name>.prof: cProfile stats if profiling, for snakeviz
+"""
+
+import atexit
+import functools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from pathlib import Path
+
+_enabled = False
+_memory = False
+_profiler = None
+_trace_path = None
+_events = []
+_local = threading.local()
+_origin = time.perf_counter()
+
+def _rss_mb():
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, in KB on Linux
+    return max_rss / 1e6 if sys.platform == 'darwin' else max_rss / 1e3
+
+def _output_bytes(path):
+    path = Path(path)
+    if path.is_dir():
+        return sum(f.stat().st_size for f in path.rglob('*') if f.is_file())
+    return path.stat().st_size if path.exists() else 0
+
+def _stack():
+    """Open stages of the current thread"""
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+def enable(trace_path, memory=False, profile=False):
+    """
+    Start recording stages, write_trace() writes them to trace_path (.trace.json, .folded
+    and .prof are added). memory: tracemalloc peaks, profile: cProfile of the whole run
+    """
+    global _enabled, _memory, _profiler, _trace_path
+    _trace_path = Path(trace_path)
+    _events.clear()
+    _enabled = True
+    _memory = memory
+    if memory:
+        import tracemalloc
+        tracemalloc.start()
+    if profile:
+        import cProfile
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+
+def disable():
+    global _enabled, _memory, _profiler
+    if _memory:
+        import tracemalloc
+        tracemalloc.stop()
+    if _profiler is not None:
+        _profiler.disable()
+    _enabled = _memory = False
+    _profiler = None
+
+class stage:
+    """
+    Timed stage, nested stages are recorded with their parents (per thread).
+    output: file or directory written by the stage, its size is recorded.
+    RSS and tracemalloc peaks are process-wide, they include concurrent threads
+    """
+
+    def __init__(self, name, output=None):
+        self.name = name
+        self.output = output
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with self:
+                return func(*args, **kwargs)
+        return wrapper
+
+    def __enter__(self):
+        if not _enabled:
+            return self
+        frame = {
+            'name': self.name,
+            'start': time.perf_counter(),
+            'cpu': time.process_time(),
+            'rss': _rss_mb(),
+            'children': 0.0,
+            'peak_seen': 0,
+            'traced_before': 0,
+        }
+        if _memory:
+            import tracemalloc
+            # The peak so far belongs to the parent, keep it before resetting
+            frame['traced_before'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.reset_peak()
+        _stack().append(frame)
+        return self
+
+    def __exit__(self, *exc):
+        stack = _stack()
+        if not _enabled or not stack or stack[-1]['name'] != self.name:
+            return False
+        frame = stack.pop()
+        wall = time.perf_counter() - frame['start']
+        event = {
+            'name': self.name,
+            'path': ';'.join([f['name'] for f in stack] + [self.name]),
+            'thread': threading.get_ident(),
+            'start_s': frame['start'] - _origin,
+            'wall_s': wall,
+            'self_s': wall - frame['children'],
+            'cpu_s': time.process_time() - frame['cpu'],
+            'peak_rss_mb': _rss_mb(),
+            'rss_growth_mb': _rss_mb() - frame['rss'],
+            'failed': exc[0] is not None,
+        }
+        if _memory:
+            import tracemalloc
+            peak = max(tracemalloc.get_traced_memory()[1], frame['peak_seen'])
+            event['traced_peak_mb'] = peak / 1e6
+        if self.output is not None:
+            event['output_bytes'] = _output_bytes(self.output)
+        if stack:
+            stack[-1]['children'] += wall
+            if _memory:
+                stack[-1]['peak_seen'] = max(stack[-1]['peak_seen'], frame['traced_before'], peak)
+        _events.append(event)
+        return False
+
+def events():
+    """Recorded stages, in the order they finished"""
+    return list(_events)
+
+def summary():
+    """Print the recorded stages, nested stages indented under their parent"""
+    print(f"{'stage':<40} {'wall (s)':>9} {'cpu (s)':>8} {'peak RSS (MB)':>14} {'output (MB)':>12}")
+    for event in sorted(_events, key=lambda e: e['start_s']):
+        label = '  ' * event['path'].count(';') + event['name']
+        output = f"{event['output_bytes'] / 1e6:>12.2f}" if 'output_bytes' in event else f"{'':>12}"
+        print(f"{label:<40} {event['wall_s']:>9.2f} {event['cpu_s']:>8.2f} {event['peak_rss_mb']:>14.0f} {output}")
+
+def write_trace(trace_path=None):
+    """Write the recorded stages as Chrome trace events and collapsed stacks, and the profile"""
+    path = Path(trace_path or _trace_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    trace_events = [
+        {
+            'name': event['name'],
+            'ph': 'X',
+            'ts': round(event['start_s'] * 1e6),
+            'dur': round(event['wall_s'] * 1e6),
+            'pid': os.getpid(),
+            'tid': event['thread'],
+            'args': {k: v for k, v in event.items() if k not in ('name', 'start_s', 'wall_s', 'thread')},
+        }
+        for event in _events
+    ]
+    with open(path.with_suffix('.trace.json'), 'w') as f:
+        json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, f)
+
+    folded = {}
+    for event in _events:
+        folded[event['path']] = folded.get(event['path'], 0) + round(event['self_s'] * 1e6)
+    with open(path.with_suffix('.folded'), 'w') as f:
+        f.writelines(f"{stack} {us}\n" for stack, us in folded.items())
+
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler.dump_stats(path.with_suffix('.prof'))
+        _profiler.enable()
+    print(f"Trace saved : {path.with_suffix('.trace.json')}")
+
+def _write_at_exit():
+    if _enabled:
+        write_trace()
+        disable()
+
+if os.environ.get('MAPS_TRACE'):
+    _name = Path(sys.argv[0]).stem if sys.argv and sys.argv[0] not in ('', '-c') else 'python'
+    enable(
+        Path(os.environ['MAPS_TRACE']) / _name,
+        memory=os.environ.get('MAPS_TRACE_MEMORY') == '1',
+        profile=os.environ.get('MAPS_TRACE_PROFILE') == '1',
+    )
+    atexit.register(_write_at_exit)
@@ -0,0 +1,208 @@
+"""
+z/x/y Mapbox Vector Tile pyramid of a line GeoDataFrame, and a static server to preview it
+"""
+
+import json
+import os
+import shutil
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import mapbox_vector_tile
+import numpy as np
+import shapely
+
+# Web Mercator half extent, in metres
+ORIGIN = 20037508.342789244
+EXTENT = 4096
+# Clip buffer around each tile, in tile units, so that strokes are not cut at tile edges
+BUFFER = 64
+# Simplification tolerance and minimum feature size, in screen pixels
+SIMPLIFY_PIXELS = 1.0
+# Tiles per worker task, and tasks queued per worker
+BATCH_TILES = 256
+PENDING_BATCHES = 2
+
+def tile_size_m(z):
+    return 2 * ORIGIN / 2 ** z
+
+def tile_bounds(z, x, y):
+    """EPSG:3857 bounds (minx, miny, maxx, maxy) of tile z/x/y"""
+    size = tile_size_m(z)
+    return (-ORIGIN + x * size, ORIGIN - (y + 1) * size, -ORIGIN + (x + 1) * size, ORIGIN - y * size)
+
+def tile_ranges(bounds, z):
+    """First and last tile x, y covered by EPSG:3857 bounds arrays (n, 4)"""
+    size = tile_size_m(z)
+    last = 2 ** z - 1
+    x0 = np.clip(np.floor((bounds[:, 0] + ORIGIN) / size), 0, last).astype(np.int64)
+    x1 = np.clip(np.floor((bounds[:, 2] + ORIGIN) / size), 0, last).astype(np.int64)
+    y0 = np.clip(np.floor((ORIGIN - bounds[:, 3]) / size), 0, last).astype(np.int64)
+    y1 = np.clip(np.floor((ORIGIN - bounds[:, 1]) / size), 0, last).astype(np.int64)
+    return x0, x1, y0, y1
+
+def assign_tiles(geoms, z):
+    """
+    (tile ids, feature indices) pairs of every tile overlapped by the envelope of each
+    feature, sorted by tile. Tile id is x * 2**z + y
+    """
+    x0, x1, y0, y1 = tile_ranges(shapely.bounds(geoms), z)
+    nx, ny = x1 - x0 + 1, y1 - y0 + 1
+    counts = nx * ny
+    features = np.repeat(np.arange(len(geoms)), counts)
+    # Position of each pair inside the tile range of its feature
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    xs = np.repeat(x0, counts) + offsets // np.repeat(ny, counts)
+    ys = np.repeat(y0, counts) + offsets % np.repeat(ny, counts)
+    tile_ids = xs * 2 ** z + ys
+    order = np.argsort(tile_ids, kind='stable')
+    return tile_ids[order], features[order]
+
+def encode_tile(geoms, properties, z, x, y, layer):
+    """MVT bytes of the features clipped to tile z/x/y, None if nothing is left"""
+    minx, miny, maxx, maxy = tile_bounds(z, x, y)
+    scale = EXTENT / (maxx - minx)
+    pad = BUFFER / scale
+    clipped = shapely.clip_by_rect(geoms, minx - pad, miny - pad, maxx + pad, maxy + pad)
+
+    # Tile coordinates, y down, rounded here once instead of per point by the encoder
+    def to_tile(coords):
+        return np.round(np.column_stack([(coords[:, 0] - minx) * scale, (maxy - coords[:, 1]) * scale]))
+
+    features = [
+        {'geometry': geom, 'properties': props}
+        for geom, props in zip(shapely.transform(clipped, to_tile), properties)
+        if not geom.is_empty
+    ]
+    if not features:
+        return None
+    return mapbox_vector_tile.encode(
+        [{'name': layer, 'features': features}],
+        default_options={'y_coord_down': True, 'extents': EXTENT},
+    )
+
+def write_tiles(task, out_dir, layer):
+    """Encode and write a batch of tiles of one zoom. Returns (tiles written, bytes)"""
+    z, tiles, wkb, properties = task
+    geoms = shapely.from_wkb(wkb)
+    written = size = 0
+    for tile_id, indices in tiles:
+        x, y = divmod(tile_id, 2 ** z)
+        data = encode_tile(geoms[indices], [properties[i] for i in indices], z, x, y, layer)
+        if data is None:
+            continue
+        path = Path(out_dir) / str(z) / str(x) / f"{y}.pbf"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        written += 1
+        size += len(data)
+    return written, size
+
+def zoom_tasks(geoms, properties, z):
+    """
+    Simplify for zoom z, drop features smaller than a pixel and split the tiles in batches,
+    each with the features it needs only
+    """
+    pixel = tile_size_m(z) / 256
+    geoms = shapely.simplify(geoms, pixel * SIMPLIFY_PIXELS, preserve_topology=False)
+    bounds = shapely.bounds(geoms)
+    visible = ~shapely.is_empty(geoms) & (
+        np.maximum(bounds[:, 2] - bounds[:, 0], bounds[:, 3] - bounds[:, 1]) >= pixel
+    )
+    keep = np.flatnonzero(visible)
+    if not len(keep):
+        return
+    tile_ids, features = assign_tiles(geoms[keep], z)
+    starts = np.flatnonzero(np.r_[True, tile_ids[1:] != tile_ids[:-1]])
+    ends = np.r_[starts[1:], len(tile_ids)]
+
+    for batch in range(0, len(starts), BATCH_TILES):
+        batch_starts, batch_ends = starts[batch:batch + BATCH_TILES], ends[batch:batch + BATCH_TILES]
+        offset = batch_starts[0]
+        batch_features = features[offset:batch_ends[-1]]
+        used = np.unique(batch_features)
+        # Feature indices local to the batch
+        local = np.searchsorted(used, batch_features)
+        tiles = [(int(tile_ids[s]), local[s - offset:e - offset]) for s, e in zip(batch_starts, batch_ends)]
+        yield z, tiles, shapely.to_wkb(geoms[keep[used]]), [properties[i] for i in keep[used]]
+
+def _add_results(total, futures):
+    """Add the (tiles, bytes) written by finished write_tiles futures to total"""
+    for future in futures:
+        written, size = future.result()
+        total[0] += written
+        total[1] += size
+
+def build_tile_pyramid(gdf, out_dir, min_zoom=0, max_zoom=12, layer='rivers', columns=('name',), workers=None):
+    """
+    Write the z/x/y.pbf vector tile pyramid of gdf in out_dir, simplified per zoom and
+    clipped per tile, with batches of tiles encoded in parallel.
+    Returns the metadata also saved as out_dir/metadata.json
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    # Tiles of a previous build, their zooms and extent may differ
+    for zoom_dir in out_dir.iterdir():
+        if zoom_dir.is_dir() and zoom_dir.name.isdigit():
+            shutil.rmtree(zoom_dir)
+    geoms = gdf.to_crs("EPSG:3857").geometry.to_numpy()
+    columns = [col for col in columns if col in gdf.columns]
+    properties = [
+        {col: str(value) for col, value in zip(columns, row) if value is not None and value == value}
+        for row in gdf[columns].itertuples(index=False)
+    ]
+
+    totals = {}
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        write = partial(write_tiles, out_dir=out_dir, layer=layer)
+        for z in range(min_zoom, max_zoom + 1):
+            totals[z] = [0, 0]
+            # Batches are built as workers free up, a feature spanning many tiles is
+            # copied in every batch, all of them at once would not fit at high zooms
+            pending = set()
+            for task in zoom_tasks(geoms, properties, z):
+                if len(pending) >= PENDING_BATCHES * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    _add_results(totals[z], done)
+                pending.add(executor.submit(write, task))
+            _add_results(totals[z], wait(pending).done)
+            print(f"Zoom {z}: {totals[z][0]} tiles, {totals[z][1] / 1e6:.2f} MB")
+
+    minx, miny, maxx, maxy = gdf.to_crs("EPSG:4326").total_bounds
+    metadata = {
+        'layer': layer,
+        'minzoom': min_zoom,
+        'maxzoom': max_zoom,
+        'bounds': [float(minx), float(miny), float(maxx), float(maxy)],
+        'tiles': totals,
+    }
+    with open(out_dir / "metadata.json", 'w') as f:
+        json.dump(metadata, f, indent=2)
+    return metadata
+
+class TileRequestHandler(SimpleHTTPRequestHandler):
+    """Static files with the vector tile content type and CORS"""
+
+    extensions_map = {**SimpleHTTPRequestHandler.extensions_map, '.pbf': 'application/x-protobuf'}
+
+    def end_headers(self):
+        self.send_header('Access-Control-Allow-Origin', '*')
+        super().end_headers()
+
+def serve(directory, port=8000):
+    """Serve directory on localhost:port, maps referencing relative tile urls need http, not file://"""
+    handler = partial(TileRequestHandler, directory=str(directory))
+    with ThreadingHTTPServer(('localhost', port), handler) as server:
+        print(f"Serving {directory} on http://localhost:{port}/ (Ctrl+C to stop)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == '__main__':
+    import sys
+
+    serve(sys.argv[1] if len(sys.argv) > 1 else '.', port=int(sys.argv[2]) if len(sys.argv) > 2 else 8000)
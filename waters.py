@@ -1,14 +1,77 @@
 from constants import DATA_PATH, OUTPUT_DIR
 
 import geopandas as gpd
-import osmnx as ox
-
-import matplotlib.pyplot as plt
-import folium
-import branca.colormap as cm
+import numpy as np
+import shapely
 
+import warnings
 from pathlib import Path
 
+from artifacts import cached_artifact
+from downloads import get_file, load_validators, save_validators
+from lazy_imports import lazy_import
+from river_tiles import RiverTileStore
+from tracing import stage
+
+# Backends of the fetchers and maps, imported when first used
+ox = lazy_import('osmnx')
+plt = lazy_import('matplotlib.pyplot')
+mcolors = lazy_import('matplotlib.colors')
+folium = lazy_import('folium')
+
+# Quebec area (approximate bounding box), (minx, miny, maxx, maxy)
+QUEBEC_BBOX = (-79.5, 44.5, -57.0, 62.5)
+# Pyrenees (France/Spain border)
+PYRENEES_BBOX = (-2.5, 42.3, 3.5, 43.5)
+REGIONS = {'quebec': QUEBEC_BBOX, 'pyrenees': PYRENEES_BBOX}
+
+NATURAL_EARTH_URL = "https://naciscdn.org/naturalearth/10m/physical/ne_10m_rivers_lake_centerlines.zip"
+CANVEC_URL = "https://ftp.maps.canada.ca/pub/nrcan_rncan/vector/canvec/shp/Hydro/canvec_250K_QC_Hydro_shp.zip"
+# Tiled river stores, one per source
+RIVER_TILES_DIR = DATA_PATH / 'river_tiles'
+# Above this many segments the matplotlib map is rasterized, segments sampled per chunk
+RASTER_SEGMENTS = 2_000_000
+RASTER_CHUNK = 1_000_000
+
+def get_zip(url, zip_path):
+    """Keep the zip at url in DATA_PATH, later runs only check that it is up to date"""
+    validators_path = zip_path.with_suffix('.json')
+    validators = get_file(url, zip_path, validators=load_validators(validators_path).get(url))
+    if validators:
+        save_validators({url: validators}, validators_path)
+    elif not zip_path.exists():
+        return None
+    return zip_path
+
+def fetch_natural_earth(bbox):
+    """Natural Earth rivers in bbox, read from the zip"""
+    zip_path = get_zip(NATURAL_EARTH_URL, DATA_PATH / 'ne_10m_rivers_lake_centerlines.zip')
+    if zip_path is None:
+        raise RuntimeError(f"Could not download {NATURAL_EARTH_URL}")
+    return read_zip_lines(zip_path, 'ne_10m_rivers_lake_centerlines.shp', bbox=bbox, columns=('name',))
+
+def fetch_canvec(bbox):
+    """CanVec watercourses in bbox, read from the zip"""
+    print("Downloading... This may take a few minutes (large file ~250MB)")
+    zip_path = get_zip(CANVEC_URL, DATA_PATH / 'canvec_hydro.zip')
+    if zip_path is None:
+        raise RuntimeError(f"Could not download {CANVEC_URL}")
+    return read_zip_lines(zip_path, find_zip_layer(zip_path), bbox=bbox)
+
+def fetch_osm(bbox):
+    """OpenStreetMap rivers and streams in bbox"""
+    gdf_rivers = ox.features_from_bbox(bbox=bbox, tags={'waterway': ['river', 'stream']})
+
+    # Keep only LineString and MultiLineString
+    gdf_rivers = gdf_rivers[gdf_rivers.geometry.type.isin(['LineString', 'MultiLineString'])]
+
+    # Keep only useful columns
+    cols_to_keep = ['name', 'waterway', 'geometry']
+    cols_to_keep = [col for col in cols_to_keep if col in gdf_rivers.columns]
+    return gdf_rivers[cols_to_keep].reset_index(drop=True)
+
+RIVER_SOURCES = {'natural_earth': fetch_natural_earth, 'canvec': fetch_canvec, 'osm': fetch_osm}
+
 def download_rivers_natural_earth():
     """Download rivers from Natural Earth (much faster)."""
     geojson_path = DATA_PATH / 'quebec_rivers.geojson'
@@ -19,28 +82,8 @@ def download_rivers_natural_earth():
     
     print("Downloading rivers from Natural Earth...")
     
-    # Download Natural Earth rivers (10m resolution)
-    url = "https://naciscdn.org/naturalearth/10m/physical/ne_10m_rivers_lake_centerlines.zip"
-    
-    import requests
-    import zipfile
-    import io
-    
-    response = requests.get(url)
-    with zipfile.ZipFile(io.BytesIO(response.content)) as z:
-        z.extractall(DATA_PATH / 'ne_rivers')
-    
-    # Load all rivers
-    gdf_all_rivers = gpd.read_file(DATA_PATH / 'ne_rivers' / 'ne_10m_rivers_lake_centerlines.shp')
-    
-    # Filter for Quebec area (approximate bounding box)
-    quebec_bbox = (-79.5, 44.5, -57.0, 62.5)  # (minx, miny, maxx, maxy)
-    gdf_rivers = gdf_all_rivers.cx[quebec_bbox[0]:quebec_bbox[2], quebec_bbox[1]:quebec_bbox[3]]
-    
-    # Keep only useful columns
-    cols_to_keep = ['name', 'geometry']
-    cols_to_keep = [col for col in cols_to_keep if col in gdf_rivers.columns]
-    gdf_rivers = gdf_rivers[cols_to_keep].reset_index(drop=True)
+    # Only the Quebec area is read from the shapefile
+    gdf_rivers = fetch_natural_earth(QUEBEC_BBOX).reset_index(drop=True)
     
     print(f"Filtered {len(gdf_rivers)} rivers in Quebec region")
     
@@ -50,9 +93,45 @@ def download_rivers_natural_earth():
     
     return geojson_path
 
-def download_rivers_canvec():
-    """Download detailed rivers from CanVec (Natural Resources Canada)."""
-    geojson_path = DATA_PATH / 'quebec_rivers.geojson'
+def find_zip_layer(zip_path, pattern='*watercourse*.shp'):
+    """Path inside the zip of the first shapefile matching pattern, read from the zip directory only"""
+    import fnmatch
+    import zipfile
+
+    with zipfile.ZipFile(zip_path) as z:
+        shapefiles = [name for name in z.namelist() if name.lower().endswith('.shp')]
+
+    matches = [name for name in shapefiles if fnmatch.fnmatch(name.lower(), pattern)]
+    if not matches:
+        print(f"Available shapefiles: {[Path(s).name for s in shapefiles]}")
+        matches = shapefiles
+    return matches[0]
+
+def read_zip_lines(zip_path, layer, bbox=None, columns=('name', 'nom')):
+    """
+    Read the line features of a shapefile inside a zip without extracting it.
+    The bbox (in the layer CRS), geometry type and column selection are done by the reader.
+    """
+    import pyogrio
+
+    path = f"/vsizip/{Path(zip_path).as_posix()}/{layer}"
+    fields = pyogrio.read_info(path)['fields']
+    columns = [col for col in columns if col in fields]
+
+    return gpd.read_file(
+        path,
+        engine='pyogrio',
+        bbox=bbox,
+        columns=columns,
+        where="OGR_GEOMETRY IN ('LINESTRING', 'MULTILINESTRING')",
+    )
+
+def download_rivers_canvec(bbox=QUEBEC_BBOX):
+    """Download detailed rivers from CanVec (Natural Resources Canada), one GeoJSON per bbox."""
+    if tuple(bbox) == QUEBEC_BBOX:
+        geojson_path = DATA_PATH / 'quebec_rivers.geojson'
+    else:
+        geojson_path = DATA_PATH / f"canvec_rivers_{'_'.join(f'{v:g}' for v in bbox)}.geojson"
     
     if geojson_path.exists():
         print(f"GeoJSON already exists at {geojson_path}")
@@ -60,49 +139,17 @@ def download_rivers_canvec():
     
     print("Downloading rivers from CanVec...")
     
-    import requests
-    import zipfile
-    import io
-    
     # CanVec Hydro data - this covers all of Canada with detailed rivers
-    # We'll download the shapefile for hydrographic features
-    url = "https://ftp.maps.canada.ca/pub/nrcan_rncan/vector/canvec/shp/Hydro/canvec_250K_QC_Hydro_shp.zip"
-    
+    # Keep the zip, the watercourse layer is read straight from it
     print("Downloading... This may take a few minutes (large file ~250MB)")
-    response = requests.get(url, stream=True)
-    
-    # Save and extract
-    zip_path = DATA_PATH / "canvec_hydro.zip"
-    with open(zip_path, 'wb') as f:
-        for chunk in response.iter_content(chunk_size=8192):
-            f.write(chunk)
-    
-    print("Extracting...")
-    with zipfile.ZipFile(zip_path, 'r') as z:
-        z.extractall(DATA_PATH / 'canvec_hydro')
-    
-    # Find the watercourse shapefile
-    import glob
-    shapefiles = glob.glob(str(DATA_PATH / 'canvec_hydro' / '**' / '*watercourse*.shp'), recursive=True)
-    
-    if not shapefiles:
-        shapefiles = glob.glob(str(DATA_PATH / 'canvec_hydro' / '**' / '*.shp'), recursive=True)
-        print(f"Available shapefiles: {[Path(s).name for s in shapefiles]}")
-    
-    print(f"Loading shapefile: {shapefiles[0]}")
-    gdf_rivers = gpd.read_file(shapefiles[0])
-    
-    # Filter only LineString and MultiLineString
-    gdf_rivers = gdf_rivers[gdf_rivers.geometry.type.isin(['LineString', 'MultiLineString'])]
-    
-    # Keep relevant columns
-    cols_to_keep = ['geometry']
-    if 'name' in gdf_rivers.columns:
-        cols_to_keep.append('name')
-    if 'nom' in gdf_rivers.columns:
-        cols_to_keep.append('nom')
+    zip_path = get_zip(CANVEC_URL, DATA_PATH / "canvec_hydro.zip")
+    if zip_path is None:
+        return None
     
-    gdf_rivers = gdf_rivers[cols_to_keep].reset_index(drop=True)
+    # Read the watercourse layer straight from the zip
+    layer = find_zip_layer(zip_path)
+    print(f"Loading shapefile: {layer}")
+    gdf_rivers = read_zip_lines(zip_path, layer, bbox=bbox).reset_index(drop=True)
     
     print(f"Loaded {len(gdf_rivers)} river features")
     
@@ -123,23 +170,9 @@ def download_pyrenees_rivers_osm():
     
     print("Downloading rivers from OpenStreetMap for Pyrenees...")
     
-    # Pyrenees bounding box (France/Spain border)
-    # [North, South, East, West]
-    bbox = (43.5, 42.3, 3.5, -2.5)  # (north, south, east, west)
-    
-    tags = {'waterway': ['river', 'stream']}
-    
     try:
         print("Downloading... This should take 2-5 minutes")
-        gdf_rivers = ox.features_from_bbox(bbox=bbox, tags=tags)
-        
-        # Keep only LineString and MultiLineString
-        gdf_rivers = gdf_rivers[gdf_rivers.geometry.type.isin(['LineString', 'MultiLineString'])]
-        
-        # Keep only useful columns
-        cols_to_keep = ['name', 'waterway', 'geometry']
-        cols_to_keep = [col for col in cols_to_keep if col in gdf_rivers.columns]
-        gdf_rivers = gdf_rivers[cols_to_keep].reset_index(drop=True)
+        gdf_rivers = fetch_osm(PYRENEES_BBOX)
         
         print(f"Downloaded {len(gdf_rivers)} river features")
         
@@ -153,27 +186,123 @@ def download_pyrenees_rivers_osm():
     
     return geojson_path
 
-def load_rivers_data(name= "quebec_rivers.geojson"):
-    """Load Quebec rivers geojson data."""
-    gdf_rivers = gpd.read_file(DATA_PATH / name)
+@stage("load rivers")
+def load_rivers_data(region="quebec", source="natural_earth", columns=None, name=None):
+    """
+    Load rivers of a region, by name in REGIONS or as a (minx, miny, maxx, maxy) bbox.
+    The answer is assembled from the tiled store of source, only missing tiles are fetched.
+    A '.geojson' name loads that file from DATA_PATH, through the artifact store.
+    columns: attribute columns to keep, all by default
+    name: deprecated, former name of region
+    """
+    if name is not None:
+        warnings.warn("load_rivers_data(name=...) is deprecated, use region=...", DeprecationWarning, stacklevel=3)
+        region = name
+    if isinstance(region, str) and region.endswith('.geojson'):
+        path = DATA_PATH / region
+        return cached_artifact(path.stem, [path], lambda: gpd.read_file(path), columns=columns)
+
+    bbox = REGIONS[region] if isinstance(region, str) else tuple(region)
+    store = RiverTileStore(RIVER_TILES_DIR / source, RIVER_SOURCES[source])
+    gdf_rivers = store.query(bbox)
+    if columns is not None:
+        gdf_rivers = gdf_rivers[[col for col in columns if col in gdf_rivers.columns] + ['geometry']]
+    print(f"Loaded {len(gdf_rivers)} river features")
     return gdf_rivers
 
-def plot_rivers_matplotlib(gdf_rivers, output_dir, name):
-    """Plot and save rivers map with matplotlib."""
-    fig, ax = plt.subplots(1, 1, figsize=(14, 10))
-    
-    gdf_rivers.plot(ax=ax, color='steelblue', linewidth=0.8, alpha=0.7)
+def pack_lines(geoms):
+    """
+    All vertices of the line geometries in one (n, 2) buffer, with a start flag on the first
+    vertex of every line part
+    """
+    coords, index = shapely.get_coordinates(shapely.get_parts(geoms), return_index=True)
+    starts = np.r_[True, index[1:] != index[:-1]] if len(index) else np.zeros(0, dtype=bool)
+    return coords, starts
+
+def rasterize_lines(coords, starts, bounds, width, height, chunk_size=RASTER_CHUNK):
+    """
+    Line density on a height x width grid over bounds (minx, miny, maxx, maxy), row 0 at miny.
+    Every segment is sampled at least once per pixel it crosses, chunk by chunk
+    """
+    minx, miny, maxx, maxy = bounds
+    pixels = (coords - [minx, miny]) * [width / (maxx - minx), height / (maxy - miny)]
+    # Segments between consecutive vertices of the same part
+    segment = ~starts[1:]
+    a, b = pixels[:-1][segment], pixels[1:][segment]
+
+    density = np.zeros(width * height, dtype=np.int64)
+    for i in range(0, len(a), chunk_size):
+        sa, sb = a[i:i + chunk_size], b[i:i + chunk_size]
+        steps = np.ceil(np.abs(sb - sa).max(axis=1)).astype(np.int64) + 1
+        which = np.repeat(np.arange(len(sa)), steps)
+        t = (np.arange(steps.sum()) - np.repeat(np.cumsum(steps) - steps, steps)) / np.repeat(np.maximum(steps - 1, 1), steps)
+        points = sa[which] + t[:, None] * (sb[which] - sa[which])
+        ix = np.clip(points[:, 0].astype(np.int64), 0, width - 1)
+        iy = np.clip(points[:, 1].astype(np.int64), 0, height - 1)
+        density += np.bincount(iy * width + ix, minlength=width * height)
+    return density.reshape(height, width)
+
+@stage("plot rivers")
+def plot_rivers_matplotlib(gdf_rivers, output_dir, name, mode='auto', dpi=300):
+    """
+    Plot and save rivers map with matplotlib.
+    mode 'collection': every line in one path of a single collection.
+    mode 'raster': line density rasterized at the output resolution and drawn as one image,
+    for very large inputs. 'auto' picks raster above RASTER_SEGMENTS segments
+    """
+    from matplotlib.collections import PathCollection
+    from matplotlib.path import Path as MplPath
+
+    coords, starts = pack_lines(gdf_rivers.geometry.values)
+    n_segments = len(coords) - int(starts.sum())
+    if mode == 'auto':
+        mode = 'raster' if n_segments > RASTER_SEGMENTS else 'collection'
+
+    fig, ax = plt.subplots(1, 1, figsize=(14, 10), dpi=dpi)
+    
+    # Same extent and aspect as GeoDataFrame.plot in lon/lat
+    minx, miny, maxx, maxy = gdf_rivers.total_bounds
+    pad_x, pad_y = (maxx - minx) * 0.05, (maxy - miny) * 0.05
+    bounds = (minx - pad_x, miny - pad_y, maxx + pad_x, maxy + pad_y)
+    ax.set_xlim(bounds[0], bounds[2])
+    ax.set_ylim(bounds[1], bounds[3])
+    ax.set_aspect(1 / np.cos(np.radians((miny + maxy) / 2)))
+    
+    if mode == 'raster':
+        # Axes size in output pixels, once the aspect is applied
+        ax.apply_aspect()
+        position = ax.get_position()
+        width = max(1, round(position.width * fig.get_figwidth() * dpi))
+        height = max(1, round(position.height * fig.get_figheight() * dpi))
+        density = rasterize_lines(coords, starts, bounds, width, height)
+        
+        image = np.zeros((height, width, 4))
+        image[..., :3] = mcolors.to_rgb('steelblue')
+        image[..., 3] = 0.7 * np.log1p(density) / np.log1p(max(density.max(), 1))
+        ax.imshow(image, extent=(bounds[0], bounds[2], bounds[1], bounds[3]), origin='lower',
+                  interpolation='nearest', aspect=ax.get_aspect())
+    else:
+        codes = np.full(len(coords), MplPath.LINETO, dtype=MplPath.code_type)
+        codes[starts] = MplPath.MOVETO
+        ax.add_collection(PathCollection(
+            [MplPath(coords, codes)], facecolors='none', edgecolors='steelblue', linewidths=0.8, alpha=0.7
+        ))
     
     ax.set_title('Rivers of Quebec', fontsize=16, fontweight='bold')
     ax.set_xlabel('Longitude')
     ax.set_ylabel('Latitude')
     ax.set_facecolor('#f0f0f0')
     
-    fig.savefig(output_dir / f'{name}.png', bbox_inches='tight', dpi=300)
+    fig.savefig(output_dir / f'{name}.png', bbox_inches='tight', dpi=dpi)
     plt.close(fig)
 
-def create_rivers_folium_map(gdf_rivers, output_dir, filename):
-    """Create and save an interactive folium map of Quebec rivers."""
+@stage("folium map")
+def create_rivers_folium_map(gdf_rivers, output_dir, filename, tiled=False, max_zoom=12):
+    """
+    Create and save an interactive folium map of Quebec rivers.
+    tiled: the rivers are written as a vector tile pyramid next to the map, which only
+    references it, instead of being inlined in the HTML. Preview with python vector_tiles.py output_dir
+    """
     
     # Calculate center of the rivers for map positioning
     bounds = gdf_rivers.total_bounds  # [minx, miny, maxx, maxy]
@@ -194,32 +323,49 @@ def create_rivers_folium_map(gdf_rivers, output_dir, filename):
             'opacity': 0.8
         }
     
-    # Add rivers to map
-    folium.GeoJson(
-        gdf_rivers,
-        style_function=style_function,
-        tooltip=folium.GeoJsonTooltip(
-            fields=['name'] if 'name' in gdf_rivers.columns else [],
-            aliases=['River Name'] if 'name' in gdf_rivers.columns else []
-        )
-    ).add_to(m)
-    
-    m.save(output_dir / f"{filename}.html")
+    if tiled:
+        from folium.plugins import VectorGridProtobuf
+        from vector_tiles import build_tile_pyramid
+
+        tiles_dir = f"{filename}_tiles"
+        with stage("vector tiles", output=output_dir / tiles_dir):
+            build_tile_pyramid(gdf_rivers, output_dir / tiles_dir, max_zoom=max_zoom, layer='rivers')
+        
+        # Relative url, the tiles are served with the map
+        VectorGridProtobuf(
+            f"{tiles_dir}/{{z}}/{{x}}/{{y}}.pbf",
+            "Rivers",
+            {
+                'maxNativeZoom': max_zoom,
+                'vectorTileLayerStyles': {'rivers': style_function(None)},
+            },
+        ).add_to(m)
+    else:
+        # Add rivers to map
+        folium.GeoJson(
+            gdf_rivers,
+            style_function=style_function,
+            tooltip=folium.GeoJsonTooltip(
+                fields=['name'] if 'name' in gdf_rivers.columns else [],
+                aliases=['River Name'] if 'name' in gdf_rivers.columns else []
+            )
+        ).add_to(m)
+    
+    with stage("save map", output=output_dir / f"{filename}.html"):
+        m.save(output_dir / f"{filename}.html")
 
 if __name__ == '__main__':
     day = 4  
     output_dir = OUTPUT_DIR / f'day_{day}'
     output_dir.mkdir(parents=True, exist_ok=True)
-    # Create geojson
-    download_pyrenees_rivers_osm()
-
-    # Load rivers data
-    gdf_rivers = load_rivers_data(name='pyrenees_rivers_osm.geojson')
+    # Load rivers data, from the cached tiles
+    gdf_rivers = load_rivers_data(region='pyrenees', source='osm')
     
     # Create matplotlib visualization
     plot_rivers_matplotlib(gdf_rivers, output_dir, 'pyrenees_rivers_plt')
     
     # Create folium interactive map
-    create_rivers_folium_map(gdf_rivers, output_dir, 'pyrenees_rivers_folium')
+    create_rivers_folium_map(gdf_rivers, output_dir, 'pyrenees_rivers_folium', tiled=True)
     
-    print(f"Maps saved in {output_dir}")
\ No newline at end of file
+    print(f"Maps saved in {output_dir}")
+    print(f"Preview: python vector_tiles.py {output_dir}, then open http://localhost:8000/pyrenees_rivers_folium.html")
\ No newline at end of file